@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+''' Program to benchmark ingesting VP output files into a local Postgres '''
+# Run make_synthetic_vp_files.py first to create the files
+# This runs collector_processing.py with HOME set to the benchmark directory and METRICS_DATABASE set to a scratch database,
+#   so neither the real ~/Incoming and ~/Output nor the real tables are touched
+
+import argparse, json, os, psycopg2, subprocess, time
+from pathlib import Path
+
+# The tables and indexes are made from the same file that Ansible/collector_building.yml uses for the collector
+schema_file = Path(__file__).resolve().parent.parent / "collector_schema.sql"
+
+def reset_database():
+	# Create the scratch database if needed, then empty it and create the tables
+	#   create database cannot run in a transaction, and a "with" block on the connection always opens one, so this connection is in autocommit and closed here
+	conn = psycopg2.connect(dbname="postgres")
+	conn.autocommit = True
+	cur = conn.cursor()
+	cur.execute("select 1 from pg_database where datname = %s", (opts.database, ))
+	if not cur.fetchall():
+		cur.execute(f"create database {opts.database}")
+	conn.close()
+	with psycopg2.connect(dbname=opts.database) as conn:
+		with conn.cursor() as cur:
+			# Drop every table, including the month partitions, so nothing is left from an earlier schema
+			cur.execute("select tablename from pg_tables where schemaname = 'public'")
+			these_tables = [ x[0] for x in cur.fetchall() ]
+			if these_tables:
+				cur.execute(f"drop table if exists {', '.join(these_tables)} cascade")
+			cur.execute(schema_file.read_text())
+
+if __name__ == "__main__":
+	this_parser = argparse.ArgumentParser()
+	this_parser.add_argument("--bench_dir", dest="bench_dir", default="/tmp/rssac047-bench",
+		help="Directory given as --out_dir to make_synthetic_vp_files.py")
+	this_parser.add_argument("--database", dest="database", default="metrics_bench",
+		help="Scratch database to ingest into; it is emptied first")
+	this_parser.add_argument("--to_files", dest="to_files", action="store_true",
+		help="Benchmark only the parsing by running collector_processing.py --to_files instead of using the database")
+	opts = this_parser.parse_args()
+
+	if opts.database == "metrics":
+		exit("Refusing to benchmark against the 'metrics' database. Exiting.")
+	bench_dir = Path(opts.bench_dir).expanduser()
+	if not (bench_dir / "Incoming").exists():
+		exit(f"Could not find {bench_dir / 'Incoming'}; run make_synthetic_vp_files.py first. Exiting.")
+	collector_program = Path(__file__).resolve().parent.parent / "collector_processing.py"
+	# Start each run with empty outputs
+	for this_old_file in (bench_dir / "Output" / "Responses").glob("*.pickle"):
+		this_old_file.unlink()
+	bench_env = dict(os.environ, HOME=str(bench_dir), METRICS_DATABASE=opts.database)
+	if opts.to_files:
+		pipeline_name = "to_files"
+		collector_command = [ str(collector_program), "--to_files", str(bench_dir / "ToFiles") ]
+		for this_old_file in (bench_dir / "ToFiles").glob("*.csv"):
+			this_old_file.unlink()
+	else:
+		pipeline_name = "ingest"
+		collector_command = [ str(collector_program) ]
+		reset_database()
+	bench_start = time.time()
+	try:
+		subprocess.run(collector_command, env=bench_env, check=True)
+	except Exception as e:
+		exit(f"Running {collector_command} failed: {e}. Exiting.")
+	bench_elapsed = time.time() - bench_start
+	metrics_file = bench_dir / "Logs" / f"{pipeline_name}-metrics.json"
+	try:
+		summary = json.load(metrics_file.open(mode="rt"))
+	except Exception as e:
+		exit(f"Could not read {metrics_file}: {e}. Exiting.")
+	print(f"{pipeline_name}: {summary['items']} files in {bench_elapsed:.1f} seconds (pipeline {summary['wall_seconds']} seconds)")
+	print(f"  {summary['items_per_second']} files/s, {summary['rows_per_second']} rows/s")
+	print(f"  per-file latency p50 {summary['item_latency_p50']:.4f} s, p99 {summary['item_latency_p99']:.4f} s")
+	for (this_stage, this_seconds) in summary["stage_seconds"].items():
+		print(f"  {this_stage:>12}: {this_seconds:10.3f} s summed over workers")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+''' Program to make synthetic vantage point output files for load testing the collector '''
+# The files have the same {v, d, e, l, r} structure that vantage_point_metrics.py writes, but the responses are made up
+# Three-letter items in square brackets (such as [xyz]) refer to parts of rssac-047.md
+
+import argparse, datetime, gzip, pickle, random
+from pathlib import Path
+from concurrent import futures
+
+# The RSIs and the addresses used in vantage_point_metrics.py [yns]
+rsi_addresses = {
+	"a": { "v4": "198.41.0.4", "v6": "2001:503:ba3e::2:30" },
+	"b": { "v4": "199.9.14.201", "v6": "2001:500:200::b" },
+	"c": { "v4": "192.33.4.12", "v6": "2001:500:2::c" },
+	"d": { "v4": "199.7.91.13", "v6": "2001:500:2d::d" },
+	"e": { "v4": "192.203.230.10", "v6": "2001:500:a8::e" },
+	"f": { "v4": "192.5.5.241", "v6": "2001:500:2f::f" },
+	"g": { "v4": "192.112.36.4", "v6": "2001:500:12::d0d" },
+	"h": { "v4": "198.97.190.53", "v6": "2001:500:1::53" },
+	"i": { "v4": "192.36.148.17", "v6": "2001:7fe::53" },
+	"j": { "v4": "192.58.128.30", "v6": "2001:503:c27::2:30" },
+	"k": { "v4": "193.0.14.129", "v6": "2001:7fd::1" },
+	"l": { "v4": "199.7.83.42", "v6": "2001:500:9f::42" },
+	"m": { "v4": "202.12.27.33", "v6": "2001:dc3::35" } }
+
+# The correctness queries that are picked from, as in vantage_point_metrics.py
+correctness_queries = [ "./SOA", "./DNSKEY", "./NS", "com./NS", "com./DS", "org./NS", "org./DS", "www.rssac047-test.zyxwvutsrq./A" ]
+
+def soa_for_time(this_time):
+	# The root zone SOA serial changes twice a day, as YYYYMMDDnn
+	return f"{this_time.strftime('%Y%m%d')}{0 if this_time.hour < 12 else 1:02d}"
+
+def make_one_response(rng, target, internet, transport, query, test_type, this_soa):
+	# Returns one response dict like the ones made by do_one_query() in vantage_point_metrics.py
+	r_dict = { "id_string": f"{target}|{internet}|{transport}|{query}|{test_type}", "error": "", "target": target, "internet": internet,
+		"ip_addr": rsi_addresses[target][internet], "transport": transport, "query": query, "test_type": test_type, "timeout": "" }
+	if rng.random() < opts.timeout_rate:
+		r_dict["timeout"] = f"{transport.upper()} timeout"
+		return r_dict
+	# Latencies are mostly short with a long tail
+	r_dict["query_elapsed"] = min(4.0, rng.lognormvariate(-3.5, 0.8) * (2 if transport == "tcp" else 1))
+	if transport == "tcp":
+		r_dict["tcp_setup"] = r_dict["query_elapsed"] / 2
+	r_dict["id"] = rng.randint(0, 65535)
+	r_dict["rcode"] = rng.choice([ "SERVFAIL", "REFUSED" ]) if rng.random() < opts.error_rate else "NOERROR"
+	r_dict["flags"] = "QR AA"
+	r_dict["edns"] = { 3: b"\x00\x03\x00\x08" + f"{target}-synth".encode() }
+	(qname, qtype) = query.split("/")
+	r_dict["question"] = [ { "name": qname, "ttl": 0, "rdtype": qtype, "rdata": [] } ]
+	soa_rdata = f"a.root-servers.net. nstld.verisign-grs.com. {this_soa} 1800 900 604800 86400"
+	if test_type == "S":
+		r_dict["answer"] = [ { "name": ".", "ttl": 86400, "rdtype": "SOA", "rdata": [ soa_rdata ] } ]
+		return r_dict
+	# Correctness responses carry the three sections plus signatures, which is what makes them larger than the S responses
+	fake_signature = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/") for _ in range(344))
+	if qname.startswith("www.rssac047-test"):
+		r_dict["rcode"] = "NXDOMAIN"
+		r_dict["answer"] = []
+		r_dict["authority"] = [ { "name": ".", "ttl": 86400, "rdtype": "SOA", "rdata": [ soa_rdata ] },
+			{ "name": ".", "ttl": 86400, "rdtype": "RRSIG", "rdata": [ f"SOA 8 0 86400 20300101000000 20200101000000 20326 . {fake_signature}" ] },
+			{ "name": ".", "ttl": 86400, "rdtype": "NSEC", "rdata": [ "aaa. NS SOA RRSIG NSEC DNSKEY" ] },
+			{ "name": "zw.", "ttl": 86400, "rdtype": "NSEC", "rdata": [ ". NS DS RRSIG NSEC" ] } ]
+	else:
+		r_dict["answer"] = [ { "name": qname, "ttl": 86400, "rdtype": qtype, "rdata": [ f"{x}.root-servers.net." for x in rsi_addresses ] },
+			{ "name": qname, "ttl": 86400, "rdtype": "RRSIG", "rdata": [ f"{qtype} 8 0 86400 20300101000000 20200101000000 20326 . {fake_signature}" ] } ]
+		r_dict["authority"] = []
+	r_dict["additional"] = [ { "name": f"{x}.root-servers.net.", "ttl": 518400, "rdtype": "A", "rdata": [ rsi_addresses[x]["v4"] ] } for x in rsi_addresses ]
+	return r_dict
+
+def make_files_for_one_vp(vp_name):
+	# Write all the files for one VP; returns the number of files written
+	rng = random.Random(f"{opts.seed}-{vp_name}")
+	out_dir = Path(opts.out_dir).expanduser() / "Incoming" / vp_name / "Output"
+	out_dir.mkdir(parents=True, exist_ok=True)
+	this_time = start_time
+	file_count = 0
+	while this_time < end_time:
+		this_soa = soa_for_time(this_time)
+		all_results = []
+		# One correctness query per RSI, on a random address type and transport [thb] [ogo] [yyg]
+		this_correctness_test = rng.choice(correctness_queries)
+		for this_target in rsi_addresses:
+			all_results.append(make_one_response(rng, this_target, rng.choice([ "v4", "v6" ]), rng.choice([ "udp", "tcp" ]), this_correctness_test, "C", this_soa))
+		# ./SOA on every address type and transport for every RSI
+		for this_target in rsi_addresses:
+			for this_transport in [ "udp", "tcp" ]:
+				for this_internet in [ "v4", "v6" ]:
+					all_results.append(make_one_response(rng, this_target, this_internet, this_transport, "./SOA", "S", this_soa))
+		output_dict = { "v": 5, "d": rng.randint(0, 60), "e": rng.randint(5, 30), "l": this_soa, "r": all_results }
+		with gzip.open(out_dir / f"{this_time.strftime('%Y%m%d%H%M')}-{vp_name}.pickle.gz", mode="wb") as gzf:
+			gzf.write(pickle.dumps(output_dict))
+		file_count += 1
+		this_time += datetime.timedelta(minutes=5)  # [wyn]
+	return file_count
+
+if __name__ == "__main__":
+	this_parser = argparse.ArgumentParser()
+	this_parser.add_argument("--out_dir", dest="out_dir", default="/tmp/rssac047-bench",
+		help="Directory in which to create Incoming/<vp>/Output")
+	this_parser.add_argument("--vps", dest="vps", type=int, default=20,
+		help="Number of vantage points")
+	this_parser.add_argument("--days", dest="days", type=float, default=1,
+		help="Number of days of files for each vantage point")
+	this_parser.add_argument("--start", dest="start", default="2024-01-01",
+		help="First day of the files, as YYYY-MM-DD")
+	this_parser.add_argument("--timeout_rate", dest="timeout_rate", type=float, default=0.01,
+		help="Fraction of queries that time out")
+	this_parser.add_argument("--error_rate", dest="error_rate", type=float, default=0.001,
+		help="Fraction of answered queries that get SERVFAIL or REFUSED")
+	this_parser.add_argument("--seed", dest="seed", default="rssac047",
+		help="Seed for the random choices, so that runs can be repeated")
+	opts = this_parser.parse_args()
+
+	try:
+		start_time = datetime.datetime.strptime(opts.start, "%Y-%m-%d")
+	except Exception as e:
+		exit(f"Could not parse --start {opts.start}: {e}. Exiting.")
+	end_time = start_time + datetime.timedelta(days=opts.days)
+	# The VP names are numbers like the real ones, but start at 900 so they are easy to spot
+	vp_names = [ str(900 + x) for x in range(opts.vps) ]
+	total_files = 0
+	with futures.ProcessPoolExecutor() as executor:
+		for (this_vp, this_count) in zip(vp_names, executor.map(make_files_for_one_vp, vp_names)):
+			total_files += this_count
+	print(f"Wrote {total_files} files for {len(vp_names)} VPs from {start_time} to {end_time} in {Path(opts.out_dir).expanduser() / 'Incoming'}")
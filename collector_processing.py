@@ -4,11 +4,12 @@
 # Run as the metrics user
 # Three-letter items in square brackets (such as [xyz]) refer to parts of rssac-047.md
 
-import argparse, datetime, gzip, json, logging, os, pickle, psycopg2, time
-import dns.dnssec, dns.ipv6, dns.rdata, dns.rrset
+import argparse, csv, ctypes, ctypes.util, datetime, gzip, itertools, json, logging, math, os, pickle, psycopg2, psycopg2.errors, psycopg2.extras, select, signal, struct, time
+import dns.dnssec, dns.rdata, dns.rrset
 from pathlib import Path
 from concurrent import futures
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+import latency_sketch, root_zone_index
 
 # Defind normal paths
 user_path = (Path('~').expanduser())
@@ -34,6 +35,9 @@ if not saved_response_dir.exists():
 # Path for tests
 test_dir = user_path / "repo" / "Tests"
 
+# The database for all the tables; METRICS_DATABASE is only set when benchmarking, so that the benchmarks do not write into the real tables
+database_name = os.environ.get("METRICS_DATABASE", "metrics")
+
 ###############################################################
 
 def run_tests_only():
@@ -55,7 +59,7 @@ def run_tests_only():
 		p_count += 1
 		this_id = this_test_file.name
 		this_resp_json = this_test_file.open(mode="rt").read()
-		this_response = process_one_correctness_tuple(("test", this_resp_json))
+		this_response = process_one_correctness_test(this_resp_json)
 		if this_response:
 			debug(f"Expected pass, but got failure, on {this_id}\n{this_response}\n")
 	# Test the negatives
@@ -66,7 +70,7 @@ def run_tests_only():
 		n_count += 1
 		this_id = this_test_file.name
 		this_resp_json = this_test_file.open(mode="rt").read()
-		this_response = process_one_correctness_tuple(("test", this_resp_json))
+		this_response = process_one_correctness_test(this_resp_json)
 		if not this_response:
 			debug(f"Expected failure, but got success, on {this_id}")
 		else:
@@ -85,139 +89,957 @@ def run_tests_only():
 	debug(f"Wrote out testing log as {tests_results_file}")
 
 ###############################################################
-def process_one_incoming_file(file_as_path):
-	# Process an incoming file, given as a path
-	#   Returns nothing
-	
-	# Open the database so that we can define the insert function
-	with psycopg2.connect(dbname="metrics", user="metrics") as conn:
-		conn.set_session(autocommit=True)
-		# First define a function to insert records into one of the two databases
-		def insert_from_template(this_cmd_string, this_values):
-			with conn.cursor() as curi:
-				try:
-					curi.execute(this_cmd_string, this_values)
-				except Exception as e:
-					alert(f"Failed to execute '{this_cmd_string}' on '{this_values}': '{e}'")
-				return
-		
-		str_of_file_path = str(file_as_path)
-		# Check for wrong type of file
-		if not file_as_path.name.endswith(".pickle.gz"):
-			alert(f"Found {str_of_file_path} that did not end in .pickle.gz")
-			return
-	
-		# Sometimes ones slip in that are empty
-		if os.path.getsize(file_as_path) == 0:
-			alert(f"File {str_of_file_path}  had zero length")
-			return
-		# Un-gzip it
+
+# Each worker process in the process pools keeps a single database connection for all the items it handles
+#   Opening a new connection for every item forks a new Postgres backend each time, which dominated the runtime
+worker_conn = None
+
+def init_worker_connection():
+	# Used as the initializer of the process pools so that each worker opens its connection once
+	#   If this fails, get_worker_connection() tries again when the first item is processed
+	global worker_conn
+	try:
+		worker_conn = psycopg2.connect(dbname=database_name, user="metrics")
+	except Exception as e:
+		alert(f"Could not open the database connection for worker process {os.getpid()}: {e}")
+		worker_conn = None
+
+def get_worker_connection(autocommit):
+	# Returns the connection for this process, reconnecting if it was never opened or has been closed
+	global worker_conn
+	if worker_conn is None or worker_conn.closed:
+		worker_conn = psycopg2.connect(dbname=database_name, user="metrics")
+	if not worker_conn.autocommit == autocommit:
+		worker_conn.autocommit = autocommit
+	return worker_conn
+
+def close_worker_connection():
+	# Throws away the connection for this process so that the next get_worker_connection() reconnects
+	global worker_conn
+	if worker_conn is not None:
 		try:
-			with gzip.open(file_as_path, mode="rb") as pf:
-				in_pickle = pf.read()
-		except Exception as e:
-			alert(f"Could not ungziz {str_of_file_path}: {e}")
-			return
-		# Unpickle it
+			worker_conn.close()
+		except Exception:
+			pass
+	worker_conn = None
+
+def insert_file_records(record_cmd_string, record_values, files_cmd_string, files_values, rollup_statements=((), ())):
+	# Write all the records for a file, and the file's entry in files_gotten, in a single transaction
+	#   Either all of them are committed or none of them are, so an interrupted run never leaves partial files behind
+	#   The unique indexes on record_info (filename_record, date_derived) and files_gotten.filename_short, together with "on conflict do nothing",
+	#   make re-ingesting a file that was already committed harmless
+	#   rollup_statements is (VP statements, shared statements) from make_rollup_statements(); they are only run
+	#   if the files_gotten entry is new, because adding the same file into the rollups twice would count it twice
+	#   The VP statements only touch rows for this file's VP, so they are in the file's transaction
+	#   The shared statements touch rows that every VP adds into, so they are in their own short transaction after the file's transaction
+	#   is committed; that way, the locks on the shared rows are not held while the records are inserted
+	#   If the connection was lost, reconnect and try once more
+	#   Returns True if the transaction was committed
+	(vp_rollup_statements, shared_rollup_statements) = rollup_statements
+	for this_try in (1, 2):
+		conn = get_worker_connection(autocommit=False)
 		try:
-			in_obj = pickle.loads(in_pickle)
+			with conn:
+				with conn.cursor() as curi:
+					curi.execute(files_cmd_string, files_values)
+					is_new_file = (curi.rowcount == 1)
+					if is_new_file:
+						if len(record_values) > 0:
+							psycopg2.extras.execute_values(curi, record_cmd_string, record_values, page_size=len(record_values))
+						for (this_cmd_string, these_values) in vp_rollup_statements:
+							if len(these_values) > 0:
+								psycopg2.extras.execute_values(curi, this_cmd_string, these_values, page_size=len(these_values))
+			if is_new_file:
+				insert_shared_rollups(shared_rollup_statements, files_values[0])
+			return True
+		except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+			close_worker_connection()
+			last_error = e
+		except psycopg2.errors.CheckViolation as e:
+			# This is the error for a record whose month has no partition, such as after the partition was detached; make sure of the partition again
+			if len(record_values) == 0:
+				alert(f"Failed to insert the files_gotten entry for '{files_values[0]}': '{e}'")
+				return False
+			forget_month_partitions(record_values[0].date_derived)
+			ensure_month_partitions(record_values[0].date_derived)
+			last_error = e
 		except Exception as e:
-			alert(f"Could not unpickle {str_of_file_path}: {e}")
-			return
-		# Sanity check the record
-		if not ("v" in in_obj) and ("d" in in_obj) and ("e" in in_obj) and ("l" in in_obj) and ("r" in in_obj):
-			alert(f"Object in {str_of_file_path} did not contain keys d, e, l, r, and v")
-			return
-	
-		short_file_name = (file_as_path.name).replace(".pickle.gz", "")
+			alert(f"Failed to insert {len(record_values)} records and the files_gotten entry for '{files_values[0]}': '{e}'")
+			return False
+	alert(f"Failed to insert {len(record_values)} records and the files_gotten entry for '{files_values[0]}' after trying again: '{last_error}'")
+	return False
+
+def insert_shared_rollups(shared_rollup_statements, short_file_name):
+	# Add a file that was just committed into latency_sketch and the first-seen tables, in one short transaction
+	#   This is not tried again, because a transaction that failed while committing might have added the file into the sketches already
+	#   If it fails, the file is still ingested, so the alert says how to make the shared rollups complete again
+	conn = get_worker_connection(autocommit=False)
+	try:
+		with conn:
+			with conn.cursor() as curs:
+				for (this_cmd_string, these_values) in shared_rollup_statements:
+					if len(these_values) > 0:
+						psycopg2.extras.execute_values(curs, this_cmd_string, these_values, page_size=len(these_values))
+	except Exception as e:
+		if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+			close_worker_connection()
+		alert(f"Failed to add '{short_file_name}' into latency_sketch and the first-seen tables: '{e}'; " \
+			+ "run 'collector_processing.py --rebuild_rollups' to make them complete")
 
-		# Get the derived date and VP name from the file name
-		(file_date_text, _) = short_file_name.split("-")
+###############################################################
+
+def date_from_short_name(short_name):
+	# Returns the datetime from the YYYYMMDDHHMM at the start of a short file name or a filename_record
+	#   Raises an exception if the name does not start with a valid date
+	return datetime.datetime(int(short_name[0:4]), int(short_name[4:6]), int(short_name[6:8]), int(short_name[8:10]), int(short_name[10:12]))
+
+# The record_info and incorrect tables are partitioned by month on date_derived, so that queries for a date range only read
+#   the partitions for those months and old months can be detached; partitioned_months is the months this process has already made sure of
+#   A partition can be detached or dropped while a long-running process still has its month in partitioned_months; insert_file_records()
+#   then gets an error for the missing partition, and calls forget_month_partitions() before it tries again
+partitioned_months = set()
+
+def ensure_month_partitions(this_date):
+	# Make sure that the partitions of record_info and incorrect for the month of this_date exist and are attached
+	#   Another worker might create the same partition at the same time, so the partition is checked after the create whether or not it failed
+	month_start = datetime.datetime(this_date.year, this_date.month, 1)
+	if month_start in partitioned_months:
+		return
+	month_end = (month_start + datetime.timedelta(days=32)).replace(day=1)
+	conn = get_worker_connection(autocommit=True)
+	for this_table in ("record_info", "incorrect"):
+		this_partition = f"{this_table}_{month_start.strftime('%Y_%m')}"
+		create_error = ""
 		try:
-			file_date = datetime.datetime(int(file_date_text[0:4]), int(file_date_text[4:6]), int(file_date_text[6:8]),\
-				int(file_date_text[8:10]), int(file_date_text[10:12]))
+			with conn.cursor() as cur:
+				cur.execute(f"create table if not exists {this_partition} partition of {this_table} for values from (%s) to (%s)", (month_start, month_end))
 		except Exception as e:
-			alert(f"Could not split the file name {short_file_name} into a datetime: {e}")
-			return
+			create_error = f": {e}"
+		# "if not exists" also skips a partition that was detached but not dropped, so check that it is attached
+		with conn.cursor() as cur:
+			cur.execute("select count(*) from pg_inherits where inhrelid = to_regclass(%s) and inhparent = %s::regclass", (this_partition, this_table))
+			if cur.fetchone()[0] == 0:
+				alert(f"Partition {this_partition} does not exist or is not attached to {this_table}{create_error}")
+				return
+	partitioned_months.add(month_start)
+
+def forget_month_partitions(this_date):
+	# Make the next ensure_month_partitions() for the month of this_date look at the database again
+	partitioned_months.discard(datetime.datetime(this_date.year, this_date.month, 1))
+
+# Named tuple for the records in the record_info table; the field order is the column order for inserts and for --to_files
+record_info_template = namedtuple("record_info_template", field_names="filename_record date_derived target internet transport ip_addr record_type " \
+	+ "query_elapsed timeout soa_found likely_soa is_correct failure_reason")
+# The columns of the files_gotten table, in the order of the table and of the values made by parse_one_incoming_file()
+files_gotten_fields = ("filename_short", "processed_at", "version", "delay", "elapsed")
+
+def parse_one_incoming_file(file_as_path):
+	# Read and validate an incoming file, given as a path, and make the records for it
+	#   This does not touch the database, so it is shared by the normal ingest and by --to_files
+	#   Returns (short_file_name, record_rows, c_responses, files_gotten_values), None if the file can never be ingested,
+	#   or False if the file could not be read but might be readable later
+	#   vantage_point_metrics.py does not write its files atomically, so rsync can bring an empty or partial file before the whole one
+	
+	str_of_file_path = str(file_as_path)
+	# Check for wrong type of file
+	if not file_as_path.name.endswith(".pickle.gz"):
+		alert(f"Found {str_of_file_path} that did not end in .pickle.gz")
+		return None
+
+	# Sometimes ones slip in that are empty
+	if os.path.getsize(file_as_path) == 0:
+		alert(f"File {str_of_file_path}  had zero length")
+		return False
+	# Un-gzip it
+	stage_start = time.perf_counter()
+	try:
+		with gzip.open(file_as_path, mode="rb") as pf:
+			in_pickle = pf.read()
+	except Exception as e:
+		alert(f"Could not ungziz {str_of_file_path}: {e}")
+		return False
+	end_stage("gunzip", stage_start)
+	# Unpickle it
+	stage_start = time.perf_counter()
+	try:
+		in_obj = pickle.loads(in_pickle)
+	except Exception as e:
+		alert(f"Could not unpickle {str_of_file_path}: {e}")
+		return False
+	end_stage("unpickle", stage_start)
+	# Sanity check the record
+	if not ("v" in in_obj) and ("d" in in_obj) and ("e" in in_obj) and ("l" in in_obj) and ("r" in in_obj):
+		alert(f"Object in {str_of_file_path} did not contain keys d, e, l, r, and v")
+		return None
 
-		# Named tuple for the record templates
-		template_names_raw = "filename_record date_derived target internet transport ip_addr record_type query_elapsed timeout soa_found " \
-			+ "likely_soa is_correct failure_reason"
-		# Change spaces to ", "
-		template_names_with_commas = template_names_raw.replace(" ", ", ")
-		# List of "%s, " for Postgres "insert" commands; remove trailing ", "
-		percent_s_string = str("%s, " * len(template_names_raw.split(" ")))[:-2]
-		# Create the template
-		insert_values_template = namedtuple("insert_values_template", field_names=template_names_with_commas)
-		
-		# Save all the C responses for this file in one dict
-		c_responses = {}
-		# Go through each response item
-		response_count = 0
-		for this_resp in in_obj["r"]:
-			response_count += 1  # response_count is 1-based, not 0-based
-			# Each record is "S" for an SOA record or "C" for a correctness test
-			#   Sanity test that the type is S or C
-			if not this_resp["test_type"] in ("S", "C"):
-				alert(f"Found a response type {this_resp['test_type']}, which is not S or C, in record {response_count} of {str_of_file_path}")
+	short_file_name = (file_as_path.name).replace(".pickle.gz", "")
+
+	# Get the derived date from the file name
+	try:
+		file_date = date_from_short_name(short_file_name)
+	except Exception as e:
+		alert(f"Could not split the file name {short_file_name} into a datetime: {e}")
+		return None
+
+	# Collect all the records for this file so they can be inserted together
+	stage_start = time.perf_counter()
+	record_rows = []
+	# Save all the C responses for this file in one dict
+	c_responses = {}
+	# Go through each response item
+	response_count = 0
+	for this_resp in in_obj["r"]:
+		response_count += 1  # response_count is 1-based, not 0-based
+		# Each record is "S" for an SOA record or "C" for a correctness test
+		#   Sanity test that the type is S or C
+		if not this_resp["test_type"] in ("S", "C"):
+			alert(f"Found a response type {this_resp['test_type']}, which is not S or C, in record {response_count} of {str_of_file_path}")
+			continue
+		short_name_and_count = f"{short_file_name}-{response_count}"
+		insert_values = record_info_template(filename_record=short_name_and_count, date_derived=file_date, \
+			target=this_resp["target"], internet=this_resp["internet"], transport=this_resp["transport"], ip_addr=this_resp["ip_addr"], record_type=this_resp["test_type"], \
+			query_elapsed=0.0, timeout=this_resp["timeout"], soa_found="", likely_soa=in_obj["l"], is_correct="", failure_reason="")
+		# If there is already something in timeout, just insert this record
+		if this_resp["timeout"]:
+			insert_values = insert_values._replace(is_correct="y")
+			record_rows.append(insert_values)
+			continue
+		# If the response code is wrong, treat it as a timeout; use the response code as the timeout message
+		#   For "S" records   [ppo]
+		#   For "C" records   [ote]
+		this_response_code = this_resp.get("rcode")
+		if not ((insert_values.record_type == "S" and this_response_code in ["NOERROR"]) or (insert_values.record_type == "C" and this_response_code in ["NOERROR", "NXDOMAIN"])):
+			insert_values = insert_values._replace(timeout=this_response_code)
+			insert_values = insert_values._replace(is_correct="y")
+			record_rows.append(insert_values)
+			continue
+		# What is left is responses that didn't time out
+		if not this_resp.get("query_elapsed"):
+			alert(f"Found a message without query_elapsed in record {response_count} of {str_of_file_path}")
+			continue
+		insert_values = insert_values._replace(query_elapsed=this_resp["query_elapsed"])  # [aym]
+		if insert_values.record_type == "S":
+			if this_resp.get("answer") == None or len(this_resp["answer"]) == 0:
+				alert(f"Found a message of type 'S' without an answer in record {response_count} of {str_of_file_path}")
 				continue
-			short_name_and_count = f"{short_file_name}-{response_count}"
-			insert_template = f"insert into record_info ({template_names_with_commas}) values ({percent_s_string})"
-			insert_values = insert_values_template(filename_record=short_name_and_count, date_derived=file_date, \
-				target=this_resp["target"], internet=this_resp["internet"], transport=this_resp["transport"], ip_addr=this_resp["ip_addr"], record_type=this_resp["test_type"], \
-				query_elapsed=0.0, timeout=this_resp["timeout"], soa_found="", likely_soa=in_obj["l"], is_correct="", failure_reason="")
-			# If there is already something in timeout, just insert this record
+			# Set is_correct to "s" because correctness is not being checked for SOA records
+			insert_values = insert_values._replace(is_correct="s")
+			# This chooses only the first SOA record; there really should only be one SOA record in the response
+			this_soa_record = this_resp["answer"][0]["rdata"][0]
+			soa_record_parts = this_soa_record.split(" ")
+			this_soa = soa_record_parts[2]
+			insert_values = insert_values._replace(soa_found=this_soa)
+		elif insert_values.record_type == "C":
+			# Save the response in the collection for this file
+			c_responses[short_name_and_count] = this_resp
+			# Make is_correct "t" for correctness tests that times out, otherwise mark it as "?" so that it gets checked
 			if this_resp["timeout"]:
-				insert_values = insert_values._replace(is_correct="y")
-				insert_from_template(insert_template, insert_values)
-				continue
-			# If the response code is wrong, treat it as a timeout; use the response code as the timeout message
-			#   For "S" records   [ppo]
-			#   For "C" records   [ote]
-			this_response_code = this_resp.get("rcode")
-			if not ((insert_values.record_type == "S" and this_response_code in ["NOERROR"]) or (insert_values.record_type == "C" and this_response_code in ["NOERROR", "NXDOMAIN"])):
-				insert_values = insert_values._replace(timeout=this_response_code)
-				insert_values = insert_values._replace(is_correct="y")
-				insert_from_template(insert_template, insert_values)
-				continue
-			# What is left is responses that didn't time out
-			if not this_resp.get("query_elapsed"):
-				alert(f"Found a message without query_elapsed in record {response_count} of {str_of_file_path}")
-				continue
-			insert_values = insert_values._replace(query_elapsed=this_resp["query_elapsed"])  # [aym]
-			if insert_values.record_type == "S":
-				if this_resp.get("answer") == None or len(this_resp["answer"]) == 0:
-					alert(f"Found a message of type 'S' without an answer in record {response_count} of {str_of_file_path}")
+				insert_values = insert_values._replace(is_correct="t")
+			else:
+				insert_values = insert_values._replace(is_correct="?")
+		# Save this record to be written out with the rest of the file
+		record_rows.append(insert_values)
+	end_stage("rows", stage_start)
+	count_stage("rows", len(record_rows))
+	files_gotten_values = (short_file_name, datetime.datetime.now(datetime.timezone.utc), in_obj["v"], in_obj["d"], in_obj["e"])
+	return (short_file_name, record_rows, c_responses, files_gotten_values)
+
+# The rollup tables are kept up to date as each file is ingested, so that reports and ad-hoc queries can read them instead of record_info
+#   rsi_interval_rollup has one row per RSI, internet/transport pair, 5-minute interval, and VP, made from the "S" records
+#     answered/measured are the numerator and denominator for RSI availability [gfa]
+#     latency_count/latency_sum are for the non-timed-out responses [fhw] [vpa]
+#     soa_found is the SOA seen in that interval, so the first time each SOA was seen is min(interval_start) for that SOA
+rsi_interval_rollup_columns = ("rsi", "internet", "transport", "interval_start", "vp", "answered", "measured", "latency_count", "latency_sum", "soa_found")
+#   latency_sketch has one row per RSI, internet/transport pair, and 5-minute interval, with a mergeable sketch (see latency_sketch.py)
+#     of the non-timed-out latencies from all VPs [fhw] [vpa]
+#     Rows with sketch_of = "rss" hold the lowest k RSI latencies of each VP for each pair in that interval, for RSS response latency [bom] [jbr]
+latency_sketch_columns = ("sketch_of", "internet", "transport", "interval_start", "latency_count", "buckets")
+#   rss_interval_availability has one row per VP, 5-minute interval, and internet/transport pair, with the number of RSI responses
+#     that were answered and measured; report_creator.py caps answered at k for RSS availability [egb] [cvf]
+#     This has 1/13th of the rows of rsi_interval_rollup, so RSS availability for any range of time is a single sum over it
+rss_interval_availability_columns = ("vp", "interval_start", "internet", "transport", "rsi_answered", "rsi_measured")
+#   soa_first_seen has the first interval in which each SOA was seen from any RSI, and soa_pair_first_seen has the first interval in which
+#     each RSI was seen with each SOA on each internet/transport pair; timed-out responses don't count [yxn] [tub] [cnj]
+#     These only ever move earlier, so files can be ingested in any order, and a report can find the SOAs first seen in its period
+#     even if some RSIs only served them after the period ended
+soa_first_seen_columns = ("soa", "first_seen")
+soa_pair_first_seen_columns = ("soa", "rsi", "internet", "transport", "first_seen")
+
+def make_rollup_statements(record_rows):
+	# Returns the rollup_statements for insert_file_records() for the records of one file, as (VP statements, shared statements)
+	#   All the records in a file are from one VP and one interval, but this does not depend on that
+	#   rsi_interval_rollup and rss_interval_availability have the VP in their keys, so only one file at a time adds into their rows
+	#   latency_sketch, soa_first_seen, and soa_pair_first_seen rows are added into by every VP at the same time, so they are shared
+	#   All the rows are written in sorted key order, so that two transactions never take the same row locks in different orders
+	rsi_interval_rows = {}
+	rss_interval_rows = {}
+	sketch_latencies = {}
+	soa_first_seen_rows = {}
+	soa_pair_first_seen_rows = {}
+	for this_rec in record_rows:
+		if not this_rec.record_type == "S":
+			continue
+		if this_rec.soa_found and not this_rec.timeout:
+			if (not this_rec.soa_found in soa_first_seen_rows) or (this_rec.date_derived < soa_first_seen_rows[this_rec.soa_found]):
+				soa_first_seen_rows[this_rec.soa_found] = this_rec.date_derived
+			this_key = (this_rec.soa_found, this_rec.target, this_rec.internet, this_rec.transport)
+			if (not this_key in soa_pair_first_seen_rows) or (this_rec.date_derived < soa_pair_first_seen_rows[this_key]):
+				soa_pair_first_seen_rows[this_key] = this_rec.date_derived
+		if not this_rec.timeout:
+			sketch_latencies.setdefault((this_rec.target, this_rec.internet, this_rec.transport, this_rec.date_derived), []).append(this_rec.query_elapsed)
+			# Very short latencies are not counted for RSS response latency, as in report_creator.py
+			if this_rec.query_elapsed > 0.001:
+				sketch_latencies.setdefault(("rss", this_rec.internet, this_rec.transport, this_rec.date_derived), []).append(this_rec.query_elapsed)
+		this_key = (this_rec.target, this_rec.internet, this_rec.transport, this_rec.date_derived, this_rec.filename_record.split("-")[1])
+		(answered, measured, latency_count, latency_sum, soa_found) = rsi_interval_rows.get(this_key, (0, 0, 0, 0.0, ""))
+		measured += 1
+		if not this_rec.timeout:
+			answered += 1
+			latency_count += 1
+			latency_sum += this_rec.query_elapsed
+		rsi_interval_rows[this_key] = (answered, measured, latency_count, latency_sum, max(soa_found, this_rec.soa_found))
+		this_key = (this_rec.filename_record.split("-")[1], this_rec.date_derived, this_rec.internet, this_rec.transport)
+		(rsi_answered, rsi_measured) = rss_interval_rows.get(this_key, (0, 0))
+		rss_interval_rows[this_key] = (rsi_answered + (0 if this_rec.timeout else 1), rsi_measured + 1)
+	rsi_interval_cmd_string = f"insert into rsi_interval_rollup ({', '.join(rsi_interval_rollup_columns)}) values %s " \
+		+ "on conflict (rsi, internet, transport, interval_start, vp) do update set answered = rsi_interval_rollup.answered + excluded.answered, " \
+		+ "measured = rsi_interval_rollup.measured + excluded.measured, latency_count = rsi_interval_rollup.latency_count + excluded.latency_count, " \
+		+ "latency_sum = rsi_interval_rollup.latency_sum + excluded.latency_sum, soa_found = greatest(rsi_interval_rollup.soa_found, excluded.soa_found)"
+	rss_interval_cmd_string = f"insert into rss_interval_availability ({', '.join(rss_interval_availability_columns)}) values %s " \
+		+ "on conflict (interval_start, vp, internet, transport) do update set rsi_answered = rss_interval_availability.rsi_answered + excluded.rsi_answered, " \
+		+ "rsi_measured = rss_interval_availability.rsi_measured + excluded.rsi_measured"
+	latency_sketch_rows = []
+	for (this_key, these_latencies) in sketch_latencies.items():
+		if this_key[0] == "rss":
+			these_latencies = sorted(these_latencies)[:latency_sketch.rss_k]
+		latency_sketch_rows.append(this_key + (len(these_latencies), psycopg2.extras.Json(latency_sketch.make_sketch(these_latencies))))
+	latency_sketch_rows.sort(key=lambda x: x[0:4])
+	latency_sketch_cmd_string = f"insert into latency_sketch ({', '.join(latency_sketch_columns)}) values %s " \
+		+ "on conflict (sketch_of, internet, transport, interval_start) do update set latency_count = latency_sketch.latency_count + excluded.latency_count, " \
+		+ "buckets = (select jsonb_object_agg(key, total) from (select key, sum(value::int) as total from " \
+		+ "(select * from jsonb_each_text(latency_sketch.buckets) union all select * from jsonb_each_text(excluded.buckets)) as all_buckets group by key) as summed_buckets)"
+	# The first-seen rows are only changed when the new time is earlier
+	soa_first_seen_cmd_string = f"insert into soa_first_seen ({', '.join(soa_first_seen_columns)}) values %s " \
+		+ "on conflict (soa) do update set first_seen = excluded.first_seen where excluded.first_seen < soa_first_seen.first_seen"
+	soa_pair_first_seen_cmd_string = f"insert into soa_pair_first_seen ({', '.join(soa_pair_first_seen_columns)}) values %s " \
+		+ "on conflict (soa, rsi, internet, transport) do update set first_seen = excluded.first_seen where excluded.first_seen < soa_pair_first_seen.first_seen"
+	vp_rollup_statements = [ (rsi_interval_cmd_string, [ this_key + this_values for (this_key, this_values) in sorted(rsi_interval_rows.items()) ]),
+		(rss_interval_cmd_string, [ this_key + this_values for (this_key, this_values) in sorted(rss_interval_rows.items()) ]) ]
+	shared_rollup_statements = [ (latency_sketch_cmd_string, latency_sketch_rows),
+		(soa_first_seen_cmd_string, sorted(soa_first_seen_rows.items())),
+		(soa_pair_first_seen_cmd_string, [ this_key + (this_first_seen, ) for (this_key, this_first_seen) in sorted(soa_pair_first_seen_rows.items()) ]) ]
+	return (vp_rollup_statements, shared_rollup_statements)
+
+rebuild_bucket_expression = f"greatest(0, ceil(ln(greatest(query_elapsed, {latency_sketch.lowest_latency}) / {latency_sketch.lowest_latency}) / ln({latency_sketch.growth})))::int"
+
+# Statements that recompute the rollup tables from record_info, for --rebuild_rollups
+#   This is needed after the rollup tables are first created, because files ingested before then are not in them
+rebuild_rollup_commands = [
+	"insert into rsi_interval_rollup (rsi, internet, transport, interval_start, vp, answered, measured, latency_count, latency_sum, soa_found) " \
+		+ "select target, internet, transport, date_derived, split_part(filename_record, '-', 2), count(*) filter (where timeout = ''), count(*), " \
+		+ "count(*) filter (where timeout = ''), coalesce(sum(query_elapsed) filter (where timeout = ''), 0), coalesce(max(soa_found), '') " \
+		+ "from record_info where record_type = 'S' group by 1, 2, 3, 4, 5 " \
+		+ "on conflict (rsi, internet, transport, interval_start, vp) do update set answered = excluded.answered, measured = excluded.measured, " \
+		+ "latency_count = excluded.latency_count, latency_sum = excluded.latency_sum, soa_found = excluded.soa_found",
+	"insert into rss_interval_availability (vp, interval_start, internet, transport, rsi_answered, rsi_measured) " \
+		+ "select vp, interval_start, internet, transport, sum(answered), sum(measured) from rsi_interval_rollup group by 1, 2, 3, 4 " \
+		+ "on conflict (interval_start, vp, internet, transport) do update set rsi_answered = excluded.rsi_answered, rsi_measured = excluded.rsi_measured",
+	# The latency sketches use the same buckets as latency_sketch.latency_bucket()
+	"insert into latency_sketch (sketch_of, internet, transport, interval_start, latency_count, buckets) " \
+		+ "select sketch_of, internet, transport, date_derived, sum(bucket_count), jsonb_object_agg(bucket, bucket_count) from " \
+		+ "(select sketch_of, internet, transport, date_derived, bucket, count(*) as bucket_count from " \
+		+ f"(select target as sketch_of, internet, transport, date_derived, {rebuild_bucket_expression} as bucket " \
+		+ "from record_info where record_type = 'S' and timeout = '' " \
+		+ "union all " \
+		+ f"select 'rss', internet, transport, date_derived, {rebuild_bucket_expression} from " \
+		+ "(select internet, transport, date_derived, query_elapsed, row_number() over " \
+		+ "(partition by split_part(filename_record, '-', 1), split_part(filename_record, '-', 2), internet, transport order by query_elapsed) as latency_rank " \
+		+ "from record_info where record_type = 'S' and timeout = '' and query_elapsed > 0.001) as ranked_latencies " \
+		+ f"where latency_rank <= {latency_sketch.rss_k}) as latencies " \
+		+ "group by 1, 2, 3, 4, 5) as bucket_counts group by 1, 2, 3, 4 " \
+		+ "on conflict (sketch_of, internet, transport, interval_start) do update set latency_count = excluded.latency_count, buckets = excluded.buckets",
+	"insert into soa_first_seen (soa, first_seen) select soa_found, min(date_derived) from record_info " \
+		+ "where record_type = 'S' and soa_found <> '' and timeout = '' group by 1 " \
+		+ "on conflict (soa) do update set first_seen = excluded.first_seen",
+	"insert into soa_pair_first_seen (soa, rsi, internet, transport, first_seen) select soa_found, target, internet, transport, min(date_derived) from record_info " \
+		+ "where record_type = 'S' and soa_found <> '' and timeout = '' group by 1, 2, 3, 4 " \
+		+ "on conflict (soa, rsi, internet, transport) do update set first_seen = excluded.first_seen",
+]
+
+# Ingest runs hold this advisory lock in shared mode for as long as they run, and rebuild_rollups() takes it exclusively,
+#   so that the rollup tables are not rebuilt while files are being added into them
+ingest_lock_key = 7319001
+
+def hold_ingest_lock(lock_conn, wait):
+	# Make sure that this process holds the ingest lock in shared mode on lock_conn, which is kept open for as long as the process runs
+	#   The lock goes away with its connection, so a connection that was lost is replaced and the lock is taken again
+	#   If wait is False, returns None instead of waiting when a rollup rebuild has the lock
+	#   Returns the connection that holds the lock
+	if lock_conn is not None:
+		try:
+			with lock_conn.cursor() as cur:
+				cur.execute("select 1")
+			return lock_conn
+		except (psycopg2.OperationalError, psycopg2.InterfaceError):
+			lock_conn.close()
+	lock_conn = psycopg2.connect(dbname=database_name, user="metrics")
+	lock_conn.autocommit = True
+	with lock_conn.cursor() as cur:
+		cur.execute("select pg_try_advisory_lock_shared(%s)", (ingest_lock_key, ))
+		if cur.fetchone()[0]:
+			return lock_conn
+		if wait:
+			log("Waiting for the rollup tables to finish being rebuilt before ingesting")
+			cur.execute("select pg_advisory_lock_shared(%s)", (ingest_lock_key, ))
+			return lock_conn
+	lock_conn.close()
+	return None
+
+def rebuild_rollups():
+	# Recompute all the rollup tables from record_info in one transaction
+	#   Ingest has to be stopped first: a file's shared rollups are added in a transaction after the file's records are committed,
+	#   so a rebuild between the two would count that file twice; the rebuild refuses to start while any ingest run holds the ingest lock
+	#   The rollup tables are also locked against writes for the rebuild, so an ingest that starts during it waits for it to finish
+	#   The time of the rebuild is saved in rollup_rebuilds, so report_creator.py knows to collate the days in its daily cache again
+	rebuild_start = time.time()
+	with psycopg2.connect(dbname=database_name, user="metrics") as conn:
+		with conn.cursor() as cur:
+			cur.execute("select pg_try_advisory_xact_lock(%s)", (ingest_lock_key, ))
+			if not cur.fetchone()[0]:
+				die("Not rebuilding the rollup tables because files are being ingested; stop the ingest daemon and the cron job first")
+			cur.execute("lock table rsi_interval_rollup, rss_interval_availability, latency_sketch, soa_first_seen, soa_pair_first_seen " \
+				+ "in share row exclusive mode")
+			for this_command in rebuild_rollup_commands:
+				cur.execute(this_command)
+			cur.execute("insert into rollup_rebuilds (rebuilt_at) values (now())")
+	log(f"Rebuilt the rollup tables from record_info in {int(time.time() - rebuild_start)} seconds")
+
+def process_one_incoming_file(file_as_path):
+	# Process an incoming file, given as a path
+	#   Returns True if the file is done with, either because it was ingested or because it was quarantined
+	#   Returns False if ingesting it failed in a way that might succeed on a later run, such as a database error or a file that is still being copied
+	parsed_file = parse_one_incoming_file(file_as_path)
+	short_file_name = (file_as_path.name).replace(".pickle.gz", "")
+	if parsed_file is None:
+		return quarantine_file(short_file_name, "could never be ingested")
+	if parsed_file is False:
+		try:
+			file_age = datetime.datetime.utcnow() - date_from_short_name(short_file_name)
+		except Exception:
+			file_age = quarantine_age
+		if file_age >= quarantine_age:
+			return quarantine_file(short_file_name, f"could not be read for {int(quarantine_age.total_seconds() / 3600)} hours")
+		return False
+	(short_file_name, record_rows, c_responses, files_gotten_values) = parsed_file
+	# Write out the all the responses to the C records to disk as a single pickle file for the whole input file
+	#   This is done as a single file to preserve inodes on the collector
+	#   It is written before the database transaction so that every committed C record has its response on disk
+	stage_start = time.perf_counter()
+	with (saved_response_dir / (short_file_name + ".pickle")).open(mode="wb") as f_out:
+		pickle.dump(c_responses, f_out)
+	end_stage("responses", stage_start)
+	# Write out all the records for this file together with its entry in the files_gotten table
+	insert_template = f"insert into record_info ({', '.join(record_info_template._fields)}) values %s on conflict (filename_record, date_derived) do nothing"
+	insert_files_string = f"insert into files_gotten ({', '.join(files_gotten_fields)}) values (%s, %s, %s, %s, %s) " \
+		+ "on conflict (filename_short) do nothing"
+	stage_start = time.perf_counter()
+	ensure_month_partitions(record_rows[0].date_derived if record_rows else date_from_short_name(short_file_name))
+	was_inserted = insert_file_records(insert_template, record_rows, insert_files_string, files_gotten_values, make_rollup_statements(record_rows))
+	end_stage("database", stage_start)
+	return was_inserted
+
+###############################################################
+
+# For --to_files, the incoming files are parsed the same way as for the database, but the records are written to CSV files instead
+#   Each worker appends to its own CSV files, named with its process ID, so no locking is needed
+#   The CSV files have the same columns as the tables in the same order, so they can be loaded later with "copy record_info from '...' with csv header"
+#   Each run starts by removing the CSV files from earlier runs in the output directory, so loading them never loads the same rows twice
+to_files_dir = None
+to_files_writers = {}
+
+def init_to_files_worker(this_dir):
+	# Used as the initializer of the process pool for --to_files
+	global to_files_dir
+	to_files_dir = Path(this_dir)
+
+def get_to_files_writer(table_name, field_names):
+	# Returns (open file, csv.writer) for this worker's file for the given table, creating the file with a header line if needed
+	if not table_name in to_files_writers:
+		this_path = to_files_dir / f"{table_name}-{os.getpid()}.csv"
+		is_new_file = not this_path.exists()
+		this_f = this_path.open(mode="at", newline="")
+		this_writer = csv.writer(this_f)
+		if is_new_file:
+			this_writer.writerow(field_names)
+		to_files_writers[table_name] = (this_f, this_writer)
+	return to_files_writers[table_name]
+
+def process_one_incoming_file_to_files(file_as_path):
+	# Process an incoming file, given as a path, writing the records to this worker's CSV files instead of the database
+	#   The responses to the C records are saved in the Responses subdirectory of the output directory
+	#   Returns True, because there is nothing to retry
+	parsed_file = parse_one_incoming_file(file_as_path)
+	if not parsed_file:
+		return True
+	(short_file_name, record_rows, c_responses, files_gotten_values) = parsed_file
+	stage_start = time.perf_counter()
+	with (to_files_dir / "Responses" / (short_file_name + ".pickle")).open(mode="wb") as f_out:
+		pickle.dump(c_responses, f_out)
+	end_stage("responses", stage_start)
+	stage_start = time.perf_counter()
+	(record_f, record_writer) = get_to_files_writer("record_info", record_info_template._fields)
+	record_writer.writerows(record_rows)
+	record_f.flush()
+	(files_f, files_writer) = get_to_files_writer("files_gotten", files_gotten_fields)
+	files_writer.writerow(files_gotten_values)
+	files_f.flush()
+	end_stage("write", stage_start)
+	return True
+
+def run_to_files():
+	# Parse every incoming file under opts.from_dir in parallel, writing the records to CSV files in opts.to_files
+	#   This does not use the database at all, so it can be used to reprocess archived files on another machine or to
+	#   measure the parsing separately from the database
+	to_files_start = time.time()
+	out_dir = Path(opts.to_files).expanduser()
+	(out_dir / "Responses").mkdir(parents=True, exist_ok=True)
+	old_csv_files = list(out_dir.glob("record_info-*.csv")) + list(out_dir.glob("files_gotten-*.csv"))
+	for this_old_file in old_csv_files:
+		this_old_file.unlink()
+	if old_csv_files:
+		log(f"Removed {len(old_csv_files)} CSV files from an earlier run in {out_dir}")
+	from_dir = Path(opts.from_dir).expanduser() if opts.from_dir else incoming_dir
+	all_file_paths = sorted(from_dir.glob("**/*.pickle.gz"))
+	if opts.debug:
+		all_file_paths = all_file_paths[0:limit_size]
+		log(f"Only processing {limit_size} incoming files due to presence of --debug")
+	log(f"Writing the records for {len(all_file_paths)} files in {from_dir} to {out_dir}")
+	to_files_stats = new_pipeline_stats()
+	with futures.ProcessPoolExecutor(initializer=init_to_files_worker, initargs=(out_dir, )) as executor:
+		for (_, _, this_item_stats) in run_in_pool(executor, process_one_incoming_file_to_files, all_file_paths, max_pool_in_flight()):
+			add_item_stats(to_files_stats, this_item_stats)
+	to_files_summary = write_pipeline_metrics("to_files", to_files_stats, time.time() - to_files_start)
+	log(f"Finished writing the records for {to_files_summary['items']} files to {out_dir} in {int(time.time() - to_files_start)} seconds; " \
+		+ f"{to_files_summary['items_per_second']} files/s, {to_files_summary['rows_per_second']} rows/s")
+
+###############################################################
+
+# Files below a VP's high-water mark are still looked for this far back, because VP runs can overlap and rsync can bring a file late
+ingest_lookback = datetime.timedelta(days=1)
+# A file that still cannot be read this long after the time in its name is quarantined, so that it no longer holds back its VP's mark
+quarantine_age = datetime.timedelta(hours=12)
+
+def find_new_incoming_files(high_water_marks, known_files):
+	# Find the incoming files that are newer than the high-water mark for their VP, or that are in the look-back window below the mark
+	#   and are not in known_files
+	#   high_water_marks is a dict whose keys are VP names and whose values are the short name of the newest file that has been ingested
+	#   known_files is the set from get_recent_known_files()
+	#   The short names start with a YYYYMMDDHHMM timestamp, so they sort in time order for a single VP
+	#   VP runs can overlap, so a file can arrive after a newer file from the same VP was ingested; the look-back window catches those
+	#   Returns a dict whose keys are the short name (no path, no .pickle.gz), the values are the full path
+	window_starts = { this_vp: lookback_start(this_mark) for (this_vp, this_mark) in high_water_marks.items() }
+	late_count = 0
+	new_files = {}
+	for this_vp_dir in incoming_dir.iterdir():
+		this_output_dir = this_vp_dir / "Output"
+		if not this_output_dir.is_dir():
+			continue
+		with os.scandir(this_output_dir) as these_entries:
+			for this_entry in these_entries:
+				if not this_entry.name.endswith(".pickle.gz"):
 					continue
-				# Set is_correct to "s" because correctness is not being checked for SOA records
-				insert_values = insert_values._replace(is_correct="s")
-				# This chooses only the first SOA record; there really should only be one SOA record in the response
-				this_soa_record = this_resp["answer"][0]["rdata"][0]
-				soa_record_parts = this_soa_record.split(" ")
-				this_soa = soa_record_parts[2]
-				insert_values = insert_values._replace(soa_found=this_soa)
-			elif insert_values.record_type == "C":
-				# Save the response in the collection for this file
-				c_responses[short_name_and_count] = this_resp
-				# Make is_correct "t" for correctness tests that times out, otherwise mark it as "?" so that it gets checked
-				if this_resp["timeout"]:
-					insert_values = insert_values._replace(is_correct="t")
-				else:
-					insert_values = insert_values._replace(is_correct="?")
-			# Write out this record
-			insert_from_template(insert_template, insert_values)
-		# Insert the record in the files_gotten table
-		#   Note that if this function gets interrupted, some records will be written out but their associated file won't be in the files_gotten table.
-		#   When the program is run again, the records will be duplicated (other than timestamp being different
-		#   Maybe there should be an occaisional cleanup of duplicate records in the record_info table
-		insert_files_string = "insert into files_gotten (processed_at, version, delay, elapsed, filename_short) values (%s, %s, %s, %s, %s)"
-		insert_files_values = (datetime.datetime.now(datetime.timezone.utc), in_obj["v"], in_obj["d"], in_obj["e"], short_file_name) 
-		insert_from_template(insert_files_string, insert_files_values)
-		# Write out the all the responses to the C records to disk as a single pickle file for the whole input file
-		#   This is done as a single file to preserve inodes on the collector
-		with (saved_response_dir / (short_file_name + ".pickle")).open(mode="wb") as f_out:
-			pickle.dump(c_responses, f_out)
-	return
+				short_file_name = (this_entry.name).replace(".pickle.gz", "")
+				try:
+					(_, this_vp) = short_file_name.split("-")
+				except:
+					alert(f"Found {this_entry.path} whose name did not split into a date and a VP")
+					continue
+				if short_file_name > high_water_marks.get(this_vp, ""):
+					new_files[short_file_name] = Path(this_entry.path)
+				elif (short_file_name >= window_starts[this_vp]) and (not short_file_name in known_files):
+					new_files[short_file_name] = Path(this_entry.path)
+					late_count += 1
+	if late_count > 0:
+		log(f"Found {late_count} files below the high-water marks that have not been ingested or quarantined")
+	return new_files
+
+def lookback_start(this_mark):
+	# Returns the short-name prefix for the start of the look-back window below a high-water mark
+	return (date_from_short_name(this_mark) - ingest_lookback).strftime("%Y%m%d%H%M")
+
+def get_recent_known_files(high_water_marks):
+	# Returns the set of short names in files_gotten and ingest_quarantine that are in the look-back window of any VP
+	if len(high_water_marks) == 0:
+		return set()
+	earliest_start = min(lookback_start(this_mark) for this_mark in high_water_marks.values())
+	with psycopg2.connect(dbname=database_name, user="metrics") as conn:
+		with conn.cursor() as cur:
+			cur.execute("select filename_short from files_gotten where filename_short >= %s " \
+				+ "union all select filename_short from ingest_quarantine where filename_short >= %s", (earliest_start, earliest_start))
+			return set(x[0] for x in cur.fetchall())
+
+def quarantine_file(short_file_name, this_reason):
+	# Record a file that will not be ingested, so that the high-water mark can move past it and the look-back window does not try it again
+	#   Returns True if it was recorded, so that the caller can return it as whether the file is done with
+	conn = get_worker_connection(autocommit=True)
+	try:
+		with conn.cursor() as cur:
+			cur.execute("insert into ingest_quarantine (filename_short, quarantined_at, reason) values (%s, %s, %s) on conflict do nothing",
+				(short_file_name, datetime.datetime.utcnow(), this_reason))
+	except Exception as e:
+		if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+			close_worker_connection()
+		alert(f"Could not quarantine {short_file_name}: '{e}'")
+		return False
+	alert(f"Quarantined {short_file_name} because it {this_reason}; run with --full_scan to try it again")
+	return True
+
+def advance_high_water_marks(processed_results, high_water_marks):
+	# Given a list of (short_file_name, was_finished) pairs from this run and the current marks, find the new high-water mark for each VP
+	#   The mark only moves past a file if that file and every earlier new file for that VP was finished, so a file that
+	#   failed on this run will be found again on the next run
+	#   Files at or below the current mark were found through the look-back window; they neither move nor block the mark,
+	#   because the look-back window finds them again if they failed
+	#   Returns a dict whose keys are VP names and whose values are the new marks
+	new_marks = {}
+	blocked_vps = set()
+	for (short_file_name, was_finished) in sorted(processed_results):
+		(_, this_vp) = short_file_name.split("-")
+		if (this_vp in blocked_vps) or (short_file_name <= high_water_marks.get(this_vp, "")):
+			continue
+		if was_finished:
+			new_marks[this_vp] = short_file_name
+		else:
+			blocked_vps.add(this_vp)
+	return new_marks
+
+def get_high_water_marks():
+	# Returns a dict whose keys are VP names and whose values are the short name of the newest file that has been ingested
+	with psycopg2.connect(dbname=database_name, user="metrics") as conn:
+		with conn.cursor() as cur:
+			cur.execute("select vp, last_filename from ingest_high_water")
+			return dict(cur.fetchall())
+
+def save_high_water_marks(new_marks):
+	# Store the marks from advance_high_water_marks(); greatest() keeps a mark from moving backwards after a --full_scan
+	if len(new_marks) == 0:
+		return
+	with psycopg2.connect(dbname=database_name, user="metrics") as conn:
+		with conn.cursor() as cur:
+			for (this_vp, this_mark) in new_marks.items():
+				cur.execute("insert into ingest_high_water (vp, last_filename) values (%s, %s) on conflict (vp) do update " \
+					+ "set last_filename = greatest(ingest_high_water.last_filename, excluded.last_filename)", (this_vp, this_mark))
+
+###############################################################
+
+def order_newest_first(short_file_names):
+	# Order short file names so that the newest data from every VP is ingested first
+	#   Each VP's files are sorted newest first, then the VPs are interleaved so that one VP with a large backlog does not hold up the others
+	#   Returns a list of short file names
+	files_by_vp = {}
+	for short_file_name in short_file_names:
+		this_vp = short_file_name.split("-")[-1]
+		files_by_vp.setdefault(this_vp, []).append(short_file_name)
+	for this_vp in files_by_vp:
+		files_by_vp[this_vp].sort(reverse=True)
+	ordered_names = []
+	for this_round in itertools.zip_longest(*files_by_vp.values()):
+		ordered_names.extend([ x for x in this_round if x is not None ])
+	return ordered_names
+
+def max_pool_in_flight():
+	# How many items to keep submitted to a process pool at once
+	#   A few per core keeps every worker busy without queueing the whole backlog in memory
+	return 4 * (os.cpu_count() or 1)
+
+def run_in_pool(executor, this_function, all_items, max_in_flight):
+	# Run this_function on each of all_items in the executor, one item per task, keeping at most max_in_flight items submitted
+	#   Submitting one item at a time, instead of executor.map with a large chunksize, means that no worker sits idle while another
+	#   works through a long chunk, and the order of all_items is the order the work is started
+	#   Yields (item, result, item_stats) as the items finish; item_stats is from run_timed()
+	#   If this_function raised an exception, that is alerted and the result and item_stats are None
+	items_left = iter(all_items)
+	in_flight = {}
+	for this_item in itertools.islice(items_left, max_in_flight):
+		in_flight[executor.submit(run_timed, this_function, this_item)] = this_item
+	while in_flight:
+		(done_futures, _) = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+		for this_future in done_futures:
+			this_item = in_flight.pop(this_future)
+			try:
+				(this_result, this_item_stats) = this_future.result()
+			except Exception as e:
+				alert(f"Running {this_function.__name__} on {this_item} raised '{e}'")
+				(this_result, this_item_stats) = (None, None)
+			for next_item in itertools.islice(items_left, 1):
+				in_flight[executor.submit(run_timed, this_function, next_item)] = next_item
+			yield (this_item, this_result, this_item_stats)
+
+###############################################################
+
+# Stage timings for the ingest and correctness pipelines
+#   The worker functions call end_stage() and count_stage() as they go; run_timed() collects what was recorded for one item
+#   and returns it to the parent process, which sums them with add_item_stats() and writes them with write_pipeline_metrics()
+stage_seconds = {}
+stage_counts = {}
+
+def end_stage(stage_name, stage_start):
+	# Add the time since stage_start (from time.perf_counter()) to the named stage for the current item
+	stage_seconds[stage_name] = stage_seconds.get(stage_name, 0.0) + (time.perf_counter() - stage_start)
+
+def count_stage(count_name, this_count):
+	# Add to a named count, such as the number of rows, for the current item
+	stage_counts[count_name] = stage_counts.get(count_name, 0) + this_count
+
+def run_timed(this_function, this_item):
+	# Run this_function on this_item in a worker, returning (result, item_stats)
+	#   item_stats is a dict with "seconds" (per stage, plus "total") and "counts" for this item
+	stage_seconds.clear()
+	stage_counts.clear()
+	item_start = time.perf_counter()
+	this_result = this_function(this_item)
+	these_seconds = dict(stage_seconds)
+	these_seconds["total"] = time.perf_counter() - item_start
+	return (this_result, { "seconds": these_seconds, "counts": dict(stage_counts) })
+
+def new_pipeline_stats():
+	# The totals for one run of a pipeline, filled in by add_item_stats()
+	return { "items": 0, "seconds": {}, "counts": {}, "item_latencies": [] }
+
+def add_item_stats(pipeline_stats, this_item_stats):
+	# Add the item_stats from run_timed() for one item to the totals for the pipeline
+	if not this_item_stats:
+		return
+	pipeline_stats["items"] += 1
+	for (this_name, this_value) in this_item_stats["seconds"].items():
+		pipeline_stats["seconds"][this_name] = pipeline_stats["seconds"].get(this_name, 0.0) + this_value
+	for (this_name, this_value) in this_item_stats["counts"].items():
+		pipeline_stats["counts"][this_name] = pipeline_stats["counts"].get(this_name, 0) + this_value
+	pipeline_stats["item_latencies"].append(this_item_stats["seconds"]["total"])
+
+def latency_percentile(sorted_latencies, this_fraction):
+	# Nearest-rank percentile of an already-sorted list; 0.0 for an empty list
+	if len(sorted_latencies) == 0:
+		return 0.0
+	return sorted_latencies[max(0, math.ceil(this_fraction * len(sorted_latencies)) - 1)]
+
+def write_pipeline_metrics(pipeline_name, pipeline_stats, wall_seconds):
+	# Write the totals for one run of a pipeline as a Prometheus textfile and as a JSON summary in the log directory
+	#   The files are written under temporary names and renamed so that a scraper never sees a partial file
+	#   Returns the JSON summary as a dict
+	sorted_latencies = sorted(pipeline_stats["item_latencies"])
+	wall_seconds = max(wall_seconds, 0.001)
+	summary = {
+		"pipeline": pipeline_name,
+		"finished_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+		"wall_seconds": round(wall_seconds, 3),
+		"items": pipeline_stats["items"],
+		"items_per_second": round(pipeline_stats["items"] / wall_seconds, 3),
+		"rows_per_second": round(pipeline_stats["counts"].get("rows", 0) / wall_seconds, 3),
+		"item_latency_p50": round(latency_percentile(sorted_latencies, 0.50), 6),
+		"item_latency_p99": round(latency_percentile(sorted_latencies, 0.99), 6),
+		"stage_seconds": { x: round(y, 6) for (x, y) in sorted(pipeline_stats["seconds"].items()) },
+		"counts": dict(sorted(pipeline_stats["counts"].items())),
+	}
+	prom_lines = []
+	for (this_name, this_value) in (("wall_seconds", summary["wall_seconds"]), ("items", summary["items"]), \
+		("items_per_second", summary["items_per_second"]), ("rows_per_second", summary["rows_per_second"])):
+		prom_lines.append(f"rssac047_{pipeline_name}_{this_name} {this_value}")
+	prom_lines.append(f'rssac047_{pipeline_name}_item_latency_seconds{{quantile="0.5"}} {summary["item_latency_p50"]}')
+	prom_lines.append(f'rssac047_{pipeline_name}_item_latency_seconds{{quantile="0.99"}} {summary["item_latency_p99"]}')
+	for (this_stage, this_value) in summary["stage_seconds"].items():
+		prom_lines.append(f'rssac047_{pipeline_name}_stage_seconds{{stage="{this_stage}"}} {this_value}')
+	for (this_count, this_value) in summary["counts"].items():
+		prom_lines.append(f'rssac047_{pipeline_name}_count{{name="{this_count}"}} {this_value}')
+	metrics_dir = user_path / "Logs"
+	for (this_file_name, this_text) in ((f"{pipeline_name}-metrics.prom", "\n".join(prom_lines) + "\n"), \
+		(f"{pipeline_name}-metrics.json", json.dumps(summary, indent=1) + "\n")):
+		temp_path = metrics_dir / f".{this_file_name}.tmp"
+		temp_path.write_text(this_text)
+		os.replace(temp_path, metrics_dir / this_file_name)
+	return summary
+
+###############################################################
+
+# For --daemon, the Output directory of each VP in incoming_dir is watched with inotify so that files are ingested as soon as rsync renames them into place
+#   inotify is used through ctypes so that no additional packages are needed; if it is not available, the daemon just polls
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+inotify_event_header = struct.Struct("iIII")
+
+def open_inotify():
+	# Returns (libc, inotify file descriptor), or (None, None) if inotify cannot be used on this system
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+		inotify_fd = libc.inotify_init()
+	except Exception as e:
+		alert(f"Could not load inotify, so the daemon will poll instead: {e}")
+		return (None, None)
+	if inotify_fd < 0:
+		alert(f"inotify_init failed with errno {ctypes.get_errno()}, so the daemon will poll instead")
+		return (None, None)
+	return (libc, inotify_fd)
+
+def watch_incoming_dirs(libc, inotify_fd, watched_dirs):
+	# Add a watch for the Output directory of any VP that is not already being watched
+	#   watched_dirs is a dict whose keys are watch descriptors and whose values are the watched directory
+	already_watched = set(watched_dirs.values())
+	for this_vp_dir in incoming_dir.iterdir():
+		this_output_dir = this_vp_dir / "Output"
+		if (this_output_dir in already_watched) or (not this_output_dir.is_dir()):
+			continue
+		this_wd = libc.inotify_add_watch(inotify_fd, str(this_output_dir).encode(), IN_CLOSE_WRITE | IN_MOVED_TO)
+		if this_wd < 0:
+			alert(f"Could not add an inotify watch for {this_output_dir}: errno {ctypes.get_errno()}")
+			continue
+		watched_dirs[this_wd] = this_output_dir
+
+def read_inotify_paths(inotify_fd, watched_dirs, wait_seconds):
+	# Wait up to wait_seconds for events, then return the list of paths of .pickle.gz files that were written or renamed into a watched directory
+	(ready, _, _) = select.select([inotify_fd], [], [], wait_seconds)
+	if not ready:
+		return []
+	event_bytes = os.read(inotify_fd, 65536)
+	found_paths = []
+	event_offset = 0
+	while event_offset < len(event_bytes):
+		(this_wd, _, _, name_length) = inotify_event_header.unpack_from(event_bytes, event_offset)
+		event_offset += inotify_event_header.size
+		this_name = event_bytes[event_offset:event_offset + name_length].rstrip(b"\0").decode(errors="replace")
+		event_offset += name_length
+		if this_name.endswith(".pickle.gz") and (this_wd in watched_dirs):
+			found_paths.append(watched_dirs[this_wd] / this_name)
+	return found_paths
+
+def run_ingest_daemon():
+	# Run forever, ingesting incoming files as they arrive with a pool of workers that stays up between files
+	#   A full look for files past the high-water marks is done at startup and every rescan_seconds after that;
+	#   this catches files whose events were missed and retries files that failed, and is the only mechanism if inotify is not available
+	#   SIGTERM and SIGINT stop the daemon after the files that are already being ingested are finished
+	(libc, inotify_fd) = open_inotify()
+	rescan_seconds = 300 if inotify_fd is not None else opts.poll_seconds
+	watched_dirs = {}
+	keep_running = [ True ]
+	def stop_running(signal_number, _):
+		log(f"Ingest daemon got signal {signal_number}, stopping")
+		keep_running[0] = False
+	signal.signal(signal.SIGTERM, stop_running)
+	signal.signal(signal.SIGINT, stop_running)
+	log(f"Started ingest daemon, {'using inotify' if inotify_fd is not None else 'polling'}, looking at all incoming files every {rescan_seconds} seconds")
+	# in_flight has futures as keys and short file names as values
+	in_flight = {}
+	# finished_results has short file names as keys and whether they were finished as values, for files not yet folded into the high-water marks
+	finished_results = {}
+	# queued_names is every short file name that is in flight or done in this session, so that no file is submitted twice
+	queued_names = set()
+	# pending_paths has short file names as keys and paths as values for files that are waiting to be submitted
+	pending_paths = {}
+	max_in_flight = max_pool_in_flight()
+	# The daemon holds the ingest lock the whole time it runs; it is taken again at each rescan if its connection was lost
+	ingest_lock_conn = hold_ingest_lock(None, wait=True)
+	high_water_marks = get_high_water_marks()
+	next_rescan = 0
+	ingested_count = 0
+	ingest_stats = new_pipeline_stats()
+	ingest_stats_start = time.time()
+	# The daemon has to keep running through Postgres restarts and workers that die, so failures in a pass are alerted and retried on a later pass
+	#   marks_not_saved is True if saving the high-water marks failed; they are saved again on the next pass
+	#   A pool that is broken because a worker died is replaced; the files that were in it are found again by the next rescan
+	executor = futures.ProcessPoolExecutor(initializer=init_worker_connection)
+	marks_not_saved = False
+	pool_is_broken = False
+	def submit_files(these_paths):
+		# Add new files to pending_paths, then keep up to max_in_flight of them submitted, newest first
+		for this_path in these_paths:
+			short_file_name = (this_path.name).replace(".pickle.gz", "")
+			# Files at or below the mark are still submitted, because a file can arrive after newer ones or be copied again after a partial copy
+			if short_file_name in queued_names:
+				continue
+			queued_names.add(short_file_name)
+			pending_paths[short_file_name] = this_path
+		if len(in_flight) >= max_in_flight:
+			return
+		for short_file_name in order_newest_first(pending_paths)[0:max_in_flight - len(in_flight)]:
+			# The file stays in pending_paths until it has been submitted, so a failed submit does not lose it
+			in_flight[executor.submit(run_timed, process_one_incoming_file, pending_paths[short_file_name])] = short_file_name
+			del pending_paths[short_file_name]
+	while keep_running[0]:
+		try:
+			if time.time() >= next_rescan:
+				# The metrics for the daemon cover the time since the previous rescan
+				if ingest_stats["items"] > 0:
+					write_pipeline_metrics("ingest", ingest_stats, time.time() - ingest_stats_start)
+				ingest_stats = new_pipeline_stats()
+				ingest_stats_start = time.time()
+				ingest_lock_conn = hold_ingest_lock(ingest_lock_conn, wait=True)
+				if inotify_fd is not None:
+					watch_incoming_dirs(libc, inotify_fd, watched_dirs)
+				submit_files(find_new_incoming_files(high_water_marks, get_recent_known_files(high_water_marks)).values())
+				next_rescan = time.time() + rescan_seconds
+			if inotify_fd is not None:
+				submit_files(read_inotify_paths(inotify_fd, watched_dirs, 1.0))
+			else:
+				time.sleep(1.0)
+				submit_files([])
+		except futures.BrokenExecutor:
+			pool_is_broken = True
+		except Exception as e:
+			alert(f"Finding or submitting files in the ingest daemon raised '{e}'; trying again on the next pass")
+			time.sleep(1.0)
+		# Collect the files that have been ingested
+		done_futures = [ x for x in in_flight if x.done() ]
+		for this_future in done_futures:
+			short_file_name = in_flight.pop(this_future)
+			try:
+				(this_finished, this_item_stats) = this_future.result()
+				add_item_stats(ingest_stats, this_item_stats)
+			except futures.BrokenExecutor:
+				pool_is_broken = True
+				this_finished = False
+			except Exception as e:
+				alert(f"Ingesting {short_file_name} in the daemon raised '{e}'")
+				this_finished = False
+			finished_results[short_file_name] = this_finished
+			if this_finished:
+				ingested_count += 1
+			else:
+				# Let the next rescan find it again
+				queued_names.discard(short_file_name)
+		if pool_is_broken:
+			# The futures of the old pool all fail, and are collected here like any other failure, so their files are found again by the next rescan
+			alert("The ingest daemon's worker pool broke, probably because a worker died; starting a new pool")
+			executor.shutdown(wait=False)
+			executor = futures.ProcessPoolExecutor(initializer=init_worker_connection)
+			pool_is_broken = False
+		if (len(done_futures) == 0) and (not marks_not_saved):
+			continue
+		# Files still in flight block the marks for their VPs the same way failures do
+		new_marks = advance_high_water_marks(list(finished_results.items()) + [ (x, False) for x in list(in_flight.values()) + list(pending_paths) ], high_water_marks)
+		try:
+			save_high_water_marks(new_marks)
+		except Exception as e:
+			# Keep finished_results as it is so that the same marks are made and saved on the next pass; only alert the first time
+			if not marks_not_saved:
+				alert(f"Saving high-water marks in the ingest daemon raised '{e}'; trying again on the next pass")
+			marks_not_saved = True
+			continue
+		marks_not_saved = False
+		high_water_marks.update(new_marks)
+		# Forget everything at or below the new marks
+		finished_results = { x: y for (x, y) in finished_results.items() if x > high_water_marks.get(x.split("-")[-1], "") }
+		queued_names = set([ x for x in queued_names if x > high_water_marks.get(x.split("-")[-1], "") ])
+	# Here after a signal; wait for the files in flight so their marks can be saved
+	for this_future in futures.as_completed(list(in_flight)):
+		try:
+			(finished_results[in_flight[this_future]], _) = this_future.result()
+		except Exception:
+			finished_results[in_flight[this_future]] = False
+	executor.shutdown()
+	try:
+		save_high_water_marks(advance_high_water_marks(list(finished_results.items()), high_water_marks))
+	except Exception as e:
+		alert(f"Saving high-water marks when stopping the ingest daemon raised '{e}'; the next start will ingest those files again")
+	log(f"Stopped ingest daemon after ingesting {ingested_count} files")
 
 ###############################################################
 
@@ -241,469 +1063,531 @@ def check_for_signed_rr(list_of_records_from_section, name_of_rrtype):
 	if not found_rrsig:
 		return f"One more more records of type {name_of_rrtype} were found in that section, but there was no RRSIG"
 	return ""
+
+def nsecs_by_owner(list_of_records_from_section):
+	# Returns a dict of the canonical name key of the owner of each NSEC record in a section to (owner, next domain name, list of types)
+	#   This is made once for a section so that the [mkl], [czb], and [jhz] checks can look up owners instead of scanning the section again
+	these_nsecs = {}
+	for this_rec_dict in list_of_records_from_section:
+		if this_rec_dict["rdtype"] == "NSEC":
+			# Just looking at the first NSEC record
+			(next_name, type_bit_map) = this_rec_dict["rdata"][0].split(" ", maxsplit=1)
+			these_nsecs[root_zone_index.canonical_name_key(this_rec_dict["name"])] = (this_rec_dict["name"], next_name, type_bit_map.split(" "))
+	return these_nsecs
 	
 ###############################################################
 
 
-def process_one_correctness_tuple(in_tuple):
-	# Tuple is (request_type, filename_record)
-	# request_type is "test" or "normal"
-	#    For "normal", process one filename_record
-	#    For "test", process one id/json_blob pair
-	# Normally, this function returns nothing because it is writing the results into the record_info database
-	#    However, if the type is "test", the function does not write into the database but instead returns the results as text
-	(request_type, in_filename_record) = in_tuple
-	if not request_type in ("normal", "test"):
-		alert(f"While running process_one_correctness_tuple on {in_filename_record}, got unknown first argument {request_type}")
-		return
-	# Open a database connection that is in use for the whole function
-	with psycopg2.connect(dbname="metrics", user="metrics") as conn:
-		conn.set_session(autocommit=True)
-		if request_type == "normal":
-			with conn.cursor() as cur:
-				cur.execute("select timeout, likely_soa, is_correct from record_info where filename_record = %s", (in_filename_record, ))
-				this_found = cur.fetchall()
-			if len(this_found) > 1:
-				alert(f"When checking correctness on {in_filename_record}, found {len(this_found)} records instead of just 1")
-				return
-			(this_timeout, this_soa_to_check, this_is_correct) = this_found[0]
-			# Before trying to load the pickled data, first see if it is a timeout; if so, set is_correct but move on [lbl]
-			if not this_timeout == "":
-				cur.execute("update record_info set (is_correct, failure_reason) = (%s, %s) where filename_record = %s", ("y", "timeout", in_filename_record))
-				return
-			# Get the pickled object
-			try:
-				(resp_date, resp_probe, resp_count) = in_filename_record.split("-")
-			except:
-				alert(f"When checking correctness on {in_filename_record}, the name did not split correctly.")
-				return
-			response_file_name = f"{resp_date}-{resp_probe}.pickle"
-			response_file = saved_response_dir / response_file_name
-			if not response_file.exists():
-				alert(f"When checking correctness on {in_filename_record}, could not find {str(response_file)} on disk.")
-				return
-			try:
-				response_f = response_file.open(mode="rb")
-				all_responses_in_file = pickle.load(response_f)
-			except Exception as e:
-				alert(f"Could not unpickle the source_pickle in {in_filename_record}, file {str(response_file)}: {e}")
-				return
-			try:
-				resp = all_responses_in_file[in_filename_record]
-			except:
-				alert(f"When checking correctness, could not find key {in_filename_record} in file {str(response_file)}")
-				return
-		else:  # For tests
-			# Note that we have already os.chdir'd to the tests directory at this point
-			this_timeout = ""
-			# Un-JSON the object to get the values
-			try:
-				resp = json.loads(in_filename_record)
-			except:
-				return "Could not un-JSON this test."
-			test_name = resp["test-on"]
-			if test_name[0] == "p":
-				this_is_correct = "y"
-			elif test_name[0] == "n":
-				this_is_correct = "n"
-			else:
-				return f"In {test_name}, the first letter was not 'p' or 'n'."
-			# Change in_filename_record in tests to be the test ID so that errors come out more readable
-			in_filename_record = test_name
-			this_soa_to_check = ""			
-
-		#  Get the question
-		#   Only look at the first record in the question section; it is completely unclear what to do if the the question section has more records
-		question_record_dict = resp["question"][0]
-		this_qname = question_record_dict["name"]
-		this_qtype = question_record_dict["rdtype"]
-
-		# root_to_check holds the contents of the root to check in this round (not just the names)
-		root_to_check = {}
-		#   For type "test", it is the fixed root
-		#   For type "C" and is_correct "?", it is just the root associated with the likely_soa
-		#   For type "C" and is_correct "r", it is one of the roots from the "incorrect" table
-		#     That table has the likely_soa, the roots for 48 hours before likely_soa
-		#       create table incorrect (filename_record text, root_checked text, has_been_checked boolean, failure_reason text);
-		if request_type == "test":
-			# The root is known is known for opts.test; for the normal checking, it is the likely_soa
-			try:
-				# Note that we have already os.chdir'd to the tests directory at this point
-				root_to_check = json.load(open("root_name_and_types.json", mode="rb"))
-			except:
-				alert("While running under --test, could not find and un-json 'root_name_and_types.json'. Exiting.")
-				return
-		if not this_is_correct in ("r", "?"):
-			alert(f"Got unexpected value '{this_is_correct}' for is_correct in {in_filename_record}")
-			return
-		if this_is_correct == "r":
-			# Get the list of possible roots that was filled in earlier, then pick one that is has not been checked
-			with conn.cursor() as cur:
-				cur.execute("select (root_checked, has_been_checked) from incorrect where filename_record = %s", (in_filename_record, ))
-				retries_found = cur.fetchall()
-				if len(retries_found) == 0:
-					alert(f"When looking for retries on {in_filename_record}, found nothing in the 'incorrect' table when there should have beenmore than one record")
-					return
-				this_retry_to_check = ""
-				for this_retry in retries_found:
-					if this_retry[1]:
-						this_retry_to_check = this_retry[0]
-						break
-				if not this_retry_to_check:
-					# All the retries have been tested, report failure
-					tried_string = " ".join(retries_found)
-					cur.execute("update record_info set (is_correct, failure_reason) = (%s, %s) where filename_record = %s", \
-						("n", f"Tried root files {tried_string} but all had failures; see 'incorrect' table", in_filename_record))
-					return
-				one_root_file = saved_matching_dir / f"{this_retry_to_check}.matching.pickle"
-		elif this_is_correct == "?":
-			# Use the likely SOA
-			one_root_file = saved_matching_dir / f"{this_soa_to_check}.matching.pickle"
-		# Here after sucessfully getting a root file name from "r" or "?"
-		# Try to read the file and unpickle it
-		if not one_root_file.exists():
-			# Just return, leaving the is_correct as "?" so it will get caught on the next run
-			alert(f"When checking correctness on {in_filename_record}, could not find root file {str(one_root_file)}")
-			return
-		with one_root_file.open(mode="rb") as root_contents_f:
-			try:
-				root_to_check = pickle.load(root_contents_f)
-			except:
-				alert(f"Could not unpickle root file {str(one_root_file)} while processing {in_filename_record} for correctness the first time")
-				return
+# Each correctness worker keeps the root matching dicts it used most recently, because most of the records it checks use the same few SOAs
+#   The key includes the modification time of the file so that a root file that is written again is read again
+#   The hits and misses are counted with count_stage(), so they are summed for the run in correctness-metrics.json
+root_matching_cache_size = 4
+root_matching_cache = OrderedDict()
 
-		# Go through the correctness checking against root_to_check
-		# failure_reasons holds an expanding set of reasons
-		#   It is checked at the end of testing, and all "" entries eliminated
-		#   If it is empty, then all correctness tests passed
-		failure_reasons = []
-		# Check that each of the RRsets in the Answer, Authority, and Additional sections match RRsets found in the zone [vnk]
-		#   This check does not include any RRSIG RRsets that are not named in the matching tests below. [ygx]
-		# This check does not include any EDNS0 NSID RRset [pvz]
-		# After this check is done, we no longer need to check RRsets from the answer against the root zone
-		for this_section_name in [ "answer", "authority", "additional" ]:
-			if resp.get(this_section_name):
-				rrsets_for_checking = {}
-				for this_rec_dict in resp[this_section_name]:
-					rec_qname = this_rec_dict["name"]
-					rec_qtype = this_rec_dict["rdtype"]
-					if rec_qtype == "RRSIG":  # [ygx]
+def load_root_matching(one_root_file):
+	# Returns (matching dict, canonical index) for one_root_file, from this worker's cache if they are there; raises an exception if the file cannot be read
+	#   The canonical index is in the .index.pickle file that get_root_zone.py writes next to the matching file; for older zones without one, it is made here
+	#   The dicts that are returned are shared with later calls, so they must not be changed
+	this_key = (one_root_file.name, one_root_file.stat().st_mtime_ns)
+	if this_key in root_matching_cache:
+		root_matching_cache.move_to_end(this_key)
+		count_stage("root_cache_hits", 1)
+		return root_matching_cache[this_key]
+	count_stage("root_cache_misses", 1)
+	with one_root_file.open(mode="rb") as root_contents_f:
+		this_matching = pickle.load(root_contents_f)
+	index_file = one_root_file.with_name(one_root_file.name.replace(".matching.pickle", ".index.pickle"))
+	if index_file.exists():
+		with index_file.open(mode="rb") as index_f:
+			this_index = pickle.load(index_f)
+	# Index files written before the NSEC chain was added to the index do not have it, so make the index here for them also
+	if (not index_file.exists()) or (not "nsec_keys" in this_index):
+		this_index = root_zone_index.make_root_index(this_matching)
+	root_matching_cache[this_key] = (this_matching, this_index)
+	if len(root_matching_cache) > root_matching_cache_size:
+		root_matching_cache.popitem(last=False)
+	return (this_matching, this_index)
+
+# Each correctness worker also keeps the parsed ./DNSKEY records for each root key set, and the result of each DNSSEC validation it has done [yds]
+#   Almost every VP gets the same signed RRsets with the same RRSIGs for a given SOA, so each signature only needs to be validated once per run
+#   Both are keyed by the digest of the ./DNSKEY RRset from the canonical index, so zones that have the same keys share them
+#   A validation result is keyed by the name, type, and digests of the signed RRset, the RRSIG RRset, and the key set; the value is "" or the error
+#   The results are only kept for one run, so signatures that expire while the collector is running are not kept as valid for long
+root_keys_cache_size = 4
+root_keys_cache = OrderedDict()
+dnssec_validation_cache_size = 20000
+dnssec_validation_cache = OrderedDict()
+
+def get_root_keys(root_to_check, root_index):
+	# Returns (key set digest, dict of "." to the ./DNSKEY rdataset) for dns.dnssec.validate(), from this worker's cache if it is there
+	keys_digest = root_index["digests"]["./DNSKEY"]
+	if keys_digest in root_keys_cache:
+		root_keys_cache.move_to_end(keys_digest)
+		return (keys_digest, root_keys_cache[keys_digest])
+	class_in = dns.rdataclass.from_text("IN")
+	root_rdataset = dns.rdataset.Rdataset(class_in, dns.rdatatype.from_text("DNSKEY"))
+	for this_root_dnskey in root_to_check["./DNSKEY"]:
+		root_rdataset.add(dns.rdata.from_text(class_in, dns.rdatatype.from_text("DNSKEY"), this_root_dnskey))
+	root_keys_cache[keys_digest] = { dns.name.from_text("."): root_rdataset }
+	if len(root_keys_cache) > root_keys_cache_size:
+		root_keys_cache.popitem(last=False)
+	return (keys_digest, root_keys_cache[keys_digest])
+
+def validate_signed_rrset(rec_qname, rec_qtype, signed_rdatas, rrsig_rdatas, root_to_check, root_index):
+	# Returns "" if the RRSIGs in rrsig_rdatas validate the RRset of signed_rdatas with the root keys, otherwise the text of the error
+	#   The results are cached as described above; hits and misses are counted with count_stage()
+	(keys_digest, root_keys_for_matching) = get_root_keys(root_to_check, root_index)
+	this_key = (rec_qname, rec_qtype, root_zone_index.rrset_digest(signed_rdatas), root_zone_index.rrset_digest(rrsig_rdatas), keys_digest)
+	if this_key in dnssec_validation_cache:
+		dnssec_validation_cache.move_to_end(this_key)
+		count_stage("dnssec_cache_hits", 1)
+		return dnssec_validation_cache[this_key]
+	count_stage("dnssec_cache_misses", 1)
+	class_in = dns.rdataclass.from_text("IN")
+	signed_rrset = dns.rrset.RRset(dns.name.from_text(rec_qname), class_in, dns.rdatatype.from_text(rec_qtype))
+	for this_signed_rdata in signed_rdatas:
+		signed_rrset.add(dns.rdata.from_text(class_in, dns.rdatatype.from_text(rec_qtype), this_signed_rdata))
+	rrsig_rrset = dns.rrset.RRset(dns.name.from_text(rec_qname), class_in, dns.rdatatype.from_text("RRSIG"))
+	for this_rrsig_rdata in rrsig_rdatas:
+		rrsig_rrset.add(dns.rdata.from_text(class_in, dns.rdatatype.from_text("RRSIG"), this_rrsig_rdata))
+	try:
+		dns.dnssec.validate(signed_rrset, rrsig_rrset, root_keys_for_matching)
+		this_result = ""
+	except Exception as e:
+		this_result = str(e)
+	dnssec_validation_cache[this_key] = this_result
+	if len(dnssec_validation_cache) > dnssec_validation_cache_size:
+		dnssec_validation_cache.popitem(last=False)
+	return this_result
+
+def check_one_response(resp, root_to_check, root_index, in_filename_record):
+	# Check one correctness response against the matching dict for a root zone and its canonical index from root_zone_index.py
+	#   Returns the failure reasons as text, one per line, or "" if the response passed all the correctness tests
+	#   in_filename_record is only used in messages
+	#  Get the question
+	#   Only look at the first record in the question section; it is completely unclear what to do if the the question section has more records
+	question_record_dict = resp["question"][0]
+	this_qname = question_record_dict["name"]
+	this_qtype = question_record_dict["rdtype"]
+
+	# Go through the correctness checking against root_to_check
+	# failure_reasons holds an expanding set of reasons
+	#   It is checked at the end of testing, and all "" entries eliminated
+	#   If it is empty, then all correctness tests passed
+	failure_reasons = []
+	# Check that each of the RRsets in the Answer, Authority, and Additional sections match RRsets found in the zone [vnk]
+	#   This check does not include any RRSIG RRsets that are not named in the matching tests below. [ygx]
+	# This check does not include any EDNS0 NSID RRset [pvz]
+	# After this check is done, we no longer need to check RRsets from the answer against the root zone
+	stage_start = time.perf_counter()
+	for this_section_name in [ "answer", "authority", "additional" ]:
+		if resp.get(this_section_name):
+			rrsets_for_checking = {}
+			for this_rec_dict in resp[this_section_name]:
+				rec_qname = this_rec_dict["name"]
+				rec_qtype = this_rec_dict["rdtype"]
+				if rec_qtype == "RRSIG":  # [ygx]
+					continue
+				this_key = f"{rec_qname}/{rec_qtype}"
+				rec_rdata = this_rec_dict["rdata"]
+				if not this_key in rrsets_for_checking:
+					rrsets_for_checking[this_key] = set()
+				for this_rdata_record in rec_rdata:
+					rrsets_for_checking[this_key].add(this_rdata_record)
+			for this_rrset_key in rrsets_for_checking:
+				if not this_rrset_key in root_index["rrsets"]:
+					failure_reasons.append(f"{this_rrset_key} was in the {this_section_name} section in the response, but not the root [vnk]")
+				else:
+					z_short = rrsets_for_checking[this_rrset_key]
+					r_short = root_index["rrsets"][this_rrset_key]
+					if not len(z_short) == len(r_short):
+						failure_reasons.append(f"{this_rrset_key} in {this_section_name} in the response has {len(z_short)} members instead of {len(r_short)} in root zone;" +
+							f" {z_short} instead of {set(r_short)} [vnk]")
 						continue
-					this_key = f"{rec_qname}/{rec_qtype}"
-					rec_rdata = this_rec_dict["rdata"]
-					if not this_key in rrsets_for_checking:
-						rrsets_for_checking[this_key] = set()
-					for this_rdata_record in rec_rdata:
-						rrsets_for_checking[this_key].add(this_rdata_record)
-				for this_rrset_key in rrsets_for_checking:
-					if not this_rrset_key in root_to_check:
-						failure_reasons.append(f"{this_rrset_key} was in the {this_section_name} section in the response, but not the root [vnk]")
-					else:
-						z_short = rrsets_for_checking[this_rrset_key]
-						r_short = root_to_check[this_rrset_key]
-						if not len(rrsets_for_checking[this_rrset_key]) == len(root_to_check[this_rrset_key]):
-							failure_reasons.append(f"{this_rrset_key} in {this_section_name} in the response has {len(z_short)} members instead of {len(r_short)} in root zone;" +
-								f" {z_short} instead of {r_short} [vnk]")
-							continue
-						# Need to match case, so uppercase all the records in both sets
-						#   It is OK to do this for any type that is not displayed as Base64, and RRSIG is already excluded by [ygx]
-						#   But don't change case on DNSKEY
-						# Do this by making two comparitors that are copies of the rrsets, process, and compare those
-						r_comparitors = [set((rrsets_for_checking[this_rrset_key]).copy()), set((root_to_check[this_rrset_key]).copy())]
-						for this_comparator in r_comparitors:
-							for this_rdata in this_comparator:
-								this_comparator.remove(this_rdata)
-								if this_rrset_key.endswith("/DNSKEY"):
-									(d_flags, d_prot, d_alg, d_key) = this_rdata.split(" ", maxsplit=3)
-									d_key = d_key.replace(" ", "")
-									this_rdata = f"{d_flags} {d_prot} {d_alg} {d_key}"
-									this_comparator.add(this_rdata)
-								elif this_rrset_key.endswith("/AAAA"):
-									this_comparator.add(dns.ipv6.inet_ntoa(dns.ipv6.inet_aton(this_rdata)))
-								else:
-									this_comparator.add(this_rdata.upper())
-						if not r_comparitors[0] == r_comparitors[1]:
-							failure_reasons.append(f"Set of RRset value {z_short} in {this_section_name} in response is different than {r_short} in root zone [vnk]")
-
-		# Check that each of the RRsets that are signed have their signatures validated. [yds]
-		#    Make these calls shorter
-		class_in = dns.rdataclass.from_text("IN")
-		# Get the ./DNSKEY records for this root
-		root_rdataset = dns.rdataset.Rdataset(class_in, dns.rdatatype.from_text("DNSKEY"))
-		for this_root_dnskey in root_to_check["./DNSKEY"]:
-			root_rdataset.add(dns.rdata.from_text(class_in, dns.rdatatype.from_text("DNSKEY"), this_root_dnskey))
-		root_keys_for_matching = { dns.name.from_text("."): root_rdataset }
-		# Check each section for signed records
-		for this_section_name in [ "answer", "authority", "additional" ]:
-			if resp.get(this_section_name):
-				signed_rrsets = {}
-				# Find the RRSIG records to know what is signed
+					# Need to match case and format, so compare the canonical form of the response RRset with the canonical form in the root index
+					#   The root side was already made canonical by get_root_zone.py; see root_zone_index.py for what is changed
+					if not root_zone_index.canonical_rrset(this_rrset_key, z_short) == r_short:
+						failure_reasons.append(f"Set of RRset value {z_short} in {this_section_name} in response is different than {set(r_short)} in root zone [vnk]")
+
+	end_stage("match", stage_start)
+
+	# Check that each of the RRsets that are signed have their signatures validated. [yds]
+	stage_start = time.perf_counter()
+	# Check each section for signed records
+	for this_section_name in [ "answer", "authority", "additional" ]:
+		if resp.get(this_section_name):
+			signed_rrsets = {}
+			# Find the RRSIG records to know what is signed
+			for this_rec_dict in resp[this_section_name]:
+				rec_qname = this_rec_dict["name"]
+				rec_qtype = this_rec_dict["rdtype"]
+				rec_rdata = this_rec_dict["rdata"]
+				if rec_qtype == "RRSIG":
+					(first_field, _) = rec_rdata[0].split(" ", maxsplit=1)
+					signed_rrsets[f"{rec_qname}&{first_field}"] = []
+			# Collect the records that were signed and the RRSIGs for them, and then validate
+			for signed_rrset_id in signed_rrsets:
+				(rec_qname, rec_qtype) = signed_rrset_id.split("&")
+				signed_rdatas = set()
+				rrsig_rdatas = set()
 				for this_rec_dict in resp[this_section_name]:
-					rec_qname = this_rec_dict["name"]
-					rec_qtype = this_rec_dict["rdtype"]
-					rec_rdata = this_rec_dict["rdata"]
-					if rec_qtype == "RRSIG":
-						(first_field, _) = rec_rdata[0].split(" ", maxsplit=1)
-						signed_rrsets[f"{rec_qname}&{first_field}"] = []
-				# Make an RRset of the records that were signed, an RRset of those RRSIGS, and then validate
-				for signed_rrset_id in signed_rrsets:
-					(rec_qname, rec_qtype) = signed_rrset_id.split("&")
-					signed_rrset = dns.rrset.RRset(dns.name.from_text(rec_qname), class_in, dns.rdatatype.from_text(rec_qtype))
-					rrsig_rrset = dns.rrset.RRset(dns.name.from_text(rec_qname), class_in, dns.rdatatype.from_text("RRSIG"))
-					for this_rec_dict in resp[this_section_name]:
-						if (this_rec_dict["name"] == rec_qname) and (this_rec_dict["rdtype"] == rec_qtype):
-							for this_signed_rdata in this_rec_dict["rdata"]:
-								signed_rrset.add(dns.rdata.from_text(class_in, dns.rdatatype.from_text(rec_qtype), this_signed_rdata))
-						elif (this_rec_dict["name"] == rec_qname) and (this_rec_dict["rdtype"] == "RRSIG"):
-							for this_rrsig_rdata in this_rec_dict["rdata"]:
-								(first_field, _) = this_rrsig_rdata.split(" ", maxsplit=1)
-								if first_field == rec_qtype:
-									rrsig_rrset.add(dns.rdata.from_text(class_in, dns.rdatatype.from_text("RRSIG"), this_rrsig_rdata))
-					try:
-						dns.dnssec.validate(signed_rrset, rrsig_rrset, root_keys_for_matching)
-					except Exception as e:
-						failure_reasons.append(f"Validating {rec_qname}/{rec_qtype} in {this_section_name} in {in_filename_record} got error of '{e}' [yds]")
-
-		# Check that all the parts of the resp structure are correct, based on the type of answer
-		if resp["rcode"] == "NOERROR":
-			if (this_qname != ".") and (this_qtype == "NS"):  # Processing for TLD / NS [hmk]
-				# The header AA bit is not set. [ujy]
-				if "AA" in resp["flags"]:
-					failure_reasons.append("AA bit was set [ujy]")
-				# The Answer section is empty. [aeg]
-				if resp.get("answer"):
-					failure_reasons.append("Answer section was not empty [aeg]")
-				# The Authority section contains the entire NS RRset for the query name. [pdd]
-				if not resp.get("authority"):
-					failure_reasons.append("Authority section was empty [pdd]")
-				root_ns_for_qname = root_to_check[f"{this_qname}/NS"]
-				auth_ns_for_qname = set()
-				for this_rec_dict in resp["authority"]:
-					if this_rec_dict["rdtype"] == "NS":
-						for this_ns in this_rec_dict["rdata"]:
-							auth_ns_for_qname.add(this_ns.lower())
-				if not set(auth_ns_for_qname) == set(root_ns_for_qname):
-					failure_reasons.append(f"NS RRset in Authority was {auth_ns_for_qname}, but NS from root was {root_ns_for_qname} [pdd]")
-				# If the DS RRset for the query name exists in the zone: [hue]
-				if root_to_check.get(f"{this_qname}/DS"):
-					# The Authority section contains the signed DS RRset for the query name. [kbd]
-					this_resp = check_for_signed_rr(resp["authority"], "DS")
-					if this_resp:
-						failure_reasons.append(f"{this_resp} [kbd]")
-				else:  # If the DS RRset for the query name does not exist in the zone: [fot]
-					# The Authority section contains no DS RRset. [bgr]
-					for this_rec_dict in resp["authority"]:
-						rec_qtype = this_rec_dict["rdtype"]
-						if rec_qtype == "DS":
-							failure_reasons.append("Found DS in Authority section [bgr]")
-							break
-					# The Authority section contains a signed NSEC RRset with an owner name matching the QNAME and with the DS type omitted from the Type Bit Maps field [mkl]
-					has_covering_nsec = False
-					for this_rec_dict in resp["authority"]:
-						rec_qtype = this_rec_dict["rdtype"]
-						if rec_qtype == "NSEC":
-							rec_qname = this_rec_dict["name"]
-							if rec_qname == this_rec_dict["name"]:
-								rec_rdata = this_rec_dict["rdata"][0]
-								(next_name, type_bit_map) = rec_rdata.split(" ", maxsplit=1)
-								nsec_types = type_bit_map.split(" ")
-								if not "DS" in nsec_types:
-									has_covering_nsec = True
-								break
-					if not has_covering_nsec:
-						failure_reasons.append("Authority section had no covering NSEC record [mkl]")
-				# Additional section contains at least one A or AAAA record found in the zone associated with at least one NS record found in the Authority section. [cjm]
-				#    Collect the NS records from the Authority section
-				found_NS_recs = set()
+					if (this_rec_dict["name"] == rec_qname) and (this_rec_dict["rdtype"] == rec_qtype):
+						signed_rdatas.update(this_rec_dict["rdata"])
+					elif (this_rec_dict["name"] == rec_qname) and (this_rec_dict["rdtype"] == "RRSIG"):
+						for this_rrsig_rdata in this_rec_dict["rdata"]:
+							(first_field, _) = this_rrsig_rdata.split(" ", maxsplit=1)
+							if first_field == rec_qtype:
+								rrsig_rdatas.add(this_rrsig_rdata)
+				validation_error = validate_signed_rrset(rec_qname, rec_qtype, signed_rdatas, rrsig_rdatas, root_to_check, root_index)
+				if validation_error:
+					failure_reasons.append(f"Validating {rec_qname}/{rec_qtype} in {this_section_name} in {in_filename_record} got error of '{validation_error}' [yds]")
+
+	end_stage("dnssec", stage_start)
+
+	# Check that all the parts of the resp structure are correct, based on the type of answer
+	stage_start = time.perf_counter()
+	if resp["rcode"] == "NOERROR":
+		if (this_qname != ".") and (this_qtype == "NS"):  # Processing for TLD / NS [hmk]
+			# The header AA bit is not set. [ujy]
+			if "AA" in resp["flags"]:
+				failure_reasons.append("AA bit was set [ujy]")
+			# The Answer section is empty. [aeg]
+			if resp.get("answer"):
+				failure_reasons.append("Answer section was not empty [aeg]")
+			# The Authority section contains the entire NS RRset for the query name. [pdd]
+			if not resp.get("authority"):
+				failure_reasons.append("Authority section was empty [pdd]")
+			root_ns_for_qname = root_to_check[f"{this_qname}/NS"]
+			auth_ns_for_qname = set()
+			for this_rec_dict in resp["authority"]:
+				if this_rec_dict["rdtype"] == "NS":
+					for this_ns in this_rec_dict["rdata"]:
+						auth_ns_for_qname.add(this_ns.lower())
+			if not set(auth_ns_for_qname) == set(root_ns_for_qname):
+				failure_reasons.append(f"NS RRset in Authority was {auth_ns_for_qname}, but NS from root was {root_ns_for_qname} [pdd]")
+			# If the DS RRset for the query name exists in the zone: [hue]
+			if root_to_check.get(f"{this_qname}/DS"):
+				# The Authority section contains the signed DS RRset for the query name. [kbd]
+				this_resp = check_for_signed_rr(resp["authority"], "DS")
+				if this_resp:
+					failure_reasons.append(f"{this_resp} [kbd]")
+			else:  # If the DS RRset for the query name does not exist in the zone: [fot]
+				# The Authority section contains no DS RRset. [bgr]
 				for this_rec_dict in resp["authority"]:
 					rec_qtype = this_rec_dict["rdtype"]
-					if rec_qtype == "NS":
-						for this_ns in this_rec_dict["rdata"]:
-							found_NS_recs.add(this_ns.upper())
-				found_qname_of_A_AAAA_recs = set()
-				for this_rec_dict in resp["additional"]:
+					if rec_qtype == "DS":
+						failure_reasons.append("Found DS in Authority section [bgr]")
+						break
+				# The Authority section contains a signed NSEC RRset with an owner name matching the QNAME and with the DS type omitted from the Type Bit Maps field [mkl]
+				nsec_for_qname = nsecs_by_owner(resp["authority"]).get(root_zone_index.canonical_name_key(this_qname))
+				if (not nsec_for_qname) or ("DS" in nsec_for_qname[2]):
+					failure_reasons.append("Authority section had no covering NSEC record [mkl]")
+			# Additional section contains at least one A or AAAA record found in the zone associated with at least one NS record found in the Authority section. [cjm]
+			#    Collect the NS records from the Authority section
+			found_NS_recs = set()
+			for this_rec_dict in resp["authority"]:
+				rec_qtype = this_rec_dict["rdtype"]
+				if rec_qtype == "NS":
+					for this_ns in this_rec_dict["rdata"]:
+						found_NS_recs.add(this_ns.upper())
+			found_qname_of_A_AAAA_recs = set()
+			for this_rec_dict in resp["additional"]:
+				rec_qtype = this_rec_dict["rdtype"]
+				if rec_qtype in ("A", "AAAA"):
+					found_qname_of_A_AAAA_recs.add((this_rec_dict["name"]).upper())
+			found_A_AAAA_NS_match = False
+			for a_aaaa_qname in found_qname_of_A_AAAA_recs:
+					if a_aaaa_qname in found_NS_recs:
+						found_A_AAAA_NS_match = True
+						break
+			if not found_A_AAAA_NS_match:
+				failure_reasons.append(f"No QNAMEs from A and AAAA in Additional {found_qname_of_A_AAAA_recs} matched NS from Authority {found_NS_recs} [cjm]")
+		elif (this_qname != ".") and (this_qtype == "DS"):  # Processing for TLD / DS [dru]
+			# The header AA bit is set. [yot]
+			if not "AA" in resp["flags"]:
+				failure_reasons.append("AA bit was not set [yot]")
+			# The Answer section contains the signed DS RRset for the query name. [cpf]
+			if not resp.get("answer"):
+				failure_reasons.append("Answer section was empty [cpf]")
+			else:
+				# Make sure the DS is for the query name
+				for this_rec_dict in resp["answer"]:
+					rec_qname = this_rec_dict["name"]
 					rec_qtype = this_rec_dict["rdtype"]
-					if rec_qtype in ("A", "AAAA"):
-						found_qname_of_A_AAAA_recs.add((this_rec_dict["name"]).upper())
-				found_A_AAAA_NS_match = False
-				for a_aaaa_qname in found_qname_of_A_AAAA_recs:
-						if a_aaaa_qname in found_NS_recs:
-							found_A_AAAA_NS_match = True
-							break
-				if not found_A_AAAA_NS_match:
-					failure_reasons.append(f"No QNAMEs from A and AAAA in Additional {found_qname_of_A_AAAA_recs} matched NS from Authority {found_NS_recs} [cjm]")
-			elif (this_qname != ".") and (this_qtype == "DS"):  # Processing for TLD / DS [dru]
-				# The header AA bit is set. [yot]
-				if not "AA" in resp["flags"]:
-					failure_reasons.append("AA bit was not set [yot]")
-				# The Answer section contains the signed DS RRset for the query name. [cpf]
-				if not resp.get("answer"):
-					failure_reasons.append("Answer section was empty [cpf]")
-				else:
-					# Make sure the DS is for the query name
-					for this_rec_dict in resp["answer"]:
-						rec_qname = this_rec_dict["name"]
-						rec_qtype = this_rec_dict["rdtype"]
-						if rec_qtype == "DS":
-							if not rec_qname == this_qname:
-								failure_reasons.append(f"DS in Answer section had QNAME {rec_qname} instead of {this_qname} [cpf]")
-					this_resp = check_for_signed_rr(resp["answer"], "DS")
-					if this_resp:
-						failure_reasons.append(f"{this_resp} [cpf]")
-				# The Authority section is empty. [xdu]
-				if resp.get("authority"):
-					failure_reasons.append("Authority section was not empty [xdu]")
-				# The Additional section is empty. [mle]
-				if resp.get("additional"):
-					failure_reasons.append("Additional section was not empty [mle]")
-			elif (this_qname == ".") and (this_qtype == "SOA"):  # Processing for . / SOA [owf]
-				# The header AA bit is set. [xhr]
-				if not "AA" in resp["flags"]:
-					failure_reasons.append("AA bit was not set [xhr]")
-				# The Answer section contains the signed SOA record for the root. [obw]
-				this_resp = check_for_signed_rr(resp["answer"], "SOA")
-				if this_resp:
-					failure_reasons.append(f"{this_resp} [obw]")
-				# The Authority section contains the signed NS RRset for the root, or is empty. [ktm]
-				#   The "or is empty" is added in v2.
-				if not resp.get("authority"):
-					debug(f"The Authority section was empty in {in_filename_record}")
-				else:
-					this_resp = check_for_signed_rr(resp["authority"], "NS")
-					if this_resp:
-						failure_reasons.append(f"{this_resp} [ktm]")
-			elif (this_qname == ".") and (this_qtype == "NS"):  # Processing for . / NS [amj]
-				# The header AA bit is set. [csz]
-				if not "AA" in resp["flags"]:
-					failure_reasons.append("AA bit was not set [csz]")
-				# The Answer section contains the signed NS RRset for the root. [wal]
-				this_resp = check_for_signed_rr(resp["answer"], "NS")
-				if this_resp:
-					failure_reasons.append(f"{this_resp} [wal]")
-				# The Authority section is empty. [eyk]
-				if resp.get("authority"):
-					failure_reasons.append("Authority section was not empty [eyk]")
-			elif (this_qname == ".") and (this_qtype == "DNSKEY"):  # Processing for . / DNSKEY [djd]
-				# The header AA bit is set. [occ]
-				if not "AA" in resp["flags"]:
-					failure_reasons.append("AA bit was not set [occ]")
-				# The Answer section contains the signed DNSKEY RRset for the root. [eou]
-				this_resp = check_for_signed_rr(resp["answer"], "DNSKEY")
+					if rec_qtype == "DS":
+						if not rec_qname == this_qname:
+							failure_reasons.append(f"DS in Answer section had QNAME {rec_qname} instead of {this_qname} [cpf]")
+				this_resp = check_for_signed_rr(resp["answer"], "DS")
 				if this_resp:
-					failure_reasons.append(f"{this_resp} [eou]")
-				# The Authority section is empty. [kka]
-				if resp.get("authority"):
-					failure_reasons.append("Authority section was not empty [kka]")
-				# The Additional section is empty. [jws]
-				if resp.get("additional"):
-					failure_reasons.append("Additional section was not empty [jws]")
-			else:
-				debug(f"NOERROR on {this_qname}/{this_qtype} in {in_filename_record}")
-		elif resp["rcode"] == "NXDOMAIN":  # Processing for negative responses [vcu]
-			# The header AA bit is set. [gpl]
+					failure_reasons.append(f"{this_resp} [cpf]")
+			# The Authority section is empty. [xdu]
+			if resp.get("authority"):
+				failure_reasons.append("Authority section was not empty [xdu]")
+			# The Additional section is empty. [mle]
+			if resp.get("additional"):
+				failure_reasons.append("Additional section was not empty [mle]")
+		elif (this_qname == ".") and (this_qtype == "SOA"):  # Processing for . / SOA [owf]
+			# The header AA bit is set. [xhr]
 			if not "AA" in resp["flags"]:
-				failure_reasons.append("AA bit was not set [gpl]")
-			# The Answer section is empty. [dvh]
-			if resp.get("answer"):
-				failure_reasons.append("Answer section was not empty [dvh]")
-			# The Authority section contains the signed . / SOA record. [axj]
+				failure_reasons.append("AA bit was not set [xhr]")
+			# The Answer section contains the signed SOA record for the root. [obw]
+			this_resp = check_for_signed_rr(resp["answer"], "SOA")
+			if this_resp:
+				failure_reasons.append(f"{this_resp} [obw]")
+			# The Authority section contains the signed NS RRset for the root, or is empty. [ktm]
+			#   The "or is empty" is added in v2.
 			if not resp.get("authority"):
-				failure_reasons.append("Authority section was empty [axj]")
+				debug(f"The Authority section was empty in {in_filename_record}")
 			else:
-				# Make sure the SOA record is for .
-				for this_rec_dict in resp["authority"]:
-					rec_qname = this_rec_dict["name"]
-					rec_qtype = this_rec_dict["rdtype"]
-					if rec_qtype == "SOA":
-						if not rec_qname == ".":
-							failure_reasons.append(f"SOA in Authority section had QNAME {rec_qname} instead of '.' [vcu]")
-				this_resp = check_for_signed_rr(resp["authority"], "SOA")
+				this_resp = check_for_signed_rr(resp["authority"], "NS")
 				if this_resp:
-					failure_reasons.append(f"{this_resp} [axj]")
-				# The Authority section contains a signed NSEC record whose owner name would appear before the QNAME and whose Next Domain Name field
-				#   would appear after the QNAME according to the canonical DNS name order defined in RFC4034, proving no records for QNAME exist in the zone. [czb]
-				#   Note that the query name might have multiple labels, so only compare against the last label
-				this_qname_TLD = this_qname.split(".")[-2] + "."
-				nsec_covers_query_name = False
-				nsecs_in_authority = set()
-				for this_rec_dict in resp["authority"]:
-					rec_qtype = this_rec_dict["rdtype"]
-					if rec_qtype == "NSEC":
-						# Just looking at the first NSEC record
-						rec_qname = this_rec_dict["name"]
-						rec_rdata = this_rec_dict["rdata"][0]
-						(next_name, _) = rec_rdata.split(" ", maxsplit=1)  # Ignore the type_bit_map
-						# Sorting against "." doesn't work, so instead use the longest TLD that could be in the root zone
-						if next_name == ".":
-							next_name = "zzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzz"
-						nsecs_in_authority.add(f"{rec_qname}|{next_name}")
-						# Make a list of the three strings, then make sure the original QNAME is in the middle
-						test_sort = sorted([rec_qname, next_name, this_qname_TLD])
-						if test_sort[1] == this_qname_TLD:
-							nsec_covers_query_name = True
-							break
-				if not nsec_covers_query_name:
-					failure_reasons.append(f"NSECs in Authority {nsecs_in_authority} did not cover qname {this_qname} [czb]")
-				# The Authority section contains a signed NSEC record with owner name “.” proving no wildcard exists in the zone. [jhz]
-				nsec_with_owner_dot = False
-				for this_rec_dict in resp["authority"]:
-					rec_qname = this_rec_dict["name"]
-					rec_qtype = this_rec_dict["rdtype"]
-					if rec_qtype == "NSEC":
-						if rec_qname == ".":
-							nsec_with_owner_dot = True
-							break;
-				if not 	nsec_with_owner_dot:
-					failure_reasons.append("Authority section did not contain a signed NSEC record with owner name '.' [jhz]")
-			# The Additional section is empty. [trw]
+					failure_reasons.append(f"{this_resp} [ktm]")
+		elif (this_qname == ".") and (this_qtype == "NS"):  # Processing for . / NS [amj]
+			# The header AA bit is set. [csz]
+			if not "AA" in resp["flags"]:
+				failure_reasons.append("AA bit was not set [csz]")
+			# The Answer section contains the signed NS RRset for the root. [wal]
+			this_resp = check_for_signed_rr(resp["answer"], "NS")
+			if this_resp:
+				failure_reasons.append(f"{this_resp} [wal]")
+			# The Authority section is empty. [eyk]
+			if resp.get("authority"):
+				failure_reasons.append("Authority section was not empty [eyk]")
+		elif (this_qname == ".") and (this_qtype == "DNSKEY"):  # Processing for . / DNSKEY [djd]
+			# The header AA bit is set. [occ]
+			if not "AA" in resp["flags"]:
+				failure_reasons.append("AA bit was not set [occ]")
+			# The Answer section contains the signed DNSKEY RRset for the root. [eou]
+			this_resp = check_for_signed_rr(resp["answer"], "DNSKEY")
+			if this_resp:
+				failure_reasons.append(f"{this_resp} [eou]")
+			# The Authority section is empty. [kka]
+			if resp.get("authority"):
+				failure_reasons.append("Authority section was not empty [kka]")
+			# The Additional section is empty. [jws]
 			if resp.get("additional"):
-				failure_reasons.append("Additional section was not empty [trw]")
+				failure_reasons.append("Additional section was not empty [jws]")
 		else:
-			failure_reasons.append("Response had a status other than NOERROR and NXDOMAIN")
-
-		# See if the results were all positive
-		#    Remove all entries which are blank
-		pared_failure_reasons = []
-		for this_element in failure_reasons:
-			if not this_element == "":
-				pared_failure_reasons.append(this_element)
-		failure_reason_text = "\n".join(pared_failure_reasons)
-		# If this was a test, just return the failure_reason_text
-		if opts.test:
-			return failure_reason_text
-		# If there is no failure reason, the record passed all correcteness tests
-		if failure_reason_text == "":
-			with conn.cursor() as cur:
-				cur.execute("update record_info set (is_correct, failure_reason) = (%s, %s) where filename_record = %s", ("y", "", in_filename_record))
-				return
-		elif this_is_correct == "r":
-			#       create table incorrect (filename_record text, root_checked text, has_been_checked boolean, failure_reason text);
-			# Update the record in the 'incorrect' table
-			with conn.cursor() as cur:
-				cur.execute("update incorrect set (has_been_checked, failure_reason) = (%s, %s) where filename_record = %s and root_checked = %s", \
-					("true", failure_reason_text, in_filename_record, this_retry_to_check))
-				return
+			debug(f"NOERROR on {this_qname}/{this_qtype} in {in_filename_record}")
+	elif resp["rcode"] == "NXDOMAIN":  # Processing for negative responses [vcu]
+		# The header AA bit is set. [gpl]
+		if not "AA" in resp["flags"]:
+			failure_reasons.append("AA bit was not set [gpl]")
+		# The Answer section is empty. [dvh]
+		if resp.get("answer"):
+			failure_reasons.append("Answer section was not empty [dvh]")
+		# The Authority section contains the signed . / SOA record. [axj]
+		if not resp.get("authority"):
+			failure_reasons.append("Authority section was empty [axj]")
 		else:
-			# Here if this_is_correct is "?", meaning this is the first check for this record
-			#  This will add a new set of records to the 'incorrect' table
-			# Get the starting date from the file name, then pick all zone files whose names have that date or the date from the 48 hours before [xog]
-			start_date = datetime.date(int(in_filename_record[0:4]), int(in_filename_record[4:6]), int(in_filename_record[6:8]))
-			start_date_minus_one = start_date - datetime.timedelta(days=1)
-			start_date_minus_two = start_date - datetime.timedelta(days=2)
-			soa_matching_date_files = []
-			for this_start in [start_date, start_date_minus_one, start_date_minus_two]:
-				soa_matching_date_files.extend(saved_matching_dir.glob(f"{this_start.strftime('%Y%m%d')}*.matching.pickle"))
-			# Create the records
+			# Make sure the SOA record is for .
+			for this_rec_dict in resp["authority"]:
+				rec_qname = this_rec_dict["name"]
+				rec_qtype = this_rec_dict["rdtype"]
+				if rec_qtype == "SOA":
+					if not rec_qname == ".":
+						failure_reasons.append(f"SOA in Authority section had QNAME {rec_qname} instead of '.' [vcu]")
+			this_resp = check_for_signed_rr(resp["authority"], "SOA")
+			if this_resp:
+				failure_reasons.append(f"{this_resp} [axj]")
+			# The Authority section contains a signed NSEC record whose owner name would appear before the QNAME and whose Next Domain Name field
+			#   would appear after the QNAME according to the canonical DNS name order defined in RFC4034, proving no records for QNAME exist in the zone. [czb]
+			#   The owner that covers the QNAME is found in the root zone's NSEC chain, then the NSEC in the response with that owner is checked
+			authority_nsecs = nsecs_by_owner(resp["authority"])
+			nsecs_in_authority = set(f"{rec_qname}|{next_name}" for (rec_qname, next_name, _) in authority_nsecs.values())
+			nsec_covers_query_name = False
+			covering_owner = root_zone_index.covering_nsec_owner(root_index, this_qname)
+			if covering_owner:
+				response_nsec = authority_nsecs.get(root_zone_index.canonical_name_key(covering_owner))
+				if response_nsec and root_zone_index.nsec_covers(response_nsec[0], response_nsec[1], this_qname):
+					nsec_covers_query_name = True
+			if not nsec_covers_query_name:
+				failure_reasons.append(f"NSECs in Authority {nsecs_in_authority} did not cover qname {this_qname} [czb]")
+			# The Authority section contains a signed NSEC record with owner name “.” proving no wildcard exists in the zone. [jhz]
+			if not root_zone_index.canonical_name_key(".") in authority_nsecs:
+				failure_reasons.append("Authority section did not contain a signed NSEC record with owner name '.' [jhz]")
+		# The Additional section is empty. [trw]
+		if resp.get("additional"):
+			failure_reasons.append("Additional section was not empty [trw]")
+	else:
+		failure_reasons.append("Response had a status other than NOERROR and NXDOMAIN")
+
+	end_stage("structure", stage_start)
+
+	# See if the results were all positive
+	#    Remove all entries which are blank
+	pared_failure_reasons = []
+	for this_element in failure_reasons:
+		if not this_element == "":
+			pared_failure_reasons.append(this_element)
+	failure_reason_text = "\n".join(pared_failure_reasons)
+	return failure_reason_text
+
+def process_one_correctness_test(this_resp_json):
+	# For --test, check one test response from the Tests directory against the fixed root in root_name_and_types.json
+	#   Returns the failure reasons as text, or "" if the response passed
+	#   Note that we have already os.chdir'd to the tests directory at this point
+	try:
+		resp = json.loads(this_resp_json)
+	except:
+		return "Could not un-JSON this test."
+	test_name = resp["test-on"]
+	if not test_name[0] in ("p", "n"):
+		return f"In {test_name}, the first letter was not 'p' or 'n'."
+	try:
+		root_to_check = json.load(open("root_name_and_types.json", mode="rb"))
+	except:
+		alert("While running under --test, could not find and un-json 'root_name_and_types.json'. Exiting.")
+		return
+	# Use the test ID instead of a filename_record so that errors come out more readable
+	return check_one_response(resp, root_to_check, root_zone_index.make_root_index(root_to_check), test_name)
+
+def process_one_correctness_group(in_group):
+	# Check the correctness of a group of C records that are all from the same response file and have the same likely_soa
+	#   in_group is (response file short name, likely_soa, list of (filename_record, timeout, is_correct))
+	#   The response file is unpickled once for the group, the root matching dicts come from load_root_matching(),
+	#   and all the results for the group are written in one transaction
+	#   Returns the number of records that were given a result
+	(response_short_name, this_soa_to_check, group_records) = in_group
+	count_stage("records", len(group_records))
+	# The date is part of every query on record_info and incorrect so that only the partition for that month is used
+	try:
+		this_date_derived = date_from_short_name(response_short_name)
+	except Exception as e:
+		alert(f"When checking correctness on {response_short_name}, could not get a date from the name: {e}")
+		return 0
+	# record_results is (filename_record, date_derived, is_correct, failure_reason) for record_info
+	record_results = []
+	# incorrect_results is (filename_record, date_derived, root_checked, failure_reason) for retries that failed again
+	incorrect_results = []
+	# incorrect_new_rows is (filename_record, date_derived, root_checked, has_been_checked, failure_reason) for first failures
+	incorrect_new_rows = []
+	# Before trying to load the pickled data, first see which are timeouts; for those, set is_correct but move on [lbl]
+	records_to_check = []
+	for (in_filename_record, this_timeout, this_is_correct) in group_records:
+		if not this_timeout == "":
+			record_results.append((in_filename_record, this_date_derived, "y", "timeout"))
+		elif not this_is_correct in ("r", "?"):
+			alert(f"Got unexpected value '{this_is_correct}' for is_correct in {in_filename_record}")
+		else:
+			records_to_check.append((in_filename_record, this_is_correct))
+	# The incorrect table might need its partition for this month; this uses the connection with autocommit, so it is done before the transaction
+	ensure_month_partitions(this_date_derived)
+	conn = get_worker_connection(autocommit=False)
+	# The results are only committed if all of them can be written; otherwise the records keep their is_correct and are checked again on the next run
+	try:
+		with conn:
 			with conn.cursor() as cur:
-				# Add the current (first) failure
-				cur.execute("insert into incorrect (filename_record, root_checked, has_been_checked, failure_reason) values (%s, %s, %s, %s)", \
-					(in_filename_record, this_soa_to_check, "true", failure_reason_text))
-				# Fill in templates for the other tests to be done
-				for this_root_file in soa_matching_date_files:
-					this_file_name = (this_root_file.name).replace(".matching.pickle", "")
-					cur.execute("insert into incorrect (filename_record, root_checked, has_been_checked, failure_reason) values (%s, %s, %s, %s)", \
-						(in_filename_record, this_file_name, "false", ""))
-			return
+				all_responses_in_file = {}
+				if records_to_check:
+					# Get the pickled responses for the whole file once
+					response_file = saved_response_dir / f"{response_short_name}.pickle"
+					stage_start = time.perf_counter()
+					try:
+						with response_file.open(mode="rb") as response_f:
+							all_responses_in_file = pickle.load(response_f)
+					except Exception as e:
+						alert(f"Could not unpickle {str(response_file)} when checking correctness on {len(records_to_check)} records from it: {e}")
+						records_to_check = []
+					end_stage("load_response", stage_start)
+				# For records with is_correct "r", get the list of possible roots that was filled in earlier for all of them at once
+				#   create table incorrect (filename_record text, date_derived timestamp, root_checked text, has_been_checked boolean, failure_reason text)
+				#     partition by range (date_derived);
+				retries_found = {}
+				retry_names = [ this_name for (this_name, this_is_correct) in records_to_check if this_is_correct == "r" ]
+				if retry_names:
+					stage_start = time.perf_counter()
+					cur.execute("select filename_record, root_checked, has_been_checked from incorrect where filename_record = any(%s) and date_derived = %s " +
+						"order by root_checked", (retry_names, this_date_derived))
+					for (this_name, this_root_checked, this_has_been_checked) in cur:
+						retries_found.setdefault(this_name, []).append((this_root_checked, this_has_been_checked))
+					end_stage("select", stage_start)
+				for (in_filename_record, this_is_correct) in records_to_check:
+					try:
+						resp = all_responses_in_file[in_filename_record]
+					except:
+						alert(f"When checking correctness, could not find key {in_filename_record} in file {response_short_name}.pickle")
+						continue
+					# root_to_check holds the contents of the root to check in this round (not just the names)
+					#   For is_correct "?", it is just the root associated with the likely_soa
+					#   For is_correct "r", it is one of the roots from the "incorrect" table that has not been checked yet
+					#     That table has the likely_soa, and the roots for 48 hours before likely_soa
+					if this_is_correct == "r":
+						these_retries = retries_found.get(in_filename_record, [])
+						if len(these_retries) == 0:
+							alert(f"When looking for retries on {in_filename_record}, found nothing in the 'incorrect' table when there should have been more than one record")
+							continue
+						unchecked_roots = [ this_root_checked for (this_root_checked, this_has_been_checked) in these_retries if not this_has_been_checked ]
+						if not unchecked_roots:
+							# All the retries have been tested, report failure
+							tried_string = " ".join(this_root_checked for (this_root_checked, _) in these_retries)
+							record_results.append((in_filename_record, this_date_derived, "n", f"Tried root files {tried_string} but all had failures; see 'incorrect' table"))
+							continue
+						this_root_checked = unchecked_roots[0]
+					else:
+						this_root_checked = this_soa_to_check
+					one_root_file = saved_matching_dir / f"{this_root_checked}.matching.pickle"
+					# Try to read the file and unpickle it
+					if not one_root_file.exists():
+						# Just move on, leaving the is_correct as it was so it will get caught on the next run
+						alert(f"When checking correctness on {in_filename_record}, could not find root file {str(one_root_file)}")
+						continue
+					stage_start = time.perf_counter()
+					try:
+						(root_to_check, root_index) = load_root_matching(one_root_file)
+					except:
+						alert(f"Could not unpickle root file {str(one_root_file)} while processing {in_filename_record} for correctness")
+						continue
+					end_stage("load_root", stage_start)
+					try:
+						failure_reason_text = check_one_response(resp, root_to_check, root_index, in_filename_record)
+					except Exception as e:
+						alert(f"Checking correctness on {in_filename_record} against {this_root_checked} raised '{e}'")
+						continue
+					# If there is no failure reason, the record passed all correcteness tests
+					if failure_reason_text == "":
+						record_results.append((in_filename_record, this_date_derived, "y", ""))
+					elif this_is_correct == "r":
+						# Update the record in the 'incorrect' table; the record will be tried against the next root on the next run
+						incorrect_results.append((in_filename_record, this_date_derived, this_root_checked, failure_reason_text))
+					else:
+						# Here if this_is_correct is "?", meaning this is the first check for this record
+						#  This will add a new set of records to the 'incorrect' table, and mark the record as "r" so that the other roots are tried
+						# Get the starting date from the file name, then pick all zone files whose names have that date or the date from the 48 hours before [xog]
+						start_date = datetime.date(int(in_filename_record[0:4]), int(in_filename_record[4:6]), int(in_filename_record[6:8]))
+						# Add the current (first) failure
+						incorrect_new_rows.append((in_filename_record, this_date_derived, this_soa_to_check, True, failure_reason_text))
+						# Fill in templates for the other tests to be done
+						for this_start in [start_date, start_date - datetime.timedelta(days=1), start_date - datetime.timedelta(days=2)]:
+							for this_root_file in sorted(saved_matching_dir.glob(f"{this_start.strftime('%Y%m%d')}*.matching.pickle")):
+								this_file_name = (this_root_file.name).replace(".matching.pickle", "")
+								if not this_file_name == this_soa_to_check:
+									incorrect_new_rows.append((in_filename_record, this_date_derived, this_file_name, False, ""))
+						record_results.append((in_filename_record, this_date_derived, "r", ""))
+				# Write all the results for the group
+				stage_start = time.perf_counter()
+				if incorrect_new_rows:
+					psycopg2.extras.execute_values(cur, "insert into incorrect (filename_record, date_derived, root_checked, has_been_checked, failure_reason) values %s",
+						incorrect_new_rows, page_size=len(incorrect_new_rows))
+				if incorrect_results:
+					psycopg2.extras.execute_values(cur, "update incorrect set (has_been_checked, failure_reason) = (true, checked.failure_reason) " +
+						"from (values %s) as checked (filename_record, date_derived, root_checked, failure_reason) " +
+						"where incorrect.filename_record = checked.filename_record and incorrect.date_derived = checked.date_derived " +
+						"and incorrect.root_checked = checked.root_checked", incorrect_results, template="(%s, %s::timestamp, %s, %s)", page_size=len(incorrect_results))
+				if record_results:
+					psycopg2.extras.execute_values(cur, "update record_info set (is_correct, failure_reason) = (checked.is_correct, checked.failure_reason) " +
+						"from (values %s) as checked (filename_record, date_derived, is_correct, failure_reason) " +
+						"where record_info.filename_record = checked.filename_record and record_info.date_derived = checked.date_derived",
+						record_results, template="(%s, %s::timestamp, %s, %s)", page_size=len(record_results))
+				end_stage("update", stage_start)
+	except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+		close_worker_connection()
+		alert(f"Lost the database connection while checking correctness on {len(group_records)} records from {response_short_name}: '{e}'")
+		return 0
+	except Exception as e:
+		alert(f"Failed to write the correctness results for {len(group_records)} records from {response_short_name}: '{e}'")
+		return 0
+	return len(record_results) + len(incorrect_results)
 
 ###############################################################
 
@@ -750,6 +1634,18 @@ if __name__ == "__main__":
 		help="Run tests on requests; must be run in the Tests directory")
 	this_parser.add_argument("--debug", action="store_true", dest="debug",
 		help=f"Limit procesing to {limit_size} incoming files and/or correctness items")
+	this_parser.add_argument("--full_scan", action="store_true", dest="full_scan",
+		help="Look at every incoming file on disk instead of only those past the per-VP high-water marks")
+	this_parser.add_argument("--daemon", action="store_true", dest="daemon",
+		help="Keep running, ingesting incoming files as they arrive instead of once per run")
+	this_parser.add_argument("--to_files", action="store", dest="to_files",
+		help="Write the records for the incoming files to CSV files in this directory instead of the database")
+	this_parser.add_argument("--from_dir", action="store", dest="from_dir",
+		help=f"For --to_files, read the incoming files from this directory instead of {incoming_dir}")
+	this_parser.add_argument("--rebuild_rollups", action="store_true", dest="rebuild_rollups",
+		help="Recompute the rollup tables from record_info, then exit")
+	this_parser.add_argument("--poll_seconds", action="store", dest="poll_seconds", type=int, default=10,
+		help="For --daemon, how often to look for new files if inotify is not available")
 	
 	opts = this_parser.parse_args()
 
@@ -766,32 +1662,75 @@ if __name__ == "__main__":
 
 	log("Started collector processing")
 
+	# Rebuilding the rollups is only done from the command line. Exits when done.
+	if opts.rebuild_rollups:
+		rebuild_rollups()
+		exit()
+
+	# Writing the records to files does not use the database. Exits when done.
+	if opts.to_files:
+		run_to_files()
+		exit()
+
+	# The daemon does the ingest part of the processing continuously. Exits when it gets a signal.
+	if opts.daemon:
+		run_ingest_daemon()
+		exit()
+
 	###############################################################
 
 	# Go through the files in incoming_dir
 	processed_incoming_start = time.time()
-	# Create a list of incoming files. The keys are the short name (no path, no .tar.gz), the values are the full path
-	all_files = { (x.name).replace(".pickle.gz", ""): x for x in Path(f"{incoming_dir}").glob("**/*.pickle.gz") }
-	# Compare this list to the list of those already processed
-	with psycopg2.connect(dbname="metrics", user="metrics") as conn:
+	# Hold the ingest lock until this run exits; cron starts the next run anyway, so a run during a rollup rebuild just stops
+	ingest_lock_conn = hold_ingest_lock(None, wait=False)
+	if ingest_lock_conn is None:
+		log("Not ingesting in this run because the rollup tables are being rebuilt")
+		exit()
+	high_water_marks = get_high_water_marks()
+	with psycopg2.connect(dbname=database_name, user="metrics") as conn:
 		with conn.cursor() as cur:
-			cur.execute("select filename_short from files_gotten")
-			this_fetch = cur.fetchall()
-			all_in_db = list(this_fetch)
-	for this_db_tuple in all_in_db:
-		this_db_name = this_db_tuple[0]
-		if this_db_name in all_files:
-			all_files.pop(this_db_name)
-	log(f"Found {len(all_files)} files on disk, {len(all_in_db)} files in the database, left with {len(all_files)} files after culling")
-	all_file_paths = all_files.values()
+			if opts.full_scan:
+				# Look at every file on disk and compare it with the list of those already processed
+				#   This is only needed if the ingest_high_water table has been lost or the database was restored
+				#   Create a list of incoming files. The keys are the short name (no path, no .pickle.gz), the values are the full path
+				all_files = { (x.name).replace(".pickle.gz", ""): x for x in Path(f"{incoming_dir}").glob("**/*.pickle.gz") }
+				cur.execute("select filename_short from files_gotten")
+				this_fetch = cur.fetchall()
+				all_in_db = list(this_fetch)
+				for this_db_tuple in all_in_db:
+					this_db_name = this_db_tuple[0]
+					if this_db_name in all_files:
+						all_files.pop(this_db_name)
+				log(f"Found {len(all_in_db)} files in the database, left with {len(all_files)} files after culling")
+			else:
+				# Only look at files newer than the newest file already ingested for each VP, and files in the look-back window that were not ingested
+				all_files = find_new_incoming_files(high_water_marks, get_recent_known_files(high_water_marks))
+				log(f"Found {len(all_files)} new files on disk past the high-water marks for {len(high_water_marks)} VPs")
+	# Start with the newest file from each VP so that the most recent data is in the database first
+	all_short_names = order_newest_first(all_files)
 	if opts.debug:
-		all_file_paths = list(all_file_paths)[0:limit_size]
+		all_short_names = all_short_names[0:limit_size]
 		log(f"Only processing {limit_size} incoming files due to presence of --debug")
+	all_file_paths = [ all_files[x] for x in all_short_names ]
 	processed_incoming_count = 0
-	with futures.ProcessPoolExecutor() as executor:
-		for (this_file, _) in zip(all_file_paths, executor.map(process_one_incoming_file, all_file_paths, chunksize=1000)):
+	not_finished_count = 0
+	# Files that are not processed in this run (such as under --debug) count as not finished so the marks do not move past them
+	processed_results = { x: False for x in all_files }
+	ingest_stats = new_pipeline_stats()
+	with futures.ProcessPoolExecutor(initializer=init_worker_connection) as executor:
+		for (this_file_path, this_finished, this_item_stats) in run_in_pool(executor, process_one_incoming_file, all_file_paths, max_pool_in_flight()):
 			processed_incoming_count += 1
-	log(f"Finished processing {processed_incoming_count} incoming files in {int(time.time() - processed_incoming_start)} seconds")
+			add_item_stats(ingest_stats, this_item_stats)
+			processed_results[(this_file_path.name).replace(".pickle.gz", "")] = bool(this_finished)
+			if not this_finished:
+				not_finished_count += 1
+	# Move the high-water mark for each VP forward
+	save_high_water_marks(advance_high_water_marks(list(processed_results.items()), high_water_marks))
+	if not_finished_count > 0:
+		alert(f"{not_finished_count} incoming files could not be ingested and will be tried again on the next run")
+	ingest_summary = write_pipeline_metrics("ingest", ingest_stats, time.time() - processed_incoming_start)
+	log(f"Finished processing {processed_incoming_count} incoming files in {int(time.time() - processed_incoming_start)} seconds; " \
+		+ f"{ingest_summary['items_per_second']} files/s, {ingest_summary['rows_per_second']} rows/s, stage seconds {ingest_summary['stage_seconds']}")
 	
 	###############################################################
 	
@@ -810,20 +1749,32 @@ if __name__ == "__main__":
 	processed_correctness_count = 0
 
 	# Iterate over the new records where is_correct is "?" or "r"
-	with psycopg2.connect(dbname="metrics", user="metrics") as conn:
+	with psycopg2.connect(dbname=database_name, user="metrics") as conn:
 		with conn.cursor() as cur:
-			cur.execute("select filename_record from record_info where record_type = 'C' and (is_correct = '?' or is_correct = 'r')")
+			cur.execute("select filename_record, timeout, likely_soa, is_correct from record_info where record_type = 'C' and (is_correct = '?' or is_correct = 'r')")
 			correct_to_check = cur.fetchall()
 	log(f"At the start of correctness checking, found {len(correct_to_check)} records with '?' or 'r'")
-	# Make a list of tuples with the filename_record
-	full_correctness_list = []
-	for this_correct in correct_to_check:
-		full_correctness_list.append(("normal", this_correct[0]))
+	# Group the records by response file and likely_soa so that each worker loads the responses and the root for a group only once
+	#   The groups are sorted by SOA so that the workers' root matching caches are used as much as possible
+	correctness_groups = {}
+	for (this_filename_record, this_timeout, this_likely_soa, this_is_correct) in correct_to_check:
+		this_response_short_name = "-".join(this_filename_record.split("-")[0:2])
+		correctness_groups.setdefault((this_response_short_name, this_likely_soa), []).append((this_filename_record, this_timeout, this_is_correct))
+	full_correctness_list = [ (this_response_short_name, this_likely_soa, correctness_groups[(this_response_short_name, this_likely_soa)]) \
+		for (this_response_short_name, this_likely_soa) in sorted(correctness_groups, key=lambda x: (x[1], x[0])) ]
 	# If limit is set, use only the first few
 	if opts.debug:
 		full_correctness_list = full_correctness_list[0:limit_size]
-	with futures.ProcessPoolExecutor() as executor:
-		for (this_correctness, _) in zip(full_correctness_list, executor.map(process_one_correctness_tuple, full_correctness_list, chunksize=1000)):
-			processed_correctness_count += 1
+	correctness_stats = new_pipeline_stats()
+	with futures.ProcessPoolExecutor(initializer=init_worker_connection) as executor:
+		for (_, this_correctness_count, this_item_stats) in run_in_pool(executor, process_one_correctness_group, full_correctness_list, max_pool_in_flight()):
+			if this_correctness_count:
+				processed_correctness_count += this_correctness_count
+			add_item_stats(correctness_stats, this_item_stats)
+	write_pipeline_metrics("correctness", correctness_stats, time.time() - processed_correctness_start)
+	log(f"Root matching cache in the correctness workers had {correctness_stats['counts'].get('root_cache_hits', 0)} hits " +
+		f"and {correctness_stats['counts'].get('root_cache_misses', 0)} misses")
+	log(f"DNSSEC validation cache in the correctness workers had {correctness_stats['counts'].get('dnssec_cache_hits', 0)} hits " +
+		f"and {correctness_stats['counts'].get('dnssec_cache_misses', 0)} misses")
 	log(f"Finished correctness checking {processed_correctness_count} records in {int(time.time() - processed_correctness_start)} seconds; finished processing")
 	exit()
@@ -0,0 +1,107 @@
+-- Tables and indexes in the metrics database on the collector
+--   Ansible/collector_building.yml runs this with psql, and Tests/benchmark_ingest.py runs it in its scratch database,
+--   so this is the only place that the schema is written down
+-- Every statement can be run again on a database that already has the tables, so this is also how the schema is updated
+
+-- Files that have been ingested
+create table if not exists files_gotten (filename_short text, processed_at timestamp, version int, delay int, elapsed int);
+create index if not exists filename_short_idx on files_gotten (filename_short);
+-- Remove duplicate rows in files_gotten left by ingests from before the unique index existed
+delete from files_gotten a using files_gotten b where a.filename_short = b.filename_short and a.ctid > b.ctid;
+-- Unique index in files_gotten so that re-ingesting a file is a no-op
+create unique index if not exists filename_short_unique_idx on files_gotten (filename_short);
+
+-- Per-VP high-water marks of ingested files
+create table if not exists ingest_high_water (vp text primary key, last_filename text);
+-- On a collector that ingested files before the marks existed, start each VP's mark at the newest file already ingested,
+--   so the first run does not read every file in ~/Incoming again; marks that are already there are not changed
+insert into ingest_high_water (vp, last_filename) select split_part(filename_short, '-', 2), max(filename_short) from files_gotten group by 1
+	on conflict do nothing;
+-- Incoming files that will not be ingested, because they could not be read for a long time or could never be ingested
+create table if not exists ingest_quarantine (filename_short text primary key, quarantined_at timestamp, reason text);
+
+-- Collectors set up before record_info and incorrect were partitioned have them as plain tables
+--   Those are renamed here so that the partitioned tables are made below, and their rows are copied in after the indexes are made
+do $$
+begin
+	if (select relkind from pg_class where oid = to_regclass('record_info')) = 'r' then
+		alter table record_info rename to record_info_unpartitioned;
+	end if;
+	if (select relkind from pg_class where oid = to_regclass('incorrect')) = 'r' then
+		alter table incorrect rename to incorrect_unpartitioned;
+	end if;
+end $$;
+
+-- SOA and correctness records, partitioned by month; collector_processing.py creates the partitions
+create table if not exists record_info (filename_record text, date_derived timestamp, target text, internet text, transport text,
+	ip_addr text, record_type text, query_elapsed real, timeout text, soa_found text, likely_soa text, is_correct text, failure_reason text)
+	partition by range (date_derived);
+-- Unique index in record_info so that re-ingesting a file is a no-op; it has to include the partition key
+create unique index if not exists record_info_filename_record_unique_idx on record_info (filename_record, date_derived);
+-- The records that still need correctness checking
+create index if not exists record_info_unchecked_idx on record_info (filename_record) where is_correct in ('?', 'r');
+-- The report queries always select one record type over a date range
+create index if not exists record_info_type_date_idx on record_info (record_type, date_derived);
+
+-- Incorrectness records, partitioned by month; collector_processing.py creates the partitions
+create table if not exists incorrect (filename_record text, date_derived timestamp, root_checked text, has_been_checked boolean,
+	failure_reason text) partition by range (date_derived);
+create index if not exists incorrect_filename_record_idx on incorrect (filename_record, date_derived);
+
+-- Copy the rows of tables that were renamed above into the partitioned tables, making the partitions for the months they cover
+--   "on conflict do nothing" with the unique index drops duplicate records left by ingests from before the unique index existed
+--   The unpartitioned incorrect table did not have date_derived, so it is made from the YYYYMMDDHHMM at the start of filename_record,
+--   the same way collector_processing.py makes it
+--   Each block is one transaction, so the old table is only dropped if all of its rows were copied
+do $$
+declare
+	this_month timestamp;
+begin
+	if to_regclass('record_info_unpartitioned') is not null then
+		for this_month in select distinct date_trunc('month', date_derived) from record_info_unpartitioned loop
+			execute format('create table if not exists %I partition of record_info for values from (%L) to (%L)',
+				'record_info_' || to_char(this_month, 'YYYY_MM'), this_month, this_month + interval '1 month');
+		end loop;
+		insert into record_info (filename_record, date_derived, target, internet, transport, ip_addr, record_type, query_elapsed, timeout,
+			soa_found, likely_soa, is_correct, failure_reason)
+			select filename_record, date_derived, target, internet, transport, ip_addr, record_type, query_elapsed, timeout,
+			soa_found, likely_soa, is_correct, failure_reason from record_info_unpartitioned on conflict do nothing;
+		drop table record_info_unpartitioned;
+	end if;
+end $$;
+do $$
+declare
+	this_month timestamp;
+begin
+	if to_regclass('incorrect_unpartitioned') is not null then
+		for this_month in select distinct date_trunc('month', to_timestamp(substr(filename_record, 1, 12), 'YYYYMMDDHH24MI')::timestamp)
+			from incorrect_unpartitioned loop
+			execute format('create table if not exists %I partition of incorrect for values from (%L) to (%L)',
+				'incorrect_' || to_char(this_month, 'YYYY_MM'), this_month, this_month + interval '1 month');
+		end loop;
+		insert into incorrect (filename_record, date_derived, root_checked, has_been_checked, failure_reason)
+			select filename_record, to_timestamp(substr(filename_record, 1, 12), 'YYYYMMDDHH24MI')::timestamp, root_checked, has_been_checked, failure_reason
+			from incorrect_unpartitioned;
+		drop table incorrect_unpartitioned;
+	end if;
+end $$;
+
+-- Rollup of RSI availability and latency per RSI, internet/transport pair, 5-minute interval, and VP
+create table if not exists rsi_interval_rollup (rsi text, internet text, transport text, interval_start timestamp, vp text,
+	answered int, measured int, latency_count int, latency_sum double precision, soa_found text,
+	primary key (rsi, internet, transport, interval_start, vp));
+-- Mergeable latency sketches per RSI (or "rss"), internet/transport pair, and 5-minute interval
+create table if not exists latency_sketch (sketch_of text, internet text, transport text, interval_start timestamp,
+	latency_count int, buckets jsonb, primary key (sketch_of, internet, transport, interval_start));
+-- BRIN indexes on interval_start in the rollup tables; rows are added in roughly time order, so these stay small
+create index if not exists rsi_interval_rollup_interval_brin_idx on rsi_interval_rollup using brin (interval_start);
+create index if not exists latency_sketch_interval_brin_idx on latency_sketch using brin (interval_start);
+-- The times the rollup tables were rebuilt, so that reports know their daily cache is out of date
+create table if not exists rollup_rebuilds (rebuilt_at timestamp);
+-- The first time each SOA was seen from any RSI, and from each RSI on each internet/transport pair, for publication latency
+create table if not exists soa_first_seen (soa text primary key, first_seen timestamp);
+create table if not exists soa_pair_first_seen (soa text, rsi text, internet text, transport text, first_seen timestamp,
+	primary key (soa, rsi, internet, transport));
+-- RSI responses per VP, 5-minute interval, and internet/transport pair, for RSS availability
+create table if not exists rss_interval_availability (vp text, interval_start timestamp, internet text, transport text,
+	rsi_answered int, rsi_measured int, primary key (interval_start, vp, internet, transport));
@@ -5,6 +5,7 @@
 
 import argparse, logging, os, pickle, re, requests
 from pathlib import Path
+import root_zone_index
 
 def cleanup(text_from_zone_file):
 	''' Clean up the text by collapsing whitespaces and removing comments '''
@@ -103,6 +104,10 @@ if __name__ == "__main__":
 				matching_file_name = f"{saved_matching_dir}/{this_soa}.matching.pickle"
 				with open(matching_file_name, mode="wb") as out_f:
 					pickle.dump(root_name_and_types, out_f)
+				# Create the canonical index for correctness checking
+				index_file_name = f"{saved_matching_dir}/{this_soa}.index.pickle"
+				with open(index_file_name, mode="wb") as out_f:
+					pickle.dump(root_zone_index.make_root_index(root_name_and_types), out_f)
 		exit("Done rdoing all the output processing")
 
 	# Get the current root zone
@@ -131,3 +136,8 @@ if __name__ == "__main__":
 		matching_file_name = f"{saved_matching_dir}/{this_soa}.matching.pickle"
 	with open(matching_file_name, mode="wb") as out_f:
 		pickle.dump(root_name_and_types, out_f)
+	# Write out the canonical index of the zone, which is only used for correctness checking on the collector
+	if not opts.vp:
+		index_file_name = f"{saved_matching_dir}/{this_soa}.index.pickle"
+		with open(index_file_name, mode="wb") as out_f:
+			pickle.dump(root_zone_index.make_root_index(root_name_and_types), out_f)
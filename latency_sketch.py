@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+''' Mergeable latency sketches for RSSAC047 response latency, shared by collector_processing.py and report_creator.py '''
+# Three-letter items in square brackets (such as [xyz]) refer to parts of rssac-047.md
+
+# A sketch is a dict of bucket number (as a string, so that it can be stored as JSON) to count of latencies in that bucket
+#   The buckets are logarithmic: bucket i holds latencies in (lowest_latency * growth^(i-1), lowest_latency * growth^i]
+#   Anything at or below lowest_latency goes in bucket 0
+# Sketches are merged by adding the counts in each bucket, so sketches for any set of intervals can be combined in any order
+# Every value read back from a sketch (a median, a mean, or a lowest-k value) is within sketch_relative_error of the true value
+#   of a latency in the same bucket; with growth of 1.02, that is under 1%, which is well under the precision used in the reports
+
+import math
+
+lowest_latency = 0.0001
+growth = 1.02
+sketch_relative_error = (growth - 1) / (growth + 1)
+
+# RSS response latency uses the lowest k RSI latencies for each vantage point in each interval [bom]
+#   k is from Section 4.9 of RSSAC-047; this must match rss_k in report_creator.py
+rss_k = math.ceil((13 - 1) * float(2/3))
+
+def latency_bucket(this_latency):
+	# Returns the bucket number for a latency in seconds
+	if this_latency <= lowest_latency:
+		return 0
+	return math.ceil(math.log(this_latency / lowest_latency) / math.log(growth))
+
+def bucket_latency(this_bucket):
+	# Returns the latency that represents a bucket; this is the value that has the same relative error to both edges of the bucket
+	upper_edge = lowest_latency * (growth ** this_bucket)
+	return 2 * upper_edge / (growth + 1)
+
+def add_latency(this_sketch, this_latency):
+	# Adds one latency to a sketch
+	this_key = str(latency_bucket(this_latency))
+	this_sketch[this_key] = this_sketch.get(this_key, 0) + 1
+
+def make_sketch(latencies):
+	# Returns a new sketch from a list of latencies
+	this_sketch = {}
+	for this_latency in latencies:
+		add_latency(this_sketch, this_latency)
+	return this_sketch
+
+def merge_sketch(into_sketch, other_sketch):
+	# Adds the counts of other_sketch into into_sketch
+	for (this_key, this_count) in other_sketch.items():
+		into_sketch[this_key] = into_sketch.get(this_key, 0) + this_count
+
+def sketch_count(this_sketch):
+	return sum(this_sketch.values())
+
+def sketch_quantile(this_sketch, this_fraction):
+	# Returns the latency at this_fraction (such as 0.5 for the median) of the sketch, interpolating like statistics.median does for even counts
+	#   Returns None for an empty sketch
+	total_count = sketch_count(this_sketch)
+	if total_count == 0:
+		return None
+	this_rank = this_fraction * (total_count - 1)
+	(lower_rank, upper_rank) = (math.floor(this_rank), math.ceil(this_rank))
+	(lower_value, upper_value) = (None, None)
+	seen_count = 0
+	for this_bucket in sorted(int(x) for x in this_sketch):
+		seen_count += this_sketch[str(this_bucket)]
+		if lower_value is None and seen_count > lower_rank:
+			lower_value = bucket_latency(this_bucket)
+		if seen_count > upper_rank:
+			upper_value = bucket_latency(this_bucket)
+			break
+	return lower_value + (upper_value - lower_value) * (this_rank - lower_rank)
+
+def sketch_mean(this_sketch):
+	# Returns the mean latency of the sketch, or None for an empty sketch
+	total_count = sketch_count(this_sketch)
+	if total_count == 0:
+		return None
+	return sum(bucket_latency(int(this_key)) * this_count for (this_key, this_count) in this_sketch.items()) / total_count
@@ -4,8 +4,10 @@
 # Run as the metrics user
 # Three-letter items in square brackets (such as [xyz]) refer to parts of rssac-047.md
 
-import argparse, datetime, glob, logging, math, os, psycopg2, statistics
+import argparse, csv, datetime, glob, logging, math, os, pickle, psycopg2, statistics
 from pathlib import Path
+from concurrent import futures
+import latency_sketch
 
 if __name__ == "__main__":
 	# Get the base for the log directory
@@ -51,11 +53,27 @@ if __name__ == "__main__":
 		help="Create a report for the previous month")
 	this_parser.add_argument("--thisweek", action="store_true", dest="thisweek",
 		help="Create a report for just the current week")
+	this_parser.add_argument("--range", nargs=2, action="store", dest="range", metavar=("FIRST_DAY", "LAST_DAY"),
+		help="Create a report for a custom range of whole days, given as YYYY-MM-DD YYYY-MM-DD")
+	this_parser.add_argument("--backfill", nargs=2, action="store", dest="backfill", metavar=("FIRST_DAY", "LAST_DAY"),
+		help="Create all the monthly and weekly reports for whole months and weeks in a range of days, given as YYYY-MM-DD YYYY-MM-DD")
+	this_parser.add_argument("--check_queries", action="store_true", dest="check_queries",
+		help="Check the query plans of the report queries with EXPLAIN, then exit")
+	this_parser.add_argument("--rss_hourly", action="store_true", dest="rss_hourly",
+		help="Also write the RSS availability for each hour of each report to a CSV file in ~/Output/Hourly")
 	this_parser.add_argument("--force", action="store_true", dest="force",
-		help="Force the monthly report to be recreated if it already exists")
+		help="Force the monthly report (or the reports for --backfill) to be recreated if it already exists")
+	this_parser.add_argument("--from_records", action="store_true", dest="from_records",
+		help="Collate the metrics from record_info in one streaming pass instead of from the rollup tables")
+	this_parser.add_argument("--columnar", action="store_true", dest="columnar",
+		help="Collate the metrics from record_info with NumPy column arrays, giving full-precision medians")
 	opts = this_parser.parse_args()
-	if not (opts.lastmonth or opts.thisweek):
-		die("Need to specify either --lastmonth or --thisweek")
+	if not (opts.lastmonth or opts.thisweek or opts.range or opts.backfill or opts.check_queries):
+		die("Need to specify either --lastmonth, --thisweek, --range, --backfill, or --check_queries")
+	if opts.from_records and opts.columnar:
+		die("Can only specify one of --from_records and --columnar")
+	if opts.backfill and (opts.from_records or opts.columnar):
+		die("--backfill uses the rollup tables and the daily cache, so it cannot be used with --from_records or --columnar")
 
 	# Subdirectories of ~/Output for the reports
 	output_dir = f"{str(Path('~').expanduser())}/Output"
@@ -67,8 +85,14 @@ if __name__ == "__main__":
 	weekly_reports_dir = f"{output_dir}/Weekly"
 	if not os.path.exists(weekly_reports_dir):
 		os.mkdir(weekly_reports_dir)
-
-	report_type = "monthly" if opts.lastmonth else "weekly"
+	custom_reports_dir = f"{output_dir}/Custom"
+	if not os.path.exists(custom_reports_dir):
+		os.mkdir(custom_reports_dir)
+	hourly_dir = f"{output_dir}/Hourly"
+	if not os.path.exists(hourly_dir):
+		os.mkdir(hourly_dir)
+
+	report_type = "monthly" if opts.lastmonth else "weekly" if opts.thisweek else "custom" if opts.range else "backfill" if opts.backfill else "query check"
 	log(f"Started {report_type} report process")
 	
 	##############################################################
@@ -78,7 +102,28 @@ if __name__ == "__main__":
 	strf_timestamp_format = "%Y-%m-%d %H:%M:%S"
 	strf_fielename_format = "%Y-%m-%d-%H-%M-%S"
 	
-	if opts.thisweek:
+	if opts.check_queries:
+		pass
+	elif opts.backfill:
+		try:
+			backfill_first_day = datetime.datetime.strptime(opts.backfill[0], strf_day_format)
+			backfill_last_day = datetime.datetime.strptime(opts.backfill[1], strf_day_format)
+		except Exception as e:
+			die(f"Could not parse --backfill {opts.backfill[0]} {opts.backfill[1]} as YYYY-MM-DD YYYY-MM-DD: {e}")
+		if backfill_last_day < backfill_first_day:
+			die(f"The last day of --backfill, {opts.backfill[1]}, is before the first day, {opts.backfill[0]}")
+	elif opts.range:
+		try:
+			first_day = datetime.datetime.strptime(opts.range[0], strf_day_format)
+			last_day = datetime.datetime.strptime(opts.range[1], strf_day_format)
+		except Exception as e:
+			die(f"Could not parse --range {opts.range[0]} {opts.range[1]} as YYYY-MM-DD YYYY-MM-DD: {e}")
+		if last_day < first_day:
+			die(f"The last day of --range, {opts.range[1]}, is before the first day, {opts.range[0]}")
+		report_start_timestamp = first_day.strftime(strf_timestamp_format)
+		report_end_timestamp = (last_day + datetime.timedelta(days=1, seconds=-1)).strftime(strf_timestamp_format)
+		new_report_name = f"{custom_reports_dir}/custom-{opts.range[0]}-to-{opts.range[1]}.txt"
+	elif opts.thisweek:
 		now = datetime.datetime.utcnow()
 		week_ago = now + datetime.timedelta(days=-7)
 		report_start_timestamp = week_ago.strftime(strf_timestamp_format)
@@ -124,7 +169,8 @@ if __name__ == "__main__":
 		report_start_timestamp = first_of_last_month.strftime(strf_timestamp_format)
 		report_end_timestamp = end_of_last_month.strftime(strf_timestamp_format)
 		new_report_name = f"{monthly_reports_dir}/monthly-{first_of_last_month_file}.txt"
-	log(f"About to create {new_report_name} for range {report_start_timestamp} to {report_end_timestamp}")
+	if not (opts.backfill or opts.check_queries):
+		log(f"About to create {new_report_name} for range {report_start_timestamp} to {report_end_timestamp}")
 
 	##############################################################
 
@@ -133,382 +179,805 @@ if __name__ == "__main__":
 	# Note that the database uses "target" for the RSIs, which this program uses "rsi"
 
 	# RSS availability and response latency use the value k defined in Section 4.9 of RSSAC-047
+	#   This must match rss_k in latency_sketch.py, which is used when the RSS latency sketches are made during ingest
 	rss_k = math.ceil((len(rsi_list) - 1) * float(2/3))
 	
 	# The following is used for keeping track of the internet/transport pairs, and the way they are expressed in the report
 	report_pairs = { "v4udp": "IPv4 UDP", "v4tcp": "IPv4 TCP", "v6udp": "IPv6 UDP", "v6tcp": "IPv6 TCP" }
 
-	# Make a list of vantage points for the RSS reports
-	vp_list_file = f"{str(Path('~').expanduser())}/repo/vp_list.txt"
-	if not os.path.exists(vp_list_file):
-		die(f"Could not find {vp_list_file}")
-	vp_names = []
-	with open(vp_list_file, mode="rt") as vp_f:
-		for this_line in vp_f:
-			(vp_name, _, _) = this_line.split(".")
-			vp_names.append(vp_name)
-	
 	##############################################################
 
-	# Get the records from the database
-	with psycopg2.connect(dbname="metrics", user="metrics") as conn:
-		with conn.cursor() as cur:
-			# Set the dates for the search
-			where_date = f"where date_derived between '{report_start_timestamp}' and  '{report_end_timestamp}' "
-
-			# Get all the SOA records for this period
-			cur.execute("select filename_record, target, internet, transport, query_elapsed, timeout, soa_found, date_derived from record_info " +
-				f"{where_date} and record_type = 'S' order by date_derived")
-			soa_recs = cur.fetchall()
-			
-	
-			# Get all the correctness records for this period
-			cur.execute("select filename_record, target, is_correct from record_info " +
-				f"{where_date} and record_type = 'C' order by date_derived")
-			correctness_recs = cur.fetchall()
-			
-			# Get all the failed correctness records to report in the additional section
-			cur.execute("select filename_record, target, internet, transport, failure_reason from record_info " +
-				f"{where_date} and record_type = 'C' and is_correct = 'n' order by date_derived")
-			correctness_failures = cur.fetchall()
-		
-	log(f"Found {len(soa_recs)} SOA records and {len(correctness_recs)} correctness records for {report_start_timestamp} to {report_end_timestamp}")
-		
-	# Create dicts from the lists so that we can add derived values
-	soa_dict = {}
-	for x in soa_recs:
-		soa_dict[x[0]] = { "rsi": x[1], "internet": x[2], "transport": x[3], "query_elapsed": x[4], "timeout": x[5], "soa_found": x[6], "date_time": x[7]}
-		(_, vp, _) = x[0].split("-")
-		soa_dict[x[0]]["vp"] = vp
-
-	correctness_dict = {}
-	for x in correctness_recs:
-		correctness_dict[x[0]] = { "rsi": x[1], "is_correct": x[2]}
-
-	##############################################################
-	
-	# Set up the RSI lists for the reports
+	# Each metric is collated by a grouped query in the database, so only the per-RSI and per-pair results come back to this program
+	#   The queries read the rollup tables that collector_processing.py fills in during ingest, except correctness, which reads record_info
+	#   If the rollup tables are missing data for the period, run "collector_processing.py --rebuild_rollups" first, or use --from_records
+	#   The results for each whole day are kept in the daily cache in ~/Output/DailyCache, and are only collated again if that day gets new files
+	# Note that rsi_interval_rollup is keyed by interval_start, which is the date_derived of the records
 	
 	# For RSI availability, for each RSI, each internet/transport pair has two values: number of non-timeouts, and count
 	rsi_availability = {}
-	# For RSI response latency, for each RSI, each internet/transport pair has two values: list of response latencies, and count
+	# For RSI response latency, for each RSI, each internet/transport pair has two values: merged latency sketch (later its median), and count
 	rsi_response_latency = {}
-	# For RSI correctness, for each RSI, there are two values: number of incorrect responses, and count [jof] [lbl]
+	# For RSI correctness, for each RSI, there are two values: number of correct responses, and count [jof] [lbl]
 	rsi_correctness = {}
-	# For publication latency, record the datetimes that each SOA is seen for each internet and transport pair
+	# For RSI publication latency, for each RSI, there are two values: median latency in seconds, and number of SOAs
 	rsi_publication_latency = {}
 
 	for this_rsi in rsi_list:
 		rsi_availability[this_rsi] = { "v4udp": [ 0, 0 ], "v4tcp": [ 0, 0 ], "v6udp": [ 0, 0 ], "v6tcp": [ 0, 0 ] }
-		rsi_response_latency[this_rsi] = { "v4udp": [ [], 0 ], "v4tcp": [ [], 0 ], "v6udp": [ [], 0 ], "v6tcp": [ [], 0 ] }
-		rsi_publication_latency[this_rsi] = {}
+		rsi_response_latency[this_rsi] = { "v4udp": [ {}, 0 ], "v4tcp": [ {}, 0 ], "v6udp": [ {}, 0 ], "v6tcp": [ {}, 0 ] }
 		rsi_correctness[this_rsi] = [ 0, 0 ]
+		rsi_publication_latency[this_rsi] = [ None, 0 ]
 
-	##############################################################	
-
-	# RSI availability and RSI response latency collation (done at the same time)
-
-	# Measurements for publication latency requires more work because the system has to determine when new SOAs are first seen
-	#   soa_first_seen keys are SOAs, values are the date first seen
-	soa_first_seen = {}
-	for (this_key, this_rec) in sorted(soa_dict.items()):
-		int_trans_pair = f"{this_rec['internet']}{this_rec['transport']}"
-		# RSI availability [gfa]
-		if not this_rec["timeout"]:
-			rsi_availability[this_rec["rsi"]][int_trans_pair][0] += 1
-		rsi_availability[this_rec["rsi"]][int_trans_pair][1] += 1
-		# RSI response latency [fhw]
-		if not this_rec["timeout"]:  # [vpa]
-			try:
-				rsi_response_latency[this_rec["rsi"]][int_trans_pair][0].append(this_rec["query_elapsed"])
-				rsi_response_latency[this_rec["rsi"]][int_trans_pair][1] += 1
-			except:
-				die(f"Found a non-timed-out response that did not have an elapsed time: {this_rec}")
-		# Store the date that a SOA was first seen; note that this relies on soa_recs to be ordered by date_derived
-		this_soa = this_rec["soa_found"]
-		if this_soa and (not this_soa in soa_first_seen):
-			soa_first_seen[this_soa] = this_rec["date_time"]
+	# For RSS availability, each internet/transport pair has three values: sum of min(k, RSIs responding), sum of k, and count
+	rss_availability = {}
+	# For RSS response latency, each internet/transport pair has the merged sketch of the lowest k latencies of each VP in each interval, and count
+	#   The sketch is later reduced to its median and mean
+	rss_response_latency = {}
+	for this_pair in report_pairs:
+		rss_availability[this_pair] = [ 0, 0, 0 ]
+		rss_response_latency[this_pair] = [ {}, 0 ]
+	# For RSS publication latency, there are three values: median latency in seconds, mean latency in seconds, and number of RSI/SOA latencies
+	rss_publication_latency = [ None, None, 0 ]
 
 	##############################################################
 
-	# RSI publication latency collation  # [yxn]
+	# The queries used for the reports, so that they can be prepared once per connection and checked with --check_queries
+	#   Each is (parameter types, query); the parameters are always the start and end of a range, so the planner can prune partitions
+	#   and use the (record_type, date_derived) index on record_info and the BRIN indexes on interval_start in the rollup tables
+	report_queries = {
+		"files_by_day": ("text, text", "select substr(filename_short, 1, 8), count(*), max(processed_at) from files_gotten " +
+			"where filename_short >= $1 and filename_short < $2 group by 1"),
+		"rsi_availability": ("timestamp, timestamp", "select rsi, internet, transport, sum(answered), sum(measured) from rsi_interval_rollup " +
+			"where interval_start between $1 and $2 group by rsi, internet, transport"),
+		"latency_sketches": ("timestamp, timestamp", "select sketch_of, internet, transport, latency_count, buckets from latency_sketch " +
+			"where interval_start between $1 and $2"),
+		"rss_availability": ("timestamp, timestamp", f"select internet, transport, sum(least({rss_k}, rsi_answered)), count(*) * {rss_k}, sum(rsi_measured) " +
+			"from rss_interval_availability where interval_start between $1 and $2 group by internet, transport"),
+		"rss_availability_hourly": ("timestamp, timestamp", f"select date_trunc('hour', interval_start), internet, transport, sum(least({rss_k}, rsi_answered)), " +
+			f"count(*) * {rss_k}, sum(rsi_measured) from rss_interval_availability where interval_start between $1 and $2 group by 1, 2, 3 order by 1, 2, 3"),
+		"soa_sightings": ("timestamp, timestamp", "select soa_first_seen.soa, soa_first_seen.first_seen, rsi, internet, transport, soa_pair_first_seen.first_seen " +
+			"from soa_first_seen join soa_pair_first_seen on soa_pair_first_seen.soa = soa_first_seen.soa where soa_first_seen.first_seen between $1 and $2"),
+		"correctness_counts": ("timestamp, timestamp", "select target, count(*) filter (where is_correct is distinct from 'n'), count(*) from record_info " +
+			"where record_type = 'C' and date_derived between $1 and $2 group by target"),
+		"correctness_failures": ("timestamp, timestamp", "select filename_record, target, internet, transport, failure_reason from record_info " +
+			"where record_type = 'C' and date_derived between $1 and $2 and is_correct = 'n' order by date_derived"),
+	}
+	# Tables that are not partitioned, so a query on them must never need a sequential scan
+	unpartitioned_tables = ( "files_gotten", "rsi_interval_rollup", "latency_sketch", "rss_interval_availability" )
+
+	def prepare_report_queries(cur):
+		# Prepare all of report_queries on the connection of this cursor; this must be done once for each connection
+		for (this_name, (these_types, this_query)) in report_queries.items():
+			cur.execute(f"prepare {this_name} ({these_types}) as {this_query}")
+
+	def run_report_query(cur, this_name, range_start, range_end):
+		# Run one of the prepared report queries; the results are read from the cursor
+		cur.execute(f"execute {this_name} (%s, %s)", (range_start, range_end))
+
+	def check_report_queries():
+		# Use EXPLAIN on each report query for the most recent whole month, and check that each plan only scans the record_info partitions
+		#   for that month and does not use a sequential scan on an unpartitioned table
+		#   Returns the number of queries whose plans failed the check
+		first_of_this_month = datetime.datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+		check_start = (first_of_this_month - datetime.timedelta(days=1)).replace(day=1)
+		check_end = first_of_this_month - datetime.timedelta(seconds=1)
+		allowed_partitions = { f"{x}_{check_start.strftime('%Y_%m')}" for x in ("record_info", "incorrect") }
+		failed_count = 0
+		def plan_scans(this_node):
+			# Returns a list of (node type, relation name) for every node in the plan that reads a relation
+			these_scans = []
+			if "Relation Name" in this_node:
+				these_scans.append((this_node["Node Type"], this_node["Relation Name"]))
+			for this_child in this_node.get("Plans", []):
+				these_scans.extend(plan_scans(this_child))
+			return these_scans
+		with psycopg2.connect(dbname="metrics", user="metrics") as conn:
+			with conn.cursor() as cur:
+				prepare_report_queries(cur)
+				for this_name in report_queries:
+					if this_name == "files_by_day":
+						these_params = (check_start.strftime("%Y%m%d"), (check_end + datetime.timedelta(days=1)).strftime("%Y%m%d"))
+					else:
+						these_params = (check_start, check_end)
+					cur.execute(f"explain (format json) execute {this_name} (%s, %s)", these_params)
+					this_plan = cur.fetchone()[0][0]["Plan"]
+					these_problems = []
+					for (this_node_type, this_relation) in plan_scans(this_plan):
+						if this_relation.startswith(("record_info_", "incorrect_")) and (not this_relation in allowed_partitions):
+							these_problems.append(f"scans partition {this_relation}, which is outside {check_start.strftime('%Y-%m')}")
+						if this_node_type == "Seq Scan" and this_relation in unpartitioned_tables:
+							these_problems.append(f"uses a sequential scan on {this_relation}")
+					if these_problems:
+						failed_count += 1
+						alert(f"Query plan for {this_name} failed the check: {'; '.join(these_problems)}")
+					else:
+						log(f"Query plan for {this_name} passed the check")
+		return failed_count
 
-	# This must be run after the soa_first_seen dict is filled in
-	for this_rsi in rsi_list:
-		for this_soa in soa_first_seen:
-			rsi_publication_latency[this_rsi][this_soa] = { "v4udp": None, "v4tcp": None, "v6udp": None, "v6tcp": None, "last": None, "latency": 0 }
-	# Go through the SOA records again, filling in the fields for internet and transport pairs
-	#   Again, this relies on soa_recs to be in date order
-	for (this_key, this_rec) in sorted(soa_dict.items()):
-		this_rsi = this_rec["rsi"]
-		this_soa_found = this_rec["soa_found"]
-		# Timed-out responses don't count for publication latency  # [tub]
-		if this_rec["timeout"]:
-			continue
-		int_trans_pair = f"{this_rec['internet']}{this_rec['transport']}"
-		# Store the datetimes when each SOA was seen [cnj]
-		if this_soa_found:
-			# Only add an entry if there is not already one there; this causes only the earliest date_time to be recorded
-			if not rsi_publication_latency[this_rsi][this_soa_found][int_trans_pair]:
-				rsi_publication_latency[this_rsi][this_soa_found][int_trans_pair] = this_rec["date_time"]
-	# Change the "last" entry in the rsi_publication_latency to the time that the SOA was finally seen by all internet/transport pairs
-	for this_rsi in rsi_list:
-		for this_soa in soa_first_seen:
+	##############################################################
+
+	# Functions for collating partial aggregates for one day (or part of a day) from the rollup tables, and for the daily cache
+	#   A partial is a dict of values that can be merged: counts are added and latency sketches are merged
+	#   The RSS values for a VP and interval never span two days, so they can be merged across days too
+
+	daily_cache_dir = f"{output_dir}/DailyCache"
+	if not os.path.exists(daily_cache_dir):
+		os.mkdir(daily_cache_dir)
+
+	def new_partial():
+		this_partial = { "rsi_availability": {}, "rsi_response_latency": {}, "rss_availability": {}, "rss_response_latency": {} }
+		for this_rsi in rsi_list:
+			this_partial["rsi_availability"][this_rsi] = { "v4udp": [ 0, 0 ], "v4tcp": [ 0, 0 ], "v6udp": [ 0, 0 ], "v6tcp": [ 0, 0 ] }
+			this_partial["rsi_response_latency"][this_rsi] = { "v4udp": [ {}, 0 ], "v4tcp": [ {}, 0 ], "v6udp": [ {}, 0 ], "v6tcp": [ {}, 0 ] }
+		for this_pair in report_pairs:
+			this_partial["rss_availability"][this_pair] = [ 0, 0, 0 ]
+			this_partial["rss_response_latency"][this_pair] = [ {}, 0 ]
+		return this_partial
+
+	def collate_partial(cur, range_start, range_end):
+		# Returns the partial for range_start to range_end, which are in strf_timestamp_format
+		this_partial = new_partial()
+		# RSI availability collation [gfa]
+		run_report_query(cur, "rsi_availability", range_start, range_end)
+		for (this_rsi, this_internet, this_transport, this_answered, this_measured) in cur:
+			if this_rsi in rsi_list:
+				this_partial["rsi_availability"][this_rsi][f"{this_internet}{this_transport}"] = [ this_answered, this_measured ]
+		# RSI response latency collation [fhw]
+		#   The latency sketches for all the intervals are merged; the sketches only have non-timed-out responses [vpa]
+		run_report_query(cur, "latency_sketches", range_start, range_end)
+		for (this_sketch_of, this_internet, this_transport, this_latency_count, this_buckets) in cur:
+			int_trans_pair = f"{this_internet}{this_transport}"
+			# RSS response latency collation, from the "rss" sketches [spx] [bom] [jbr]
+			if this_sketch_of == "rss":
+				latency_sketch.merge_sketch(this_partial["rss_response_latency"][int_trans_pair][0], this_buckets)
+			elif this_sketch_of in rsi_list:
+				latency_sketch.merge_sketch(this_partial["rsi_response_latency"][this_sketch_of][int_trans_pair][0], this_buckets)
+				this_partial["rsi_response_latency"][this_sketch_of][int_trans_pair][1] += this_latency_count
+				# The RSS measurement count is all the RSI latencies, not just the lowest k
+				this_partial["rss_response_latency"][int_trans_pair][1] += this_latency_count
+		# RSS availability collation
+		#   rss_interval_availability has the count of RSIs that responded for each VP, interval, and internet/transport pair [egb]; that is capped at k [cvf]
+		run_report_query(cur, "rss_availability", range_start, range_end)
+		for (this_internet, this_transport, this_numerator, this_denominator, this_count) in cur:
+			this_partial["rss_availability"][f"{this_internet}{this_transport}"] = [ this_numerator, this_denominator, this_count ]
+		return this_partial
+
+	def merge_partial(into_partial, other_partial):
+		for this_rsi in rsi_list:
 			for this_pair in report_pairs:
-				if not rsi_publication_latency[this_rsi][this_soa]["last"]:
-					# Set "last" if it doesn't already exist
-					rsi_publication_latency[this_rsi][this_soa]["last"] = rsi_publication_latency[this_rsi][this_soa][this_pair]
-				elif rsi_publication_latency[this_rsi][this_soa][this_pair] > rsi_publication_latency[this_rsi][this_soa]["last"]:
-					# Reset "last" to the new value if the new value is greater
-					rsi_publication_latency[this_rsi][this_soa]["last"] = rsi_publication_latency[this_rsi][this_soa][this_pair]
-			# Fill in the "latency" entry by comparing the "last" to the SOA datetime; it is stored as seconds
-			#   rsi_publication_latency[this_rsi][this_soa]["last"] might still be None for SOAs issued at the very end of the month; skip them
-			if rsi_publication_latency[this_rsi][this_soa]["last"]:
-				rsi_publication_latency[this_rsi][this_soa]["latency"] = (rsi_publication_latency[this_rsi][this_soa]["last"] - soa_first_seen[this_soa]).seconds  # [jtz]
-				
+				for this_index in (0, 1):
+					into_partial["rsi_availability"][this_rsi][this_pair][this_index] += other_partial["rsi_availability"][this_rsi][this_pair][this_index]
+				latency_sketch.merge_sketch(into_partial["rsi_response_latency"][this_rsi][this_pair][0], other_partial["rsi_response_latency"][this_rsi][this_pair][0])
+				into_partial["rsi_response_latency"][this_rsi][this_pair][1] += other_partial["rsi_response_latency"][this_rsi][this_pair][1]
+		for this_pair in report_pairs:
+			for this_index in (0, 1, 2):
+				into_partial["rss_availability"][this_pair][this_index] += other_partial["rss_availability"][this_pair][this_index]
+			latency_sketch.merge_sketch(into_partial["rss_response_latency"][this_pair][0], other_partial["rss_response_latency"][this_pair][0])
+			into_partial["rss_response_latency"][this_pair][1] += other_partial["rss_response_latency"][this_pair][1]
+
+	def split_into_days(range_start, range_end):
+		# Returns a list of (piece_start, piece_end, is_whole_day) that covers range_start to range_end, which are datetimes
+		day_pieces = []
+		piece_start = range_start
+		while piece_start <= range_end:
+			day_start = piece_start.replace(hour=0, minute=0, second=0, microsecond=0)
+			day_end = day_start + datetime.timedelta(days=1, seconds=-1)
+			piece_end = min(day_end, range_end)
+			day_pieces.append((piece_start, piece_end, (piece_start == day_start) and (piece_end == day_end)))
+			piece_start = day_end + datetime.timedelta(seconds=1)
+		return day_pieces
+
+	def get_files_by_day(cur, first_day, last_day):
+		# Returns a dict of YYYYMMDD to the files_state for get_day_partial() for each day from first_day to last_day, which are datetimes
+		#   Days with no files are in the dict also, because a rollup rebuild can still change them
+		cur.execute("select max(rebuilt_at) from rollup_rebuilds")
+		rebuilt_at = cur.fetchone()[0]
+		run_report_query(cur, "files_by_day", first_day.strftime("%Y%m%d"), (last_day + datetime.timedelta(days=1)).strftime("%Y%m%d"))
+		these_files = { this_day: (this_count, this_latest) for (this_day, this_count, this_latest) in cur }
+		these_states = {}
+		this_date = first_day.date()
+		while this_date <= last_day.date():
+			these_states[this_date.strftime("%Y%m%d")] = these_files.get(this_date.strftime("%Y%m%d"), (0, None)) + (rebuilt_at, )
+			this_date += datetime.timedelta(days=1)
+		return these_states
+
+	def get_day_partial(cur, day_start, files_state):
+		# Returns the partial for a whole day, from the daily cache if the day's files are the same as when it was cached, and whether it came from the cache
+		#   files_state is (number of files, latest processed_at, time of the latest rollup rebuild) for the day, from get_files_by_day()
+		#   If later files arrive for the day, or the rollup tables are rebuilt with "collector_processing.py --rebuild_rollups", it is collated again
+		cache_file_name = f"{daily_cache_dir}/{day_start.strftime(strf_day_format)}.pickle"
+		if os.path.exists(cache_file_name):
+			try:
+				with open(cache_file_name, mode="rb") as cache_f:
+					(cached_files_state, cached_partial) = pickle.load(cache_f)
+				if cached_files_state == files_state:
+					return (cached_partial, True)
+			except Exception as e:
+				alert(f"Could not read {cache_file_name}, so collating that day again: {e}")
+		day_end = day_start + datetime.timedelta(days=1, seconds=-1)
+		this_partial = collate_partial(cur, day_start.strftime(strf_timestamp_format), day_end.strftime(strf_timestamp_format))
+		# Only cache days that are over; days still being collected will change
+		if day_end < datetime.datetime.utcnow():
+			with open(f"{cache_file_name}.tmp", mode="wb") as cache_f:
+				pickle.dump((files_state, this_partial), cache_f)
+			os.replace(f"{cache_file_name}.tmp", cache_file_name)
+		return (this_partial, False)
+
+	def publication_latencies(soa_first_seen, pair_first_seen):
+		# Returns (rsi_publication_latency, rss_publication_latency) from the SOA sightings for a period
+		#   The latency for an RSI and SOA is from soa_first_seen to the last of the pair_first_seen times, so SOAs that have not yet been seen on
+		#   every pair are skipped
+		these_rsi_latencies = {}
+		all_publication_latencies = []
+		for this_rsi in rsi_list:
+			these_latencies = []
+			for this_soa in soa_first_seen:
+				these_pair_times = [ pair_first_seen.get((this_rsi, this_soa, this_pair)) for this_pair in report_pairs ]
+				if None in these_pair_times:
+					continue
+				these_latencies.append((max(these_pair_times) - soa_first_seen[this_soa]).total_seconds())  # [jtz]
+			if these_latencies:
+				these_rsi_latencies[this_rsi] = [ statistics.median(these_latencies), len(these_latencies) ]  # [yzp] [kvg] [udz]
+			else:
+				these_rsi_latencies[this_rsi] = [ None, 0 ]
+			all_publication_latencies.extend(these_latencies)  # [dbo]
+		if all_publication_latencies:
+			return (these_rsi_latencies, [ statistics.median(all_publication_latencies), statistics.mean(all_publication_latencies), len(all_publication_latencies) ])  # [zgb]
+		return (these_rsi_latencies, [ None, None, 0 ])
+
+	def collate_publication_latency(cur, range_start, range_end):
+		# Returns (rsi_publication_latency, rss_publication_latency) for the SOAs first seen from range_start to range_end [yxn]
+		#   The first-seen tables are kept by collector_processing.py over all time, so an SOA first seen before range_start is not counted
+		#   even if some RSIs only served it during the range, and an SOA first seen near range_end is counted even if some RSIs only served it later
+		soa_first_seen = {}
+		pair_first_seen = {}
+		run_report_query(cur, "soa_sightings", range_start, range_end)
+		for (this_soa, this_soa_first_seen, this_rsi, this_internet, this_transport, this_pair_first_seen) in cur:
+			soa_first_seen[this_soa] = this_soa_first_seen
+			pair_first_seen[(this_rsi, this_soa, f"{this_internet}{this_transport}")] = this_pair_first_seen  # [tub] [cnj]
+		return publication_latencies(soa_first_seen, pair_first_seen)
+
+	def collate_correctness(cur, range_start, range_end):
+		# Returns (rsi_correctness, correctness_failures) for range_start to range_end, which are in strf_timestamp_format
+		#   For each RSI, rsi_correctness has two values: number of correct responses, and count [jof] [lbl]
+		these_correctness = { this_rsi: [ 0, 0 ] for this_rsi in rsi_list }
+		# RSI correctness collation [ebg]
+		run_report_query(cur, "correctness_counts", range_start, range_end)
+		for (this_rsi, this_correct, this_count) in cur:
+			if this_rsi in these_correctness:
+				these_correctness[this_rsi] = [ this_correct, this_count ]
+		# Get all the failed correctness records to report in the additional section
+		run_report_query(cur, "correctness_failures", range_start, range_end)
+		return (these_correctness, cur.fetchall())
+
+	def write_rss_hourly(cur, report_name, range_start, range_end):
+		# For --rss_hourly, write the RSS availability [cvf] for each hour from range_start to range_end to a CSV file named after the report
+		hourly_file_name = f"{hourly_dir}/{os.path.basename(report_name).replace('.txt', '')}-rss-availability.csv"
+		run_report_query(cur, "rss_availability_hourly", range_start, range_end)
+		with open(hourly_file_name, mode="wt", newline="") as hourly_f:
+			hourly_writer = csv.writer(hourly_f)
+			hourly_writer.writerow([ "hour", "internet", "transport", "numerator", "denominator", "availability", "measurements" ])
+			for (this_hour, this_internet, this_transport, this_numerator, this_denominator, this_count) in cur:
+				hourly_writer.writerow([ this_hour.strftime(strf_timestamp_format), this_internet, this_transport, this_numerator, this_denominator,
+					f"{this_numerator / this_denominator:.6f}", this_count ])
+		log(f"Wrote the hourly RSS availability to {hourly_file_name}")
+
+	def reduce_latency_sketches(rsi_response_latency, rss_response_latency):
+		# Replace the latency sketches with their medians (and means, for the RSS)
+		for this_rsi in rsi_list:
+			for this_pair in report_pairs:
+				(this_sketch, this_count) = rsi_response_latency[this_rsi][this_pair]
+				rsi_response_latency[this_rsi][this_pair] = [ latency_sketch.sketch_quantile(this_sketch, 0.5), this_count ]
+		for this_pair in report_pairs:
+			(this_sketch, this_count) = rss_response_latency[this_pair]
+			rss_response_latency[this_pair] = [ latency_sketch.sketch_quantile(this_sketch, 0.5), latency_sketch.sketch_mean(this_sketch), this_count ]
+
 	##############################################################
 
-	# RSI correctness collation [ebg]
-	#   [0] is the number correct, [1] is the total count
+	# Functions for --backfill
+
+	def collate_backfill_day(day_args):
+		# Collates one whole day in a worker process, with its own database connection
+		#   Returns (day_start, partial, whether the partial came from the daily cache, rsi_correctness, correctness_failures)
+		(day_start, files_state) = day_args
+		day_end = day_start + datetime.timedelta(days=1, seconds=-1)
+		with psycopg2.connect(dbname="metrics", user="metrics") as conn:
+			with conn.cursor() as cur:
+				prepare_report_queries(cur)
+				(this_partial, from_cache) = get_day_partial(cur, day_start, files_state)
+				(these_correctness, these_failures) = collate_correctness(cur, day_start.strftime(strf_timestamp_format), day_end.strftime(strf_timestamp_format))
+		return (day_start, this_partial, from_cache, these_correctness, these_failures)
+
+	def run_backfill(first_day, last_day):
+		# Create the monthly report for every whole month, and a weekly report for every whole Monday-to-Sunday week, from first_day to last_day
+		#   Each day is collated once, in parallel, and then every report is made by merging the days it covers
+		backfill_end = last_day + datetime.timedelta(days=1, seconds=-1)
+		# report_periods is a list of (report name, first day, number of days)
+		report_periods = []
+		this_month = first_day if first_day.day == 1 else (first_day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+		while True:
+			next_month = (this_month + datetime.timedelta(days=32)).replace(day=1)
+			if next_month - datetime.timedelta(seconds=1) > backfill_end:
+				break
+			report_periods.append((f"{monthly_reports_dir}/monthly-{this_month.strftime(strf_day_format)}.txt", this_month, (next_month - this_month).days))
+			this_month = next_month
+		this_week = first_day + datetime.timedelta(days=(7 - first_day.weekday()) % 7)
+		while this_week + datetime.timedelta(days=7, seconds=-1) <= backfill_end:
+			report_periods.append((f"{weekly_reports_dir}/weekly-{this_week.strftime(strf_day_format)}.txt", this_week, 7))
+			this_week += datetime.timedelta(days=7)
+		# Skip reports that already exist, unless --force is given [rps]
+		if not opts.force:
+			report_periods = [ x for x in report_periods if not os.path.exists(x[0]) ]
+		if not report_periods:
+			log(f"There were no reports to create for {first_day.strftime(strf_day_format)} to {last_day.strftime(strf_day_format)}")
+			return
+		backfill_days = sorted(set(this_start + datetime.timedelta(days=x) for (_, this_start, this_length) in report_periods for x in range(this_length)))
+		log(f"About to create {len(report_periods)} reports covering {len(backfill_days)} days")
+		# Get the number of files, the latest processed_at, and the latest rollup rebuild for each day, to tell whether a cached day is still current
+		with psycopg2.connect(dbname="metrics", user="metrics") as conn:
+			with conn.cursor() as cur:
+				prepare_report_queries(cur)
+				files_by_day = get_files_by_day(cur, backfill_days[0], backfill_days[-1])
+		day_results = {}
+		(cache_hits, cache_misses) = (0, 0)
+		with futures.ProcessPoolExecutor() as executor:
+			day_args = [ (this_day, files_by_day[this_day.strftime("%Y%m%d")]) for this_day in backfill_days ]
+			for (this_day, this_partial, from_cache, these_correctness, these_failures) in executor.map(collate_backfill_day, day_args):
+				day_results[this_day] = (this_partial, these_correctness, these_failures)
+				if from_cache:
+					cache_hits += 1
+				else:
+					cache_misses += 1
+		log(f"Used {cache_hits} days from the daily cache and collated {cache_misses} days again")
+		# Get the publication latency for each report; this is not collated by day because an SOA can be first seen on one day and served on the next
+		report_publication_latencies = {}
+		with psycopg2.connect(dbname="metrics", user="metrics") as conn:
+			with conn.cursor() as cur:
+				prepare_report_queries(cur)
+				for (this_report_name, this_start, this_length) in report_periods:
+					this_end = this_start + datetime.timedelta(days=this_length, seconds=-1)
+					report_publication_latencies[this_report_name] = collate_publication_latency(cur, this_start.strftime(strf_timestamp_format), this_end.strftime(strf_timestamp_format))
+					if opts.rss_hourly:
+						write_rss_hourly(cur, this_report_name, this_start.strftime(strf_timestamp_format), this_end.strftime(strf_timestamp_format))
+		# Make each report from the days it covers
+		for (this_report_name, this_start, this_length) in report_periods:
+			report_partial = new_partial()
+			these_correctness = { this_rsi: [ 0, 0 ] for this_rsi in rsi_list }
+			these_failures = []
+			for this_day in [ this_start + datetime.timedelta(days=x) for x in range(this_length) ]:
+				(day_partial, day_correctness, day_failures) = day_results[this_day]
+				merge_partial(report_partial, day_partial)
+				for this_rsi in rsi_list:
+					these_correctness[this_rsi][0] += day_correctness[this_rsi][0]
+					these_correctness[this_rsi][1] += day_correctness[this_rsi][1]
+				these_failures.extend(day_failures)
+			(these_rsi_publication_latency, this_rss_publication_latency) = report_publication_latencies[this_report_name]
+			reduce_latency_sketches(report_partial["rsi_response_latency"], report_partial["rss_response_latency"])
+			this_end = this_start + datetime.timedelta(days=this_length, seconds=-1)
+			write_report(this_report_name, this_start.strftime(strf_timestamp_format), this_end.strftime(strf_timestamp_format),
+				report_partial["rsi_availability"], report_partial["rsi_response_latency"], these_correctness, these_rsi_publication_latency,
+				report_partial["rss_availability"], report_partial["rss_response_latency"], this_rss_publication_latency, these_failures)
 
-	for (this_key, this_rec) in sorted(correctness_dict.items()):
-		if not this_rec["is_correct"] == "n":
-			rsi_correctness[this_rec["rsi"]][0] += 1
-		rsi_correctness[this_rec["rsi"]][1] += 1
-	
 	##############################################################
+
+	def write_report(new_report_name, report_start_timestamp, report_end_timestamp, rsi_availability, rsi_response_latency, rsi_correctness, rsi_publication_latency,
+		rss_availability, rss_response_latency, rss_publication_latency, correctness_failures):
+		# Write one report from the collated values; the latency values have already been reduced to medians
+		# Total number of measurements, for the report
+		soa_measurement_count = sum(rsi_availability[this_rsi][this_pair][1] for this_rsi in rsi_list for this_pair in report_pairs)
+		correctness_measurement_count = sum(rsi_correctness[this_rsi][1] for this_rsi in rsi_list)
+		log(f"Found {soa_measurement_count} SOA records and {correctness_measurement_count} correctness records for {report_start_timestamp} to {report_end_timestamp}")
+
+		##############################################################
 	
-	# RSS availability collation
-		
-	# For RSS availability, for each VP, for each date_time, count the availability in each internet/transport pair, and total count
-	rss_availability = {}
-	for this_vp in vp_names:
-		rss_availability[this_vp] = {}
-	# Go through te SOA records recorded earlier
-	for (this_key, this_rec) in sorted(soa_dict.items()):
-		this_vp = this_rec["vp"]
-		this_date_time = this_rec["date_time"]
-		if not rss_availability[this_vp].get(this_date_time):
-			rss_availability[this_vp][this_date_time] = { "v4udp": [ 0, 0 ], "v4tcp": [ 0, 0 ], "v6udp": [ 0, 0 ], "v6tcp": [ 0, 0 ] }
-		int_trans_pair = f"{this_rec['internet']}{this_rec['transport']}"
-		if not this_rec["timeout"]:
-			rss_availability[this_vp][this_date_time][int_trans_pair][0] += 1  # [egb]
-			rss_availability[this_vp][this_date_time][int_trans_pair][1] += 1
-				
-	##############################################################
+		# RSS correctness collation
 	
-	# RSS response latency collation
+		rss_correctness_numerator = 0
+		rss_correctness_denominator = 0
+		for this_rsi in rsi_list:
+			rss_correctness_numerator += rsi_correctness[this_rsi][0]
+			rss_correctness_denominator += rsi_correctness[this_rsi][1]
+		rss_correctness_ratio = rss_correctness_numerator / rss_correctness_denominator  # [ywo]
+		rss_correctness_incorrect = rss_correctness_denominator - rss_correctness_numerator
+
+		##############################################################
 	
-	# For RSS response latency, for each date_time, each internet/transport pair has a list of latencies
-	rss_response_latency_in = {}
-	rss_latency_intervals = set()
-	for (this_key, this_rec) in sorted(soa_dict.items()):  # [spx]
-		this_vp = this_rec["vp"]
-		this_date_time = this_rec["date_time"]
-		this_query_elapsed = this_rec["query_elapsed"]
-		rss_latency_intervals.add(this_date_time)
-		if not rss_response_latency_in.get(this_date_time):
-			rss_response_latency_in[this_date_time] = { "v4udp": [], "v4tcp": [], "v6udp": [], "v6tcp": [] }
-		int_trans_pair = f"{this_rec['internet']}{this_rec['transport']}"
-		if this_query_elapsed > 0.001:
-			rss_response_latency_in[this_date_time][int_trans_pair].append(this_query_elapsed)  # [bom]
-	# Reduce each list of latencies to the median of the lowest k latencies in that last
-	rss_response_latency_aggregates = {}
-	for this_interval in rss_latency_intervals:
-		rss_response_latency_aggregates[this_interval] = {}
-		for this_pair in report_pairs:
-			this_lowest_k = rss_response_latency_in[this_interval][this_pair][0:rss_k-1]  # [jbr]
-			this_count = len(rss_response_latency_in[this_interval][this_pair])
-			rss_response_latency_aggregates[this_interval][this_pair] = [ this_lowest_k, this_count ]
-			
-	##############################################################
+		# Create the report
 	
-	# RSS publication latency collation
+		report_main = []
+		report_additional = []
 	
-	rss_publication_latency_list = []
-	for this_rsi in rsi_list:
-		for this_soa in soa_first_seen:
-			rss_publication_latency_list.append(rsi_publication_latency[this_rsi][this_soa]["latency"])  # [dbo]
+		def r_out(in_text, additional=""):
+			if in_text:
+				report_main.append(in_text + "\n")
+			report_additional.append(in_text + additional + "\n")
 
-	##############################################################
-	
-	# RSS correctness collation
-	
-	rss_correctness_numerator = 0
-	rss_correctness_denominator = 0
-	for this_rsi in rsi_list:
-		rss_correctness_numerator += rsi_correctness[this_rsi][0]
-		rss_correctness_denominator += rsi_correctness[this_rsi][1]
-	rss_correctness_ratio = rss_correctness_numerator / rss_correctness_denominator  # [ywo]
-	rss_correctness_incorrect = rss_correctness_denominator - rss_correctness_numerator
+		# Start the report text
+		r_out(f"Report for {report_start_timestamp} to {report_end_timestamp}")
 
-	##############################################################
+		# Note the number of measurements for this report
+		r_out(f"Number of measurements across all vantage points: {soa_measurement_count + correctness_measurement_count}")
 	
-	# Create the report
+		# The report only has "Pass" and "Fail", not the collated metrics [ntt] [cpm]
 	
-	report_main = []
-	report_additional = []
+		# RSI reports
+	
+		# RSI availability report
+		rsi_availability_threshold = .96  # [ydw]
+		r_out(f"\nRSI Availability\nThreshold is {int(rsi_availability_threshold * 100)}%")  # [vmx]
+		for this_rsi in rsi_list:
+			r_out(f"  {this_rsi}.root-servers.net:")
+			for this_pair in sorted(report_pairs):
+				rsi_availability_ratio = rsi_availability[this_rsi][this_pair][0] / rsi_availability[this_rsi][this_pair][1]  # [yah]
+				pass_fail_text = "Fail" if rsi_availability_ratio < rsi_availability_threshold else "Pass"
+				additional_text = f" -- {(rsi_availability_ratio * 100):>6.2f}%"
+				r_out(f"    {report_pairs[this_pair]}: {pass_fail_text} {(rsi_availability[this_rsi][this_pair][1]):>8,} measurements", additional_text)  # [lkd]
+			
+		# RSI response latency report
+		rsi_response_latency_udp_threshold = .250  # [zuc]
+		rsi_response_latency_tcp_threshold = .500  # [bpl]
+		r_out(f"\n\nRSI Response Latency\nThreshold for UDP is {rsi_response_latency_udp_threshold:.3f} seconds")
+		r_out(f"Threshold for TCP is {rsi_response_latency_tcp_threshold:.3f} seconds")  # [znh]
+		for this_rsi in rsi_list:
+			r_out(f"  {this_rsi}.root-servers.net:")
+			for this_pair in sorted(report_pairs):
+				response_latency_median = rsi_response_latency[this_rsi][this_pair][0] # [mzx]
+				if response_latency_median is None:
+					die(f"There were no response latencies for {this_rsi} {this_pair}; run 'collector_processing.py --rebuild_rollups' if the sketches are missing")
+				if "udp" in this_pair:
+					pass_fail_text = "Fail" if response_latency_median > rsi_response_latency_udp_threshold else "Pass"
+				else:
+					pass_fail_text = "Fail" if response_latency_median > rsi_response_latency_tcp_threshold else "Pass"
+				additional_text = f" -- {response_latency_median:.3f} seconds median"
+				r_out(f"    {report_pairs[this_pair]}: {pass_fail_text}  {(rsi_response_latency[this_rsi][this_pair][1]):>8,} measurements", additional_text)  # [lxr]
 	
-	def r_out(in_text, additional=""):
-		global report_main
-		global report_additional
-		if in_text:
-			report_main.append(in_text + "\n")
-		report_additional.append(in_text + additional + "\n")
-
-	# Start the report text
-	r_out(f"Report for {report_start_timestamp} to {report_end_timestamp}")
-
-	# Note the number of measurements for this report
-	r_out(f"Number of measurements across all vantage points: {len(soa_dict) + len(correctness_dict)}")
+		# RSI correctness report
+		rsi_correctness_threshold = 100  # ...as percentage [ahw]
+		r_out("\n\nRSI Correctness\nThreshold is 100%")  # [mah]
+		for this_rsi in rsi_list:
+			r_out(f"  {this_rsi}.root-servers.net:")
+			rsi_correctness_percentage = (rsi_correctness[this_rsi][0] / rsi_correctness[this_rsi][1]) * 100  # [skm]
+			pass_fail_text = "Fail" if rsi_correctness_percentage < rsi_correctness_threshold else "Pass"
+			additional_text = f" -- {rsi_correctness[this_rsi][1] - rsi_correctness[this_rsi][0]:>5,} incorrect, {rsi_correctness_percentage:>6.2f}%"
+			r_out(f"    {pass_fail_text}  {rsi_correctness[this_rsi][1]:>10,}  measurements", additional_text)  # [fee]
 	
-	# The report only has "Pass" and "Fail", not the collated metrics [ntt] [cpm]
+		# RSI publication latency report
+		rsi_publication_latency_threshold = 65 * 60 # [fwa]
+		r_out(f"\n\nRSI Publication Latency\nThreshold is {rsi_publication_latency_threshold} seconds")  # [erf]
+		for this_rsi in rsi_list:
+			r_out(f"  {this_rsi}.root-servers.net:")
+			(publication_latency_median, publication_latency_count) = rsi_publication_latency[this_rsi]  # [yzp]
+			if publication_latency_median is None:
+				die(f"There were no SOAs seen on every internet/transport pair for {this_rsi}")
+			pass_fail_text = "Fail" if publication_latency_median > rsi_publication_latency_threshold else "Pass"
+			additional_text = f" -- {publication_latency_median:>7.1f} seconds median"
+			r_out(f"    {pass_fail_text}  {publication_latency_count:>8,} measurements", additional_text)  # [hms]
+
+		# RSS reports
 	
-	# RSI reports
+		# Report both the derived values and a pass/fail indicator for each RSS metric [nuc]
 	
-	# RSI availability report
-	rsi_availability_threshold = .96  # [ydw]
-	r_out(f"\nRSI Availability\nThreshold is {int(rsi_availability_threshold * 100)}%")  # [vmx]
-	for this_rsi in rsi_list:
-		r_out(f"  {this_rsi}.root-servers.net:")
+		# RSS availability report
+		rss_availability_threshold = .99999  # [wzz]
+		r_out(f"\n\nRSS Availability\nThreshold is {(rss_availability_threshold * 100):>5.3f}%")  # [fdy]
 		for this_pair in sorted(report_pairs):
-			rsi_availability_ratio = rsi_availability[this_rsi][this_pair][0] / rsi_availability[this_rsi][this_pair][1]  # [yah]
-			pass_fail_text = "Fail" if rsi_availability_ratio < rsi_availability_threshold else "Pass"
-			additional_text = f" -- {(rsi_availability_ratio * 100):>6.2f}%"
-			r_out(f"    {report_pairs[this_pair]}: {pass_fail_text} {(rsi_availability[this_rsi][this_pair][1]):>8,} measurements", additional_text)  # [lkd]
-			
-	# RSI response latency report
-	rsi_response_latency_udp_threshold = .250  # [zuc]
-	rsi_response_latency_tcp_threshold = .500  # [bpl]
-	r_out(f"\n\nRSI Response Latency\nThreshold for UDP is {rsi_response_latency_udp_threshold:.3f} seconds")
-	r_out(f"Threshold for TCP is {rsi_response_latency_tcp_threshold:.3f} seconds")  # [znh]
-	for this_rsi in rsi_list:
-		r_out(f"  {this_rsi}.root-servers.net:")
+			(rss_availability_numerator, rss_availability_denominator, this_count) = rss_availability[this_pair]
+			this_ratio = rss_availability_numerator / rss_availability_denominator  # [cvf]
+			pass_fail_text = "Fail" if this_ratio < rss_availability_threshold else "Pass"
+			additional_text = f" -- {rss_availability_numerator:>10,} /{rss_availability_denominator:>10,}"
+			r_out(f"  {report_pairs[this_pair]}: {(this_ratio * 100):>7.3f}%, {pass_fail_text}, {this_count:>8,} measurements", additional_text)  # [vxl] [hgm]
+		
+		# RSS response latency report
+		rss_response_latency_udp_threshold = .150  # [uwf]
+		rss_response_latency_tcp_threshold = .300  # [lmx]
+		r_out(f"\n\nRSS Response Latency\nThreshold for UDP is {rss_response_latency_udp_threshold:.3f} seconds")
+		r_out(f"Threshold for TCP is {rss_response_latency_tcp_threshold:>.3f} seconds")  # [gwm]
 		for this_pair in sorted(report_pairs):
-			response_latency_median = statistics.median(rsi_response_latency[this_rsi][this_pair][0]) # [mzx]
+			(pair_response_latency_median, pair_response_latency_mean, pair_count) = rss_response_latency[this_pair]
+			if pair_response_latency_median is None:
+				die(f"There were no RSS response latencies for {this_pair}; run 'collector_processing.py --rebuild_rollups' if the sketches are missing")
 			if "udp" in this_pair:
-				pass_fail_text = "Fail" if response_latency_median > rsi_response_latency_udp_threshold else "Pass"
+				pass_fail_text = "Fail" if pair_response_latency_median > rss_response_latency_udp_threshold else "Pass"
 			else:
-				pass_fail_text = "Fail" if response_latency_median > rsi_response_latency_tcp_threshold else "Pass"
-			additional_text = f" -- {response_latency_median:.3f} seconds median"
-			r_out(f"    {report_pairs[this_pair]}: {pass_fail_text}  {(rsi_response_latency[this_rsi][this_pair][1]):>8,} measurements", additional_text)  # [lxr]
-	
-	# RSI correctness report
-	rsi_correctness_threshold = 100  # ...as percentage [ahw]
-	r_out("\n\nRSI Correctness\nThreshold is 100%")  # [mah]
-	for this_rsi in rsi_list:
-		r_out(f"  {this_rsi}.root-servers.net:")
-		rsi_correctness_percentage = (rsi_correctness[this_rsi][0] / rsi_correctness[this_rsi][1]) * 100  # [skm]
-		pass_fail_text = "Fail" if rsi_correctness_percentage < rsi_correctness_threshold else "Pass"
-		additional_text = f" -- {rsi_correctness[this_rsi][1] - rsi_correctness[this_rsi][0]:>5,} incorrect, {rsi_correctness_percentage:>6.2f}%"
-		r_out(f"    {pass_fail_text}  {rsi_correctness[this_rsi][1]:>10,}  measurements", additional_text)  # [fee]
-	
-	# RSI publication latency report
-	rsi_publication_latency_threshold = 65 * 60 # [fwa]
-	r_out(f"\n\nRSI Publication Latency\nThreshold is {rsi_publication_latency_threshold} seconds")  # [erf]
-	for this_rsi in rsi_list:
-		r_out(f"  {this_rsi}.root-servers.net:")
-		# latency_differences is the delays in publication for this letter
-		latency_differences = []
-		for this_soa in soa_first_seen:
-			if rsi_publication_latency[this_rsi].get(this_soa):
-				latency_differences.append(rsi_publication_latency[this_rsi][this_soa]["latency"])  # [kvg] [udz]
-		publication_latency_median = statistics.median(latency_differences)  # [yzp]
-		pass_fail_text = "Fail" if publication_latency_median > rsi_publication_latency_threshold else "Pass"
-		additional_text = f" -- {publication_latency_median:>7.1f} seconds median"
-		r_out(f"    {pass_fail_text}  {len(rsi_publication_latency[this_rsi]):>8,} measurements", additional_text)  # [hms]
-
-	# RSS reports
-	
-	# Report both the derived values and a pass/fail indicator for each RSS metric [nuc]
+				pass_fail_text = "Fail" if pair_response_latency_median > rss_response_latency_tcp_threshold else "Pass"
+			additional_text = f" -- {pair_response_latency_mean:.3f} seconds mean"
+			r_out(f"  {report_pairs[this_pair]}: {pair_response_latency_median:.3f} median, {pass_fail_text}, {pair_count:>8,} measurements", additional_text)
 	
-	# RSS availability report
-	rss_availability_threshold = .99999  # [wzz]
-	r_out(f"\n\nRSS Availability\nThreshold is {(rss_availability_threshold * 100):>5.3f}%")  # [fdy]
-	for this_pair in sorted(report_pairs):
-		rss_availability_numerator = 0
-		rss_availability_denominator = 0
-		this_count = 0
-		for this_vp in rss_availability:
-			for this_date_time in rss_availability[this_vp]:
-				rss_availability_numerator += min(rss_k, rss_availability[this_vp][this_date_time][this_pair][0])
-				rss_availability_denominator += rss_k
-				this_count += rss_availability[this_vp][this_date_time][this_pair][1]
-		this_ratio = rss_availability_numerator / rss_availability_denominator  # [cvf]
-		pass_fail_text = "Fail" if this_ratio < rss_availability_threshold else "Pass"
-		additional_text = f" -- {rss_availability_numerator:>10,} /{rss_availability_denominator:>10,}"
-		r_out(f"  {report_pairs[this_pair]}: {(this_ratio * 100):>7.3f}%, {pass_fail_text}, {this_count:>8,} measurements", additional_text)  # [vxl] [hgm]
-		
-	# RSS response latency report
-	rss_response_latency_udp_threshold = .150  # [uwf]
-	rss_response_latency_tcp_threshold = .300  # [lmx]
-	r_out(f"\n\nRSS Response Latency\nThreshold for UDP is {rss_response_latency_udp_threshold:.3f} seconds")
-	r_out(f"Threshold for TCP is {rss_response_latency_tcp_threshold:>.3f} seconds")  # [gwm]
-	for this_pair in sorted(report_pairs):
-		pair_latencies = []
-		pair_count = 0
-		for this_interval in rss_latency_intervals:
-			pair_latencies.extend(rss_response_latency_aggregates[this_interval][this_pair][0])
-			pair_count += rss_response_latency_aggregates[this_interval][this_pair][1]
-		try:
-			pair_response_latency_median = statistics.median(pair_latencies)
-		except:
-			die(f"Died finding median on {pair_latencies=}")
-		if "udp" in this_pair:
-			pass_fail_text = "Fail" if pair_response_latency_median > rss_response_latency_udp_threshold else "Pass"
+		# RSS correctness report
+		rss_correctness_threshold = 1  # [gfh]
+		r_out("\n\nRSS Correctness\nThreshold is 100%")  # [vpj]
+		pass_fail_text = "Fail" if rss_correctness_ratio < rss_correctness_threshold else "Pass"  # [udc]
+		additional_text = f" -- {rss_correctness_incorrect} incorrect"
+		r_out(f"   Entire RSS {(rss_correctness_ratio * 100):.6f}%, {pass_fail_text}, {rss_correctness_denominator:>8,} measurements", additional_text)  # [kea]
+
+		# RSS publication latency
+		rss_publication_latency_threshold = 35 * 60  # [zkl]
+		r_out(f"\n\nRSS Publication Latency\nThreshold is {rss_publication_latency_threshold} seconds")  # [tkw]
+		(rss_publication_latency_median, rss_publication_latency_mean, rss_publication_latency_count) = rss_publication_latency  # [zgb]
+		if rss_publication_latency_median is None:
+			die("There were no SOAs seen on every internet/transport pair for any RSI")
+		pass_fail_text = "Fail" if rss_publication_latency_median > rss_publication_latency_threshold else "Pass"
+		additional_text = f" -- {rss_publication_latency_mean:.3f} seconds mean"
+		r_out(f"   Entire RSS {rss_publication_latency_median} median, {pass_fail_text}, {rss_publication_latency_count:>8,} measurements", additional_text)  # [daz]
+
+		##############################################################
+
+		# List the correctness failures
+		######################## Correctness testing is currently turned off, so this section does not apply
+		######################## However, when it does apply, the pickle of the bad replies is now found in saved_response_dir / short_file_name
+		"""
+		if len(correctness_failures) > 0:
+			r_out("", f"\nThere were {len(correctness_failures)} correctness failures during the period:")
+			for (filename_record, target, internet, transport, failure_reason) in correctness_failures:
+				culled_reasons = []
+				this_source = pickle.loads(source_pickle)
+				r_out("", f"   {filename_record}: {target} {internet} {transport} for {this_source['question'][0]['name']}/{this_source['question'][0]['rdtype']}:")
+				# Get the reasons
+				for this_line in failure_reason.splitlines():
+					# If this is a . / SOA record, only put out the actual error, not the stuff indicating that we tested against other SOAs
+					if this_source["question"][0]["name"] == "." and this_source["question"][0]["rdtype"] == "SOA":
+						if this_line.startswith("Set of RRset value {'A.ROOT-SERVERS.NET. NSTLD.VERISIGN-GRS.COM.") or this_line.startswith("Correctness was first tested"):
+							continue
+					culled_reasons.append(this_line.strip())
+				for this_reason in culled_reasons:
+					r_out("", f"      {this_reason}")
 		else:
-			pass_fail_text = "Fail" if pair_response_latency_median > rss_response_latency_tcp_threshold else "Pass"
-		additional_text = f" -- {(statistics.mean(pair_latencies)):.3f} seconds mean"
-		r_out(f"  {report_pairs[this_pair]}: {pair_response_latency_median:.3f} median, {pass_fail_text}, {pair_count:>8,} measurements", additional_text)
+			r_out("", "\nThere were no correctness failures during the period.")
+		"""
+	
+		##############################################################
+
+		# Write out the report
+		with open(new_report_name, mode="wt") as f_out:
+			f_out.write("".join(report_main))
+			f_out.write(f"\n{'-'*80}\nThe following report has the calculations that support the pass/fail ratings.")
+			f_out.write(f"\nThese are not for public consumption.\n{'-'*80}\n")  #  [gkr]
+			f_out.write("".join(report_additional))
 	
-	# RSS correctness report
-	rss_correctness_threshold = 1  # [gfh]
-	r_out("\n\nRSS Correctness\nThreshold is 100%")  # [vpj]
-	pass_fail_text = "Fail" if rss_correctness_ratio < rss_correctness_threshold else "Pass"  # [udc]
-	additional_text = f" -- {rss_correctness_incorrect} incorrect"
-	r_out(f"   Entire RSS {(rss_correctness_ratio * 100):.6f}%, {pass_fail_text}, {rss_correctness_denominator:>8,} measurements", additional_text)  # [kea]
-
-	# RSS publication latency
-	rss_publication_latency_threshold = 35 * 60  # [zkl]
-	r_out(f"\n\nRSS Publication Latency\nThreshold is {rss_publication_latency_threshold} seconds")  # [tkw]
-	rss_publication_latency_median = statistics.median(rss_publication_latency_list)  # [zgb]
-	pass_fail_text = "Fail" if rss_publication_latency_median > rss_publication_latency_threshold else "Pass"
-	additional_text = f" -- {statistics.mean(rss_publication_latency_list):.3f} seconds mean"
-	r_out(f"   Entire RSS {rss_publication_latency_median} median, {pass_fail_text}, {len(rss_publication_latency_list):>8,} measurements", additional_text)  # [daz]
+		log(f"Finished report process, wrote out {new_report_name}")
 
 	##############################################################
 
-	# List the correctness failures
-	######################## Correctness testing is currently turned off, so this section does not apply
-	######################## However, when it does apply, the pickle of the bad replies is now found in saved_response_dir / short_file_name
-	"""
-	if len(correctness_failures) > 0:
-		r_out("", f"\nThere were {len(correctness_failures)} correctness failures during the period:")
-		for (filename_record, target, internet, transport, failure_reason) in correctness_failures:
-			culled_reasons = []
-			this_source = pickle.loads(source_pickle)
-			r_out("", f"   {filename_record}: {target} {internet} {transport} for {this_source['question'][0]['name']}/{this_source['question'][0]['rdtype']}:")
-			# Get the reasons
-			for this_line in failure_reason.splitlines():
-				# If this is a . / SOA record, only put out the actual error, not the stuff indicating that we tested against other SOAs
-				if this_source["question"][0]["name"] == "." and this_source["question"][0]["rdtype"] == "SOA":
-					if this_line.startswith("Set of RRset value {'A.ROOT-SERVERS.NET. NSTLD.VERISIGN-GRS.COM.") or this_line.startswith("Correctness was first tested"):
+	if opts.check_queries:
+		failed_count = check_report_queries()
+		if failed_count:
+			die(f"{failed_count} of the {len(report_queries)} report queries failed the query plan check; see {log_file_name}")
+		print(f"All {len(report_queries)} report queries passed the query plan check")
+		log("Finished query check")
+		exit()
+
+	if opts.backfill:
+		run_backfill(backfill_first_day, backfill_last_day)
+		log("Finished backfill")
+		exit()
+
+	with psycopg2.connect(dbname="metrics", user="metrics") as conn:
+		with conn.cursor() as cur:
+			prepare_report_queries(cur)
+		# The dates for the search are always passed as parameters
+		#   record_info is partitioned by month on date_derived, so this limits the queries to the partitions for the report period
+		report_range = (report_start_timestamp, report_end_timestamp)
+
+		if opts.from_records:
+			# Collate every metric from record_info in one pass, without using the rollup tables
+			#   The records are read through a named (server-side) cursor in date_derived order, so only itersize records are in memory at a time
+			#   Everything that is kept is bounded by the number of RSIs, pairs, SOAs, and VPs, not by the number of records:
+			#     the latencies go into sketches, and the RSS values for a VP and interval are folded in as soon as the next interval starts
+			correctness_failures = []
+			# soa_first_seen keys are SOAs, values are the date first seen from any RSI [yxn]
+			soa_first_seen = {}
+			# pair_first_seen keys are (RSI, SOA, pair), values are the date that RSI was first seen with that SOA on that pair [cnj]
+			pair_first_seen = {}
+			# interval_vp_pairs keys are (VP, pair) for the current interval, values are [ RSIs responding, count, list of latencies ]
+			interval_vp_pairs = {}
+			def fold_rss_interval():
+				# Add the RSS values for the interval that just ended into the totals [egb] [cvf] [bom]
+				for ((this_vp, this_pair), (this_answered, this_measured, these_latencies)) in interval_vp_pairs.items():
+					rss_availability[this_pair][0] += min(rss_k, this_answered)
+					rss_availability[this_pair][1] += rss_k
+					rss_availability[this_pair][2] += this_measured
+					latency_sketch.merge_sketch(rss_response_latency[this_pair][0], latency_sketch.make_sketch(sorted(these_latencies)[:rss_k]))  # [jbr]
+				interval_vp_pairs.clear()
+			current_interval = None
+			with conn.cursor(name="report_records") as cur:
+				cur.itersize = 20000
+				cur.execute("select filename_record, target, internet, transport, query_elapsed, timeout, soa_found, date_derived, record_type, " +
+					"is_correct, failure_reason from record_info where record_type in ('S', 'C') and date_derived between %s and %s order by date_derived", report_range)
+				for (this_filename_record, this_rsi, this_internet, this_transport, this_query_elapsed, this_timeout, this_soa, this_date_time,
+					this_record_type, this_is_correct, this_failure_reason) in cur:
+					if not this_rsi in rsi_list:
 						continue
-				culled_reasons.append(this_line.strip())
-			for this_reason in culled_reasons:
-				r_out("", f"      {this_reason}")
-	else:
-		r_out("", "\nThere were no correctness failures during the period.")
-	"""
-	
-	##############################################################
+					# RSI correctness collation [ebg]
+					if this_record_type == "C":
+						if not this_is_correct == "n":
+							rsi_correctness[this_rsi][0] += 1
+						else:
+							correctness_failures.append((this_filename_record, this_rsi, this_internet, this_transport, this_failure_reason))
+						rsi_correctness[this_rsi][1] += 1
+						continue
+					if not this_date_time == current_interval:
+						fold_rss_interval()
+						current_interval = this_date_time
+					int_trans_pair = f"{this_internet}{this_transport}"
+					(_, this_vp, _) = this_filename_record.split("-")
+					this_vp_pair = interval_vp_pairs.setdefault((this_vp, int_trans_pair), [ 0, 0, [] ])
+					this_vp_pair[1] += 1
+					# RSI availability [gfa]
+					rsi_availability[this_rsi][int_trans_pair][1] += 1
+					if this_soa and (not this_soa in soa_first_seen):
+						soa_first_seen[this_soa] = this_date_time
+					# Timed-out responses don't count for anything else [vpa] [tub]
+					if this_timeout:
+						continue
+					rsi_availability[this_rsi][int_trans_pair][0] += 1
+					this_vp_pair[0] += 1
+					# RSI response latency [fhw]
+					latency_sketch.add_latency(rsi_response_latency[this_rsi][int_trans_pair][0], this_query_elapsed)
+					rsi_response_latency[this_rsi][int_trans_pair][1] += 1
+					rss_response_latency[int_trans_pair][1] += 1
+					if this_query_elapsed > 0.001:
+						this_vp_pair[2].append(this_query_elapsed)
+					if this_soa and (not (this_rsi, this_soa, int_trans_pair) in pair_first_seen):
+						pair_first_seen[(this_rsi, this_soa, int_trans_pair)] = this_date_time
+			fold_rss_interval()
+			# RSI and RSS publication latency collation [yxn]
+			(rsi_publication_latency, rss_publication_latency) = publication_latencies(soa_first_seen, pair_first_seen)
+
+		elif opts.columnar:
+			# Collate the metrics from the S records of record_info held as typed NumPy column arrays, one element per record
+			#   This gives full-precision medians, like --from_records, but each metric is a few vectorized group operations over the columns
+			#   The columns are: RSI, pair, and VP as small integer codes, the interval as seconds since the report start, elapsed as float32,
+			#   a timeout flag, and the SOA serial as uint32 (0 for no SOA)
+			try:
+				import numpy
+			except Exception as e:
+				die(f"--columnar needs NumPy: {e}")
+			pair_list = sorted(report_pairs)
+			rsi_codes = { this_rsi: this_index for (this_index, this_rsi) in enumerate(rsi_list) }
+			pair_codes = { this_pair: this_index for (this_index, this_pair) in enumerate(pair_list) }
+			vp_codes = {}
+			column_chunks = { "rsi": [], "pair": [], "vp": [], "interval": [], "elapsed": [], "timeout": [], "soa": [] }
+			with conn.cursor(name="report_columns") as cur:
+				cur.itersize = 100000
+				cur.execute("select target, internet || transport, split_part(filename_record, '-', 2), " +
+					"extract(epoch from date_derived - %s::timestamp)::int, query_elapsed, timeout <> '', " +
+					"coalesce(nullif(soa_found, '')::bigint, 0) from record_info where record_type = 'S' and date_derived between %s and %s",
+					(report_start_timestamp, ) + report_range)
+				while True:
+					# Stop only when the fetch itself is empty; a chunk can have only targets that are not RSIs, and later chunks still need to be read
+					fetched_rows = cur.fetchmany(cur.itersize)
+					if not fetched_rows:
+						break
+					these_rows = [ x for x in fetched_rows if x[0] in rsi_codes ]
+					if not these_rows:
+						continue
+					(these_rsis, these_pairs, these_vps, these_intervals, these_elapsed, these_timeouts, these_soas) = zip(*these_rows)
+					column_chunks["rsi"].append(numpy.array([ rsi_codes[x] for x in these_rsis ], dtype=numpy.uint8))
+					column_chunks["pair"].append(numpy.array([ pair_codes[x] for x in these_pairs ], dtype=numpy.uint8))
+					column_chunks["vp"].append(numpy.array([ vp_codes.setdefault(x, len(vp_codes)) for x in these_vps ], dtype=numpy.uint16))
+					column_chunks["interval"].append(numpy.array(these_intervals, dtype=numpy.int32))
+					column_chunks["elapsed"].append(numpy.array(these_elapsed, dtype=numpy.float32))
+					column_chunks["timeout"].append(numpy.array(these_timeouts, dtype=bool))
+					column_chunks["soa"].append(numpy.array(these_soas, dtype=numpy.uint32))
+			if not column_chunks["rsi"]:
+				die(f"There were no SOA records for {report_start_timestamp} to {report_end_timestamp}")
+			columns = { this_name: numpy.concatenate(these_chunks) for (this_name, these_chunks) in column_chunks.items() }
+			column_chunks = None
+			answered = ~columns["timeout"]
+
+			# RSI availability [gfa] and RSI response latency [fhw] collation, grouped by RSI and pair
+			rsi_pair = columns["rsi"].astype(numpy.int64) * len(pair_list) + columns["pair"]
+			rsi_pair_count = len(rsi_list) * len(pair_list)
+			measured_counts = numpy.bincount(rsi_pair, minlength=rsi_pair_count)
+			answered_counts = numpy.bincount(rsi_pair[answered], minlength=rsi_pair_count)
+			# Sort the non-timed-out latencies [vpa] by group and then by latency, so each group is one slice of sorted_latencies
+			latency_order = numpy.lexsort((columns["elapsed"][answered], rsi_pair[answered]))
+			sorted_latencies = columns["elapsed"][answered][latency_order]
+			group_edges = numpy.searchsorted(rsi_pair[answered][latency_order], numpy.arange(rsi_pair_count + 1))
+			for (this_rsi, this_rsi_code) in rsi_codes.items():
+				for (this_pair, this_pair_code) in pair_codes.items():
+					this_group = this_rsi_code * len(pair_list) + this_pair_code
+					these_latencies = sorted_latencies[group_edges[this_group]:group_edges[this_group + 1]]
+					rsi_availability[this_rsi][this_pair] = [ int(answered_counts[this_group]), int(measured_counts[this_group]) ]
+					rsi_response_latency[this_rsi][this_pair] = [ float(numpy.median(these_latencies)) if len(these_latencies) else None, len(these_latencies) ]
+
+			# RSS availability collation, grouped by VP, interval, and pair [egb] [cvf]
+			vp_interval_pair = (columns["vp"].astype(numpy.int64) * (int(columns["interval"].max()) + 1) + columns["interval"]) * len(pair_list) + columns["pair"]
+			(group_keys, group_inverse) = numpy.unique(vp_interval_pair, return_inverse=True)
+			group_answered = numpy.bincount(group_inverse, weights=answered, minlength=len(group_keys))
+			group_measured = numpy.bincount(group_inverse, minlength=len(group_keys))
+			group_pairs = group_keys % len(pair_list)
+			for (this_pair, this_pair_code) in pair_codes.items():
+				this_mask = group_pairs == this_pair_code
+				rss_availability[this_pair] = [ int(numpy.minimum(group_answered[this_mask], rss_k).sum()), int(this_mask.sum()) * rss_k, int(group_measured[this_mask].sum()) ]
+
+			# RSS response latency collation: the lowest k latencies in each VP, interval, and pair group [spx] [bom]
+			#   After sorting by group and then latency, the rank of a latency in its group is its position minus the position of the start of the group
+			candidates = answered & (columns["elapsed"] > 0.001)
+			candidate_order = numpy.lexsort((columns["elapsed"][candidates], vp_interval_pair[candidates]))
+			candidate_keys = vp_interval_pair[candidates][candidate_order]
+			candidate_latencies = columns["elapsed"][candidates][candidate_order]
+			candidate_ranks = numpy.arange(len(candidate_keys)) - numpy.searchsorted(candidate_keys, candidate_keys, side="left")
+			lowest_k = candidate_ranks < rss_k
+			lowest_k_pairs = candidate_keys[lowest_k] % len(pair_list)
+			lowest_k_latencies = candidate_latencies[lowest_k]
+			for (this_pair, this_pair_code) in pair_codes.items():
+				these_latencies = lowest_k_latencies[lowest_k_pairs == this_pair_code]
+				# The RSS measurement count is all the RSI latencies, not just the lowest k
+				this_count = sum(rsi_response_latency[this_rsi][this_pair][1] for this_rsi in rsi_list)
+				if len(these_latencies):
+					rss_response_latency[this_pair] = [ float(numpy.median(these_latencies)), float(these_latencies.mean()), this_count ]  # [jbr]
+				else:
+					rss_response_latency[this_pair] = [ None, None, this_count ]
+
+			# RSI and RSS publication latency collation [yxn], the same way as publication_latencies()
+			#   soa_first is the first interval in which each SOA was seen from any RSI
+			#   rsi_soa_pair_first is the first interval in which each RSI was seen with each SOA on each pair; timed-out responses don't count [tub] [cnj]
+			no_interval = numpy.iinfo(numpy.int32).max
+			has_soa = columns["soa"] > 0
+			(soa_values, soa_inverse) = numpy.unique(columns["soa"], return_inverse=True)
+			soa_first = numpy.full(len(soa_values), no_interval, dtype=numpy.int64)
+			numpy.minimum.at(soa_first, soa_inverse[has_soa], columns["interval"][has_soa])
+			seen = has_soa & answered
+			rsi_soa_pair = (soa_inverse[seen].astype(numpy.int64) * len(rsi_list) + columns["rsi"][seen]) * len(pair_list) + columns["pair"][seen]
+			(rsi_soa_pair_keys, rsi_soa_pair_inverse) = numpy.unique(rsi_soa_pair, return_inverse=True)
+			rsi_soa_pair_first = numpy.full(len(rsi_soa_pair_keys), no_interval, dtype=numpy.int64)
+			numpy.minimum.at(rsi_soa_pair_first, rsi_soa_pair_inverse, columns["interval"][seen])
+			# Then for each RSI and SOA, the latency is from soa_first to the last of its pair times, if it was seen on every pair [jtz]
+			(rsi_soa_keys, rsi_soa_inverse) = numpy.unique(rsi_soa_pair_keys // len(pair_list), return_inverse=True)
+			rsi_soa_last = numpy.zeros(len(rsi_soa_keys), dtype=numpy.int64)
+			numpy.maximum.at(rsi_soa_last, rsi_soa_inverse, rsi_soa_pair_first)
+			complete = numpy.bincount(rsi_soa_inverse, minlength=len(rsi_soa_keys)) == len(pair_list)
+			rsi_soa_latencies = (rsi_soa_last - soa_first[rsi_soa_keys // len(rsi_list)])[complete]
+			rsi_soa_rsis = (rsi_soa_keys % len(rsi_list))[complete]
+			for (this_rsi, this_rsi_code) in rsi_codes.items():
+				these_latencies = rsi_soa_latencies[rsi_soa_rsis == this_rsi_code]
+				if len(these_latencies):
+					rsi_publication_latency[this_rsi] = [ float(numpy.median(these_latencies)), len(these_latencies) ]  # [yzp] [kvg] [udz]
+			if len(rsi_soa_latencies):
+				rss_publication_latency = [ float(numpy.median(rsi_soa_latencies)), float(rsi_soa_latencies.mean()), len(rsi_soa_latencies) ]  # [dbo]
 
-	# Write out the report
-	with open(new_report_name, mode="wt") as f_out:
-		f_out.write("".join(report_main))
-		f_out.write(f"\n{'-'*80}\nThe following report has the calculations that support the pass/fail ratings.")
-		f_out.write(f"\nThese are not for public consumption.\n{'-'*80}\n")  #  [gkr]
-		f_out.write("".join(report_additional))
-	
-	log(f"Finished report process, wrote out {new_report_name}")	
+		else:
+			# Collate from the rollup tables one day at a time, merging whole days from the daily cache when their data has not changed
+			#   Only the days with new files, and the partial days at the ends of a weekly report, are collated again
+			report_start_datetime = datetime.datetime.strptime(report_start_timestamp, strf_timestamp_format)
+			report_end_datetime = datetime.datetime.strptime(report_end_timestamp, strf_timestamp_format)
+			report_partial = new_partial()
+			(cache_hits, cache_misses) = (0, 0)
+			with conn.cursor() as cur:
+				# Get the number of files, the latest processed_at, and the latest rollup rebuild for each day, to tell whether a cached day is still current
+				files_by_day = get_files_by_day(cur, report_start_datetime, report_end_datetime)
+				for (piece_start, piece_end, is_whole_day) in split_into_days(report_start_datetime, report_end_datetime):
+					if is_whole_day:
+						(this_partial, from_cache) = get_day_partial(cur, piece_start, files_by_day[piece_start.strftime("%Y%m%d")])
+						if from_cache:
+							cache_hits += 1
+						else:
+							cache_misses += 1
+					else:
+						this_partial = collate_partial(cur, piece_start.strftime(strf_timestamp_format), piece_end.strftime(strf_timestamp_format))
+					merge_partial(report_partial, this_partial)
+				# RSI and RSS publication latency collation [yxn]
+				(rsi_publication_latency, rss_publication_latency) = collate_publication_latency(cur, report_start_timestamp, report_end_timestamp)
+			log(f"Used {cache_hits} days from the daily cache and collated {cache_misses} days again")
+			rsi_availability = report_partial["rsi_availability"]
+			rsi_response_latency = report_partial["rsi_response_latency"]
+			rss_availability = report_partial["rss_availability"]
+			rss_response_latency = report_partial["rss_response_latency"]
+
+		# --from_records does the correctness collation in its single pass
+		if not opts.from_records:
+			with conn.cursor() as cur:
+				(rsi_correctness, correctness_failures) = collate_correctness(cur, report_start_timestamp, report_end_timestamp)
+
+		if opts.rss_hourly:
+			with conn.cursor() as cur:
+				write_rss_hourly(cur, new_report_name, report_start_timestamp, report_end_timestamp)
+
+	# Reduce the latency sketches to medians and means; --columnar has already computed these from the full-precision latencies
+	if not opts.columnar:
+		reduce_latency_sketches(rsi_response_latency, rss_response_latency)
+
+	write_report(new_report_name, report_start_timestamp, report_end_timestamp, rsi_availability, rsi_response_latency, rsi_correctness, rsi_publication_latency,
+		rss_availability, rss_response_latency, rss_publication_latency, correctness_failures)
 	exit()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+''' Canonical index of a root zone for correctness checking, shared by get_root_zone.py and collector_processing.py '''
+# Three-letter items in square brackets (such as [xyz]) refer to parts of rssac-047.md
+
+# The [vnk] check compares each RRset in a response with the RRset of the same name and type in the root zone
+#   Both sides need to be put in the same form first: DNSKEY keys without spaces, AAAA addresses in their shortest form, and everything else uppercased
+#   The index has the root side already in that form as frozensets, so correctness checking only needs to change the response side
+# The index is a dict with:
+#   "rrsets": name/type (as in the matching pickle) to a frozenset of the canonical rdata
+#   "digests": name/type to the SHA-256 (as hex) of the sorted canonical rdata, so RRsets can be compared between zones without the sets
+#   "nsec_keys": the canonical name keys of the owners of all the NSEC records, sorted in the canonical DNS name order of RFC 4034, for use with bisect
+#   "nsec_records": (owner, next domain name) for each NSEC record, in the same order as nsec_keys
+
+import bisect, hashlib
+import dns.ipv6, dns.name
+
+def canonical_rdata(this_key, this_rdata):
+	# Returns the canonical form of one rdata of the RRset with the name/type this_key
+	#   It is OK to uppercase any type that is not displayed as Base64; RRSIG is not checked [ygx], and DNSKEY is not uppercased
+	if this_key.endswith("/DNSKEY"):
+		(d_flags, d_prot, d_alg, d_key) = this_rdata.split(" ", maxsplit=3)
+		return f"{d_flags} {d_prot} {d_alg} {d_key.replace(' ', '')}"
+	elif this_key.endswith("/AAAA"):
+		return dns.ipv6.inet_ntoa(dns.ipv6.inet_aton(this_rdata))
+	else:
+		return this_rdata.upper()
+
+def canonical_rrset(this_key, these_rdatas):
+	# Returns a frozenset of the canonical form of all the rdata in an RRset
+	return frozenset(canonical_rdata(this_key, this_rdata) for this_rdata in these_rdatas)
+
+def rrset_digest(this_canonical_rrset):
+	# Returns the SHA-256 as hex of a canonical RRset; the same RRset always has the same digest, whatever the order of its rdata
+	return hashlib.sha256("\n".join(sorted(this_canonical_rrset)).encode("utf-8")).hexdigest()
+
+def canonical_name_key(this_name):
+	# Returns a key for a domain name that sorts in the canonical DNS name order of RFC 4034 Section 6.1
+	#   Names are compared by label from the right, each label as lowercase octets, and a name sorts before the names below it, so "." is first
+	return tuple(this_label.lower() for this_label in reversed(dns.name.from_text(this_name).labels))
+
+def make_root_index(root_name_and_types):
+	# Returns the index for a root zone from its dict of name/type to a set of rdata, which is what is in the matching pickle
+	these_rrsets = { this_key: canonical_rrset(this_key, these_rdatas) for (this_key, these_rdatas) in root_name_and_types.items() }
+	nsec_chain = []
+	for (this_key, these_rdatas) in root_name_and_types.items():
+		if this_key.endswith("/NSEC"):
+			this_owner = this_key[:-len("/NSEC")]
+			(next_name, _) = list(these_rdatas)[0].split(" ", maxsplit=1)  # Ignore the type_bit_map
+			nsec_chain.append((canonical_name_key(this_owner), this_owner, next_name))
+	nsec_chain.sort()
+	return { "rrsets": these_rrsets, "digests": { this_key: rrset_digest(this_rrset) for (this_key, this_rrset) in these_rrsets.items() },
+		"nsec_keys": [ this_nsec[0] for this_nsec in nsec_chain ], "nsec_records": [ (this_nsec[1], this_nsec[2]) for this_nsec in nsec_chain ] }
+
+def covering_nsec_owner(root_index, this_name):
+	# Returns the owner of the NSEC record in the root zone that covers this_name, or None if this_name is itself an owner (so it exists in the zone)
+	#   This is the last owner that sorts before this_name; the NSEC for "." is first in the chain, so there always is one
+	this_position = bisect.bisect_right(root_index["nsec_keys"], canonical_name_key(this_name)) - 1
+	if this_position < 0 or root_index["nsec_keys"][this_position] == canonical_name_key(this_name):
+		return None
+	return root_index["nsec_records"][this_position][0]
+
+def nsec_covers(owner_name, next_name, this_name):
+	# Returns True if an NSEC record with owner_name and next_name covers this_name in canonical order
+	#   The last NSEC record in the zone has "." as its next name, so it covers every name after its owner
+	(owner_key, next_key, this_key) = (canonical_name_key(owner_name), canonical_name_key(next_name), canonical_name_key(this_name))
+	if next_key <= owner_key:
+		return owner_key < this_key
+	return owner_key < this_key < next_key